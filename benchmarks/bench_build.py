@@ -0,0 +1,37 @@
+"""
+Measures how the dataset build scales with the number of worker processes, and checks that every run produces
+exactly the rows of the serial run.
+
+    python benchmarks/bench_build.py --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from layton_eval.constants import ROOT_DIR  # noqa: E402
+from layton_eval.scrape_htmls import build_rows  # noqa: E402
+from layton_eval.storage import open_store  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=f"{ROOT_DIR}/layton-data")
+    parser.add_argument("--storage", choices=["files", "pack"], default="files")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument("--chunksize", type=int, default=32)
+    args = parser.parse_args()
+    puzzle_names = sorted(open_store("htmls", args.storage, args.data_dir).names())
+    serial_rows, serial_time = None, None
+    for workers in args.workers:
+        start = time.perf_counter()
+        rows = list(build_rows(puzzle_names, args.storage, args.data_dir, workers=workers, chunksize=args.chunksize))
+        elapsed = time.perf_counter() - start
+        if serial_rows is None:
+            serial_rows, serial_time = rows, elapsed
+        print(
+            f"workers={workers:>3}  {len(puzzle_names) / elapsed:8.1f} puzzles/s  x{serial_time / elapsed:.2f}"
+            f"  identical={rows == serial_rows}"
+        )
@@ -0,0 +1,67 @@
+"""
+Measures the cold start of every subcommand of the layton-eval command, each run in a fresh interpreter: the time
+to print its help, which only loads the command line, and the time to load the module running it, which is what
+the subcommand pays before doing any work, with the heavy packages loaded by each. Loading every module at once,
+as a command importing them all at the top would, is given for comparison:
+
+    python benchmarks/bench_cli.py --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import typing as t
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+from layton_eval.cli import COMMANDS  # noqa: E402
+
+HEAVY = ("numpy", "pandas", "pyarrow", "PIL", "bs4", "requests", "xlsxwriter", "langchain_core", "openai")
+REPORT_HEAVY = f"print('loaded:', *(name for name in {HEAVY!r} if name in sys.modules))"
+
+
+def run(code: str) -> t.Tuple[float, str]:
+    """
+    Runs `code` in a new interpreter, returns its wall time and its output.
+    """
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code],
+        env={**os.environ, "PYTHONPATH": str(SRC)},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return time.perf_counter() - start, output
+
+
+def cold_start(code: str, repeat: int) -> t.Tuple[float, str]:
+    """
+    Median wall time of `code` over `repeat` runs, and the heavy packages it loaded.
+    """
+    runs = [run(f"{code}\nimport sys\n{REPORT_HEAVY}") for _ in range(repeat)]
+    loaded = runs[-1][1].rpartition("loaded:")[2].split()
+    return statistics.median(elapsed for elapsed, _ in runs), " ".join(loaded) or "-"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the median is reported")
+    args = parser.parse_args()
+    python, _ = cold_start("pass", args.repeat)
+    print(f"{'python startup':<18}{python:7.3f}s")
+    print(f"{'command':<18}{'--help':>8}  {'loads':<26}{'module':>8}  loads")
+    for command, (module, _, _) in COMMANDS.items():
+        help_time, help_heavy = cold_start(
+            f"from layton_eval.cli import main\ntry:\n    main([{command!r}, '--help'])\nexcept SystemExit:\n    pass",
+            args.repeat,
+        )
+        module_time, module_heavy = cold_start(f"import {module}", args.repeat)
+        print(f"{command:<18}{help_time:7.3f}s  {help_heavy:<26}{module_time:7.3f}s  {module_heavy}")
+    modules = sorted({module for module, _, _ in COMMANDS.values()})
+    eager, eager_heavy = cold_start("\n".join(f"import {module}" for module in modules), args.repeat)
+    print(f"{'all modules':<18}{'':8}  {'':<26}{eager:7.3f}s  {eager_heavy}")
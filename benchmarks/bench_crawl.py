@@ -0,0 +1,35 @@
+"""
+Measures the crawler throughput against the local corpus server for several concurrency levels:
+
+    python benchmarks/bench_crawl.py --workers 1 4 16 --latency 0.05
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from corpus_server import serve_corpus  # noqa: E402
+from layton_eval.constants import ROOT_DIR  # noqa: E402
+from layton_eval.crawler import Crawler  # noqa: E402
+from layton_eval.get_eng_html import get_page_image_links, get_riddle_urls  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=f"{ROOT_DIR}/layton-data")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve_corpus(args.data_dir, latency=args.latency, error_rate=args.error_rate)
+    try:
+        for workers in args.workers:
+            crawler = Crawler(max_workers=workers, requests_per_second=0, backoff_factor=0.01, base_url=server.base_url)
+            start = time.perf_counter()
+            urls = get_riddle_urls(crawler)
+            pages = sum(page.status == 200 for page in crawler.crawl(urls, get_page_image_links))
+            elapsed = time.perf_counter() - start
+            print(f"workers={workers:>3}  pages={pages}  {elapsed:.2f}s  {pages / elapsed:.1f} pages/s")
+    finally:
+        server.shutdown()
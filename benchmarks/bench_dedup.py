@@ -0,0 +1,109 @@
+"""
+Times the near-duplicate index on synthetic puzzles with variants, as remakes and regional versions are: the same
+text with a few words respelled, with other case and punctuation. Some variants change a number of the puzzle, and
+must stay apart. Reports how many of the variants at least as similar as
+the threshold to the first version of their puzzle are found (recall), how many clustered puzzles are versions of
+the puzzle of their representative (precision), and compares with exact all-pairs Jaccard similarity on the first puzzles:
+
+    python benchmarks/bench_dedup.py --puzzles 1000 4000 16000
+"""
+import argparse
+import random
+import sys
+import time
+from itertools import combinations
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from layton_eval.dedup import NUMBER, NearDuplicateIndex, shingles  # noqa: E402
+
+
+def syllable_word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfglmnprstv") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+
+def make_puzzles(count: int, variant_rate: float, rng: random.Random) -> tuple:
+    """
+    Returns the puzzle names, their texts, and the puzzle each one is a version of.
+    """
+    vocabulary = [syllable_word(rng) for _ in range(5000)]
+    names, texts, origins = [], [], []
+    while len(names) < count:
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(40, 120))]
+        for position in rng.sample(range(len(words)), 3):
+            words[position] = str(rng.randrange(2, 100))
+        name = f"Puzzle{len(names):06d}"
+        names.append(name)
+        texts.append(" ".join(words) + ".")
+        origins.append(name)
+        while rng.random() < variant_rate and len(names) < count:
+            variant = list(words)
+            origin = name
+            if rng.random() < 0.1:  # A different puzzle, with another number.
+                position = next(i for i, word in enumerate(variant) if word.isdigit())
+                variant[position] = str(int(variant[position]) + 1)
+                origin = f"{name}+1"
+            for position in rng.sample(range(len(variant)), 2):
+                if not variant[position].isdigit():
+                    variant[position] = rng.choice(vocabulary)
+            text = " ".join(variant)
+            names.append(f"Puzzle{len(names):06d}")
+            texts.append((text.upper() if rng.random() < 0.2 else text.capitalize()) + rng.choice(["", ".", "!"]))
+            origins.append(origin)
+    return names, texts, origins
+
+
+def jaccard(first: str, second: str) -> float:
+    first, second = shingles(first), shingles(second)
+    return len(first & second) / len(first | second)
+
+
+def brute_force(texts: list, threshold: float) -> int:
+    """
+    Number of pairs of texts whose exact Jaccard similarity reaches `threshold`, comparing every pair.
+    """
+    sets = [(shingles(text), NUMBER.findall(text)) for text in texts]
+    return sum(
+        len(a & b) >= threshold * len(a | b) and numbers_a == numbers_b
+        for (a, numbers_a), (b, numbers_b) in combinations(sets, 2)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puzzles", type=int, nargs="+", default=[1000, 4000, 16000])
+    parser.add_argument("--variant-rate", type=float, default=0.4, help="probability for a puzzle to get a variant")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--brute-force", type=int, default=1500, help="puzzles compared pair by pair")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for count in args.puzzles:
+        names, texts, origins = make_puzzles(count, args.variant_rate, random.Random(args.seed))
+        origin = dict(zip(names, origins))
+        start = time.perf_counter()
+        index = NearDuplicateIndex(threshold=args.threshold)
+        for name, text in zip(names, texts):
+            index.add(name, text)
+        elapsed = time.perf_counter() - start
+        duplicates = index.duplicates()
+        first = {}
+        for name, text in zip(names, texts):
+            first.setdefault(origin[name], text)
+        expected = {
+            name
+            for name, text in zip(names, texts)
+            if first[origin[name]] != text and jaccard(first[origin[name]], text) >= args.threshold
+        }
+        correct = {name for name, representative in duplicates.items() if origin[name] == origin[representative]}
+        print(
+            f"{count:>7} puzzles  {elapsed:7.3f}s  {count / elapsed:8.0f} puzzles/s  {len(duplicates):>6} skipped"
+            f"  recall={len(correct & expected) / max(len(expected), 1):.3f}"
+            f"  precision={len(correct) / max(len(duplicates), 1):.3f}"
+        )
+    if args.brute_force:
+        names, texts, _ = make_puzzles(args.brute_force, args.variant_rate, random.Random(args.seed))
+        start = time.perf_counter()
+        pairs = brute_force(texts, args.threshold)
+        elapsed = time.perf_counter() - start
+        print(f"all pairs of {args.brute_force} puzzles: {elapsed:.3f}s, {pairs} similar pairs")
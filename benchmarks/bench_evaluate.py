@@ -0,0 +1,75 @@
+"""
+Times the answer scoring on synthetic puzzles and responses, written with the variations the normalization folds
+(case, punctuation, whitespace, number words), and checks that the batch scoring agrees with `is_correct`:
+
+    python benchmarks/bench_evaluate.py --puzzles 1000 --models 20
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from layton_eval.evaluate import AnswerIndex, accuracy_tables, normalize_answer, score_responses  # noqa: E402
+
+NUMBER_WORDS = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven"]
+
+
+def variant(answer: str, rng: random.Random) -> str:
+    """
+    Respells an answer the way a model could.
+    """
+    words = [NUMBER_WORDS[int(word)] if word.isdigit() and rng.random() < 0.5 else word for word in answer.split()]
+    text = "  ".join(words) if rng.random() < 0.3 else " ".join(words)
+    text = text.upper() if rng.random() < 0.3 else text.capitalize()
+    return text + rng.choice(["", ".", "!", " ?"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puzzles", type=int, default=1000)
+    parser.add_argument("--models", type=int, default=20)
+    parser.add_argument("--spellings", type=int, default=8, help="accepted answers per puzzle")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    categories = ["Arrange", "Write Answer", "Multiple Choice", "Matchstick", "Sliding", "Circle Answer"]
+    answers = {
+        f"Puzzle{i:04d}": [f"{rng.randrange(12)} {rng.choice(['boxes', 'coins', 'cats'])}"]
+        + [f"option {j} of {i}" for j in range(args.spellings - 1)]
+        for i in range(args.puzzles)
+    }
+    dataset = pd.DataFrame(
+        {
+            "puzzle_name": list(answers),
+            "category": [rng.choice(categories) for _ in answers],
+            "picarats": pd.array([rng.randrange(10, 100) for _ in answers], dtype="Int32"),
+        }
+    )
+    records = []
+    for model in range(args.models):
+        for puzzle_name, spellings in answers.items():
+            response = variant(spellings[0], rng) if rng.random() < 0.6 else f"I think {rng.randrange(99)} cats"
+            records.append({"puzzle_name": puzzle_name, "model": f"model-{model}", "answer": response})
+    responses = pd.DataFrame(records)
+
+    start = time.perf_counter()
+    index = AnswerIndex(answers)
+    print(f"index     {time.perf_counter() - start:7.3f}s  {len(index.pairs)} answers of {len(index)} puzzles")
+    for match in ("exact", "contains"):
+        normalize_answer.cache_clear()
+        start = time.perf_counter()
+        scored = score_responses(index, responses, match)
+        elapsed = time.perf_counter() - start
+        expected = [index.is_correct(p, a, match) for p, a in zip(responses["puzzle_name"], responses["answer"])]
+        print(
+            f"{match:<9} {elapsed:7.3f}s  {len(responses) / elapsed:10.0f} responses/s"
+            f"  accuracy={scored['correct'].mean():.3f}  agrees={scored['correct'].tolist() == expected}"
+        )
+    start = time.perf_counter()
+    tables = accuracy_tables(scored, dataset)
+    print(f"tables    {time.perf_counter() - start:7.3f}s  " + ", ".join(f"{k}: {v.shape}" for k, v in tables.items()))
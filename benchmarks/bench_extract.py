@@ -0,0 +1,86 @@
+"""
+Compares the single-pass extractor with the previous per-field extractors on the saved corpus: checks that every
+field is identical and reports the extraction time per page.
+
+    python benchmarks/bench_extract.py --storage pack --limit 500
+"""
+import argparse
+import sys
+import time
+import typing as t
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import legacy_extract as legacy  # noqa: E402
+from layton_eval.constants import ROOT_DIR  # noqa: E402
+from layton_eval.extractor import PuzzleIndex, type2color  # noqa: E402
+from layton_eval.storage import open_store  # noqa: E402
+
+
+def outcome(getter: t.Callable[[], t.Any]) -> t.Tuple[type, str]:
+    """
+    Returns a comparable view of a field: descriptions are Tags when the puzzle has inline images, and some
+    malformed pages make the extractors raise, which must happen for both implementations.
+    """
+    try:
+        value = getter()
+    except Exception as e:
+        return type(e), ""
+    return type(value), str(value)
+
+
+def legacy_fields(soup: BeautifulSoup) -> dict:
+    fields = {
+        "puzzle_id": lambda: legacy.get_puzzle_id(soup),
+        "category": lambda: legacy.get_puzzle_category(soup),
+        "picarats": lambda: legacy.get_puzzle_picarats(soup),
+        "description": lambda: legacy.get_puzzle_description(soup),
+        "solution": lambda: legacy.get_puzzle_solution(soup),
+    }
+    for hint_type in type2color:
+        fields[f"hint_{hint_type}"] = lambda hint_type=hint_type: legacy.get_puzzle_hint(soup, hint_type)
+    return {name: outcome(getter) for name, getter in fields.items()}
+
+
+def single_pass_fields(soup: BeautifulSoup) -> dict:
+    index = PuzzleIndex(soup)
+    fields = {
+        "puzzle_id": index.puzzle_id,
+        "category": index.category,
+        "picarats": index.picarats,
+        "description": index.description,
+        "solution": index.solution,
+    }
+    for hint_type in type2color:
+        fields[f"hint_{hint_type}"] = lambda hint_type=hint_type: index.hint(hint_type)
+    return {name: outcome(getter) for name, getter in fields.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=f"{ROOT_DIR}/layton-data")
+    parser.add_argument("--storage", choices=["files", "pack"], default="files")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+    store = open_store("htmls", args.storage, args.data_dir)
+    names = sorted(store.names())[: args.limit]
+    legacy_time, single_pass_time, mismatches = 0.0, 0.0, []
+    for name in names:
+        soup = BeautifulSoup(store.get(name), "html.parser")
+        start = time.perf_counter()
+        expected = legacy_fields(soup)
+        legacy_time += time.perf_counter() - start
+        start = time.perf_counter()
+        fields = single_pass_fields(soup)
+        single_pass_time += time.perf_counter() - start
+        if fields != expected:
+            mismatches.append(name)
+    print(f"pages:        {len(names)}")
+    print(f"legacy:       {1000 * legacy_time / len(names):.2f} ms/page")
+    print(f"single pass:  {1000 * single_pass_time / len(names):.2f} ms/page")
+    print(f"speedup:      x{legacy_time / single_pass_time:.1f}")
+    print(f"mismatches:   {len(mismatches)} {mismatches[:10]}")
+    sys.exit(1 if mismatches else 0)
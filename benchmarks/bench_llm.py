@@ -0,0 +1,81 @@
+"""
+Compares serial `Chatbot.ask` calls, `Chatbot.ask_batch` and packed `Chatbot.ask_packed` requests against the local
+fake LLM server, in riddles per second and tokens per riddle:
+
+    python benchmarks/bench_llm.py --provider together --riddles 64 --latency 0.2 --concurrency 1 8 32
+    python benchmarks/bench_llm.py --concurrency 8 --pack-sizes 4 16 --drop-rate 0.05
+"""
+import argparse
+import os
+import sys
+import time
+import typing as t
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from layton_eval.chatbot import BatchResult, Chatbot  # noqa: E402
+from llm_server import serve_llm  # noqa: E402
+
+
+def report(label: str, chatbot: Chatbot, results: t.List[BatchResult], elapsed: float, max_in_flight: int) -> None:
+    errors = sum(result.error is not None for result in results)
+    usage = chatbot.usage
+    print(
+        f"{label:<18}{elapsed:>7.2f}s{len(results) / elapsed:>11.1f}{usage.requests:>10}"
+        f"{usage.tokens_per_riddle:>14.0f}{errors:>8}{max_in_flight:>10}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", choices=["openai", "together"], default="openai")
+    parser.add_argument(
+        "--task", choices=["input_structuration", "answer_structuration"], default="input_structuration"
+    )
+    parser.add_argument("--riddles", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--pack-sizes", type=int, nargs="*", default=[], help="also run packed batches of that size")
+    parser.add_argument("--rpm", type=int, default=None, help="requests-per-minute budget of the batches")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of riddles left out of packed outputs")
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TOGETHER_API_KEY", "fake")
+    server = serve_llm(latency=args.latency, error_rate=args.error_rate, drop_rate=args.drop_rate)
+    base_url = f"{server.base_url}/v1" if args.provider == "openai" else f"{server.base_url}/inference"
+
+    def make_chatbot() -> Chatbot:
+        chatbot = Chatbot(provider=args.provider, owner="mistralai", task=args.task, base_url=base_url)
+        chatbot.verbose = False
+        return chatbot
+
+    riddles = [f"Riddle number {i}: how many squares are there?" for i in range(args.riddles)]
+    answers = [f"There are {i} squares." for i in range(args.riddles)]
+    print(f"{'':<18}{'time':>8}{'riddles/s':>11}{'requests':>10}{'tokens/riddle':>14}{'errors':>8}{'in flight':>10}")
+    try:
+        chatbot, results = make_chatbot(), []
+        start = time.perf_counter()
+        for riddle, answer in zip(riddles, answers):
+            try:
+                results.append(BatchResult(output=chatbot.ask(riddle, answer)))
+            except Exception as e:
+                results.append(BatchResult(error=e))
+        report("serial", chatbot, results, time.perf_counter() - start, 1)
+        for concurrency in args.concurrency:
+            for pack_size in [1, *args.pack_sizes]:
+                chatbot, server.max_in_flight = make_chatbot(), 0
+                start = time.perf_counter()
+                if pack_size == 1:
+                    results = chatbot.ask_batch(
+                        riddles, answers, max_concurrency=concurrency, requests_per_minute=args.rpm
+                    )
+                else:
+                    results = chatbot.ask_packed(
+                        riddles, answers, pack_size, max_concurrency=concurrency, requests_per_minute=args.rpm
+                    )
+                label = f"c={concurrency}" + (f" pack={pack_size}" if pack_size > 1 else "")
+                report(label, chatbot, results, time.perf_counter() - start, server.max_in_flight)
+    finally:
+        server.shutdown()
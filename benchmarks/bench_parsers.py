@@ -0,0 +1,71 @@
+"""
+Compares the parser backends on the saved corpus: parse time, peak memory of the parse, extraction time and whether
+the extracted puzzles are identical to the full html.parser reference.
+
+    python benchmarks/bench_parsers.py --limit 500
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+import typing as t
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bs4 import FeatureNotFound  # noqa: E402
+from layton_eval.constants import ROOT_DIR  # noqa: E402
+from layton_eval.extractor import PuzzleRecord  # noqa: E402
+from layton_eval.parsing import PARSER_BACKENDS, make_soup, parse_puzzle  # noqa: E402
+from layton_eval.storage import open_store  # noqa: E402
+
+
+def outcome(extract: t.Callable[[], PuzzleRecord]) -> dict | type:
+    """
+    Comparable view of an extracted puzzle, or the type of the error raised on malformed pages.
+    """
+    try:
+        record = extract()
+    except Exception as e:
+        return type(e)
+    return {key: (type(value), str(value)) for key, value in vars(record).items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=f"{ROOT_DIR}/layton-data")
+    parser.add_argument("--storage", choices=["files", "pack"], default="files")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+    store = open_store("htmls", args.storage, args.data_dir)
+    pages = {name: store.get(name) for name in sorted(store.names())[: args.limit]}
+    references = {name: outcome(partial(parse_puzzle, content)) for name, content in pages.items()}
+    print(f"{'backend':<26}{'parse ms/page':>14}{'peak KiB/page':>15}{'total ms/page':>15}{'mismatches':>12}")
+    for backend in PARSER_BACKENDS:
+        for subtree_only in (False, True):
+            label = f"{backend}{' (subtree)' if subtree_only else ''}"
+            try:
+                make_soup(b"<p></p>", backend)
+            except FeatureNotFound:
+                print(f"{label:<26}{'not installed':>14}")
+                continue
+            parse_time, peak, total_time, mismatches = 0.0, 0, 0.0, 0
+            for name, content in pages.items():
+                start = time.perf_counter()
+                make_soup(content, backend, subtree_only)
+                parse_time += time.perf_counter() - start
+                tracemalloc.start()
+                soup = make_soup(content, backend, subtree_only)
+                peak += tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                del soup
+                start = time.perf_counter()
+                extracted = outcome(partial(parse_puzzle, content, backend, subtree_only))
+                total_time += time.perf_counter() - start
+                mismatches += extracted != references[name]
+            n = len(pages)
+            print(
+                f"{label:<26}{1000 * parse_time / n:>14.2f}{peak / 1024 / n:>15.0f}"
+                f"{1000 * total_time / n:>15.2f}{mismatches:>12}"
+            )
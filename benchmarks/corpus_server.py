@@ -0,0 +1,149 @@
+"""
+Serves a saved layton-data corpus the way layton.fandom.com would, so that the crawler can run offline:
+
+    python benchmarks/corpus_server.py --port 8000 --latency 0.05 --error-rate 0.05
+    layton-eval crawl --base-url http://127.0.0.1:8000
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from layton_eval.constants import ROOT_DIR  # noqa: E402
+
+CATEGORY_PAGE_SIZE = 200
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    server: "CorpusServer"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        if path == "/wiki/Category:All_Puzzles":
+            page = int(parse_qs(url.query).get("page", ["0"])[0])
+            return self._reply(self.server.category_page(page), "text/html")
+        if path.startswith("/wiki/Puzzle:"):
+            content = self.server.puzzle_page(path.removeprefix("/wiki/Puzzle:"))
+            return self._reply(content, "text/html")
+        for kind in ("images", "answer_images"):
+            if path.startswith(f"/{kind}/"):
+                return self._reply(self.server.read_file(f"{kind}/{path.removeprefix(f'/{kind}/')}"), "image/jpeg")
+        self._reply(None, "text/html")
+
+    def _reply(self, content: bytes | None, content_type: str) -> None:
+        if content is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        pass
+
+
+class CorpusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: t.Tuple[str, int], data_dir: str, latency: float = 0.0, error_rate: float = 0.0):
+        super().__init__(address, CorpusHandler)
+        self.data_dir = data_dir
+        self.latency = latency
+        self.error_rate = error_rate
+        self._pages: t.Dict[str, bytes | None] = {}
+        self.puzzle_names = sorted(name.removesuffix(".html") for name in os.listdir(f"{data_dir}/htmls"))
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def read_file(self, relative_path: str) -> bytes | None:
+        path = os.path.join(self.data_dir, relative_path)
+        if not os.path.abspath(path).startswith(os.path.abspath(self.data_dir)) or not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def category_page(self, page: int) -> bytes:
+        names = self.puzzle_names[page * CATEGORY_PAGE_SIZE : (page + 1) * CATEGORY_PAGE_SIZE]
+        links = "".join(f'<li><a href="/wiki/Puzzle:{quote(name)}">{name}</a></li>' for name in names)
+        if (page + 1) * CATEGORY_PAGE_SIZE < len(self.puzzle_names):
+            links += (
+                f'<a class="category-page__pagination-next" href="/wiki/Category:All_Puzzles?page={page + 1}">Next</a>'
+            )
+        return f"<html><body><ul>{links}</ul></body></html>".encode()
+
+    def puzzle_page(self, name: str) -> bytes | None:
+        """
+        Returns the saved page with its image links pointing to this server instead of the wiki CDN.
+        """
+        if name not in self._pages:
+            self._pages[name] = self._rewrite_puzzle_page(name)
+        return self._pages[name]
+
+    def _rewrite_puzzle_page(self, name: str) -> bytes | None:
+        if (content := self.read_file(f"htmls/{name}.html")) is None:
+            return None
+        soup = BeautifulSoup(content, "html.parser")
+        if (thumbnail := soup.select_one(".image.image-thumbnail")) is not None:
+            answer_img = soup.select_one(f"""[alt="{thumbnail.attrs["title"] + "S"}"]""")
+            thumbnail.attrs["href"] = f"/images/{quote(name)}.jpg"
+            if answer_img is not None:
+                answer_img.attrs["src"] = answer_img.attrs["data-src"] = f"/answer_images/{quote(name)}.jpg"
+        return str(soup).encode()
+
+
+def serve_corpus(data_dir: str, port: int = 0, latency: float = 0.0, error_rate: float = 0.0) -> CorpusServer:
+    """
+    Starts a CorpusServer in a background thread, `port=0` picks a free port. Call `shutdown()` to stop it.
+    """
+    server = CorpusServer(("127.0.0.1", port), data_dir, latency=latency, error_rate=error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=f"{ROOT_DIR}/layton-data")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds slept before answering each request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    args = parser.parse_args()
+    server = CorpusServer(("127.0.0.1", args.port), args.data_dir, latency=args.latency, error_rate=args.error_rate)
+    print(f"Serving {len(server.puzzle_names)} puzzles from {args.data_dir} at {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,120 @@
+"""
+Generates a reproducible fixture corpus in the layout of layton-data: puzzle pages following the markup of the
+Layton wiki (infobox, Puzzle/Hints/Solution sections, hint boxes in both of the wiki's layouts, navbox) with their
+puzzle and answer images. The same seed always gives the same corpus, so benchmark runs can be compared:
+
+    python benchmarks/fixtures.py /tmp/layton-fixture/layton-data --puzzles 300
+    python benchmarks/corpus_server.py --data-dir /tmp/layton-fixture/layton-data
+"""
+import argparse
+import os
+import random
+import sys
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from layton_eval.extractor import HINT_STYLE, type2color  # noqa: E402
+
+CATEGORIES = ["Matchstick", "Write Answer", "Multiple Choice", "Arrange", "Sliding", "Circle Answer", "Line"]
+WORDS = "square box coin matchstick cat path door clock tile marble river bridge lamp star key".split()
+
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    return " ".join(words).capitalize() + rng.choice([".", "?", "!"])
+
+
+def hint_box(rng: random.Random, hint_type: str, number: int) -> str:
+    style = HINT_STYLE.format(type2color[hint_type])
+    if rng.random() < 0.5:  # Hint paragraphs following a title list.
+        paragraphs = "".join(f"<p>{sentence(rng)} <b>{rng.choice(WORDS)}</b></p>" for _ in range(rng.randint(1, 3)))
+        return f'<div style="{style}"><dl><dt>Hint {hint_type}</dt></dl>{paragraphs}</div>\n'
+    lines = "<br/>".join(sentence(rng) for _ in range(rng.randint(1, 3)))
+    return f'<div style="{style}"><p><b>Hint {hint_type}</b><br/>{lines} Think of {number}.</p></div>\n'
+
+
+def puzzle_name(number: int, rng: random.Random) -> str:
+    return f"{rng.choice(WORDS).title()}_{rng.choice(WORDS).title()}_{number:03d}"
+
+
+def puzzle_page(name: str, number: int, rng: random.Random) -> str:
+    category = rng.choice(CATEGORIES)
+    description = "".join(f"<p>{sentence(rng)}<br/>{sentence(rng)}</p>\n" for _ in range(rng.randint(1, 4)))
+    hints = "".join(
+        hint_box(rng, hint_type, number) for hint_type in type2color if hint_type != "Special" or rng.random() < 0.3
+    )
+    answer = rng.randint(1, 40)
+    return f"""<!DOCTYPE html><html><head><title>Puzzle:{name} | Layton Wiki</title></head><body>
+<div class="page"><main class="page__main"><div class="mw-parser-output">
+<aside class="portable-infobox pi-background">
+<figure class="pi-item pi-image"><a href="https://static.wikia.nocookie.net/layton/images/{name}.png" \
+class="image image-thumbnail" title="{name}"><img src="https://static.wikia.nocookie.net/layton/images/{name}.png" \
+alt="{name}"/></a></figure>
+<div class="pi-item pi-data" data-source="number"><h3 class="pi-data-label">Number</h3>\
+<div class="pi-data-value pi-font">{number:03d}</div></div>
+<div class="pi-item pi-data" data-source="type"><h3 class="pi-data-label">Type</h3><div class="pi-data-value pi-font">\
+<a href="/wiki/Category:{category.replace(" ", "_")}" title="Category:{category}">{category}</a></div></div>
+<div class="pi-item pi-data" data-source="picarats"><h3 class="pi-data-label">Picarats</h3>\
+<div class="pi-data-value pi-font">{rng.randrange(10, 100, 5)}</div></div>
+</aside>
+<h2><span class="mw-headline" id="Puzzle">Puzzle</span></h2>
+{description}<h2><span class="mw-headline" id="Hints">Hints</span></h2>
+{hints}<h2><span class="mw-headline" id="Solution">Solution</span></h2>
+<h3><span class="mw-headline" id="Incorrect">Incorrect</span></h3>
+<dl><dd>Too bad!</dd></dl>
+<h3><span class="mw-headline" id="Correct">Correct</span></h3>
+<dl><dd>Excellent!</dd></dl>
+<p>The answer is {answer}. {sentence(rng)}</p>
+<figure class="thumb"><a href="https://static.wikia.nocookie.net/layton/images/{name}S.png" class="image">\
+<img alt="{name}S" data-src="https://static.wikia.nocookie.net/layton/images/{name}S.png" src="data:image/gif"/></a>\
+</figure>
+<dl><dd>Progress</dd></dl>
+<table class="navbox mw-collapsible mw-collapsed"><tbody><tr><td>Puzzles</td></tr></tbody></table>
+</div></main></div><footer><p>Fandom footer.</p></footer></body></html>"""
+
+
+def puzzle_image(rng: random.Random, size: tuple = (256, 192)) -> bytes:
+    """
+    A game frame-sized JPEG with a few blocks, so that it does not compress to nothing.
+    """
+    img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(8):
+        x, y = rng.randrange(size[0] - 32), rng.randrange(size[1] - 32)
+        img.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + 32, y + 32))
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def make_corpus(data_dir: str, puzzles: int = 300, seed: int = 0) -> str:
+    """
+    Writes the fixture corpus to `data_dir` with the files storage layout, and returns `data_dir`. Two thirds of
+    the puzzles have an answer image.
+    """
+    rng = random.Random(seed)
+    for kind in ("htmls", "images", "answer_images"):
+        os.makedirs(f"{data_dir}/{kind}", exist_ok=True)
+    for number in range(puzzles):
+        name = puzzle_name(number, rng)
+        with open(f"{data_dir}/htmls/{name}.html", "w") as f:
+            f.write(puzzle_page(name, number, rng))
+        with open(f"{data_dir}/images/{name}.jpg", "wb") as f:
+            f.write(puzzle_image(rng))
+        if number % 3:
+            with open(f"{data_dir}/answer_images/{name}.jpg", "wb") as f:
+                f.write(puzzle_image(rng))
+    return data_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir")
+    parser.add_argument("--puzzles", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_corpus(args.data_dir, args.puzzles, args.seed)
+    print(f"Wrote {args.puzzles} puzzles to {args.data_dir}")
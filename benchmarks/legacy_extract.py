@@ -0,0 +1,141 @@
+"""
+The puzzle extractors as they were before the single-pass PuzzleIndex, kept as the reference its output is checked
+against by bench_extract.py.
+"""
+import typing as t
+
+import bs4
+from bs4 import BeautifulSoup
+
+type2color = {"1": "#E8E8B8", "2": "#C8E8C0", "3": "#C8F0E0", "Special": "#F0C7A7"}
+
+
+def get_puzzle_description(soup: BeautifulSoup) -> t.List[str] | str:
+    """
+    Get puzzle description from soup object.
+    """
+    puzzle_element = soup.find(id='Puzzle')
+    hints_element = soup.find(id='Hints')
+    solution_element = soup.find(id="Solution")
+
+    # Collect everything between Puzzle and Hints
+    nodes_between_elements = []
+    if puzzle_element is None:  # Some RW Puzzles do not have a Puzzle section.
+        return
+    current_element = puzzle_element.find_next()
+
+    has_images = False
+    dl_encountered = 0
+    while (current_element and current_element.find_next() not in [hints_element, solution_element]) and (
+        dl_encountered < 2
+    ):
+        if str(current_element).startswith("<p>"):
+            clean_content = ""
+            for elem in current_element.contents:
+                if str(elem).startswith('''<a class="image"'''):
+                    nodes_between_elements.append(current_element)
+                    has_images = True
+                elif isinstance(elem, bs4.element.NavigableString):
+                    clean_content += elem
+                else:
+                    for c in elem.contents:
+                        if str(c) != "<br/>" and not str(c).startswith("<img"):
+                            clean_content += c
+            nodes_between_elements.append(clean_content)
+        elif str(current_element).startswith("<dl>"):
+            dl_encountered += 1
+        current_element = current_element.find_next()
+    if has_images:
+        return nodes_between_elements[0]
+    else:
+        return "\n".join(nodes_between_elements)
+
+
+def get_puzzle_category(soup: BeautifulSoup) -> str:
+    """
+    Returns the category of a puzzle.
+    """
+    if soup.select_one("[data-source='type'] a") is not None:
+        return soup.select_one("[data-source='type'] a").attrs["title"].split(":").pop()
+
+
+def get_puzzle_picarats(soup: BeautifulSoup) -> int:
+    """
+    Returns the number of picarats owned by a puzzle.
+    """
+    if tag := soup.select_one("[data-source='picarats'] .pi-data-value.pi-font"):
+        return int(tag.contents[0])
+
+
+def get_puzzle_id(soup: BeautifulSoup) -> str:
+    """
+    Return the puzzle id.
+    """
+    if soup.select_one("[data-source='number'] .pi-data-value.pi-font") is not None:
+        return soup.select_one("[data-source='number'] .pi-data-value.pi-font").contents[0]
+
+
+def get_puzzle_hint(soup: BeautifulSoup, hint_type: t.Literal["1", "2", "3", "Special"]) -> str:
+    """
+    Given the hint type, returns the associated hint found in the puzzle.
+    """
+    background_color = type2color.get(hint_type, None)
+    base = f"[style='height:200px; overflow-y:auto; overflow-x:hidden; word-wrap:break-word; overflow: -moz-scrollbars-vertical; line-height:normal; border: 2px solid black; padding:3px; background:{background_color}; font-size:14px'] dl"
+    hint = ""
+    while (h := soup.select_one(f"{base}+p")) is not None:
+        base += "+p"
+        for c in h.contents:
+            hint += str(c)
+    if hint:
+        return hint
+    else:
+        hint = soup.select(
+            f"[style='height:200px; overflow-y:auto; overflow-x:hidden; word-wrap:break-word; overflow: -moz-scrollbars-vertical; line-height:normal; border: 2px solid black; padding:3px; background:{background_color}; font-size:14px'] p"
+        )
+        clean_content = ""
+        for h in hint:
+            if isinstance(h, bs4.element.NavigableString):
+                clean_content += h
+            else:
+                for c in h.contents:
+                    if isinstance(c, bs4.element.NavigableString):
+                        clean_content += c
+                    elif str(c) == "<br/>":
+                        clean_content += "\n"
+                    elif str(c).startswith("<img") or str(c).startswith("<a"):
+                        continue
+                    else:
+                        clean_content += c.contents[0]
+        return clean_content
+
+
+def get_puzzle_solution(soup: BeautifulSoup) -> str:
+    """
+    Get the unstructured solution of a puzzle.
+    """
+    correct_element = soup.find(id="Correct")
+    navbox_element = soup.select_one(".navbox.mw-collapsible.mw-collapsed tbody")
+    nodes_between_elements = []
+    if correct_element is None:
+        return
+    current_element = correct_element.find_next()
+    dl_encountered = 0
+    while (current_element and current_element.find_next() != navbox_element) and dl_encountered < 2:
+        if str(current_element).startswith("<p>"):
+            clean_content = ""
+            for elem in current_element.contents:
+                if str(elem).startswith('''<a class="image"'''):
+                    nodes_between_elements.append(current_element)
+                elif isinstance(elem, bs4.element.NavigableString):
+                    clean_content += elem
+                else:
+                    for c in elem.contents:
+                        if str(c) != "<br/>" and not str(c).startswith("<img"):
+                            clean_content += c
+            nodes_between_elements.append(clean_content)
+        elif str(current_element).startswith("<dl>"):
+            dl_encountered += 1
+        elif str(current_element).startswith("<i>"):  # No solution documented
+            return
+        current_element = current_element.find_next()
+    return "\n".join(nodes_between_elements)
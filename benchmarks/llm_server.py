@@ -0,0 +1,140 @@
+"""
+Answers OpenAI chat completions (`/v1/chat/completions`) and Together inference (`/inference`) requests with canned
+structurations, so that the Chatbot can run offline:
+
+    python benchmarks/llm_server.py --port 8001 --latency 0.5
+    Chatbot(provider="openai", task="input_structuration", base_url="http://127.0.0.1:8001/v1")
+    Chatbot(provider="together", owner="mistralai", task="input_structuration", base_url="http://127.0.0.1:8001/inference")
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import typing as t
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RIDDLE_OUTPUT = {"llm": True, "vlm": False, "output": "text"}
+ANSWER_OUTPUT = {"structured": ["42", "forty-two"]}
+PACKED_RIDDLE = re.compile(r"Professor Layton Riddle (\d+):")
+
+
+class LLMHandler(BaseHTTPRequestHandler):
+    server: "LLMServer"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.server.track_request():
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            if random.random() < self.server.error_rate:
+                return self._reply(500 if self.path.endswith("/inference") else 429, {"error": "overloaded"})
+            if self.path.endswith("/chat/completions"):
+                prompt = "".join(message["content"] for message in request.get("messages", []))
+                return self._reply(200, self.server.chat_completion(request.get("model"), prompt))
+            if self.path.endswith("/inference"):
+                return self._reply(200, self.server.inference(request.get("prompt", "")))
+            self._reply(404, {"error": "not found"})
+
+    def _reply(self, status: int, body: t.Dict[str, t.Any]) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        pass
+
+
+class LLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Batches open many connections at once.
+
+    def __init__(
+        self, address: t.Tuple[str, int], latency: float = 0.0, error_rate: float = 0.0, drop_rate: float = 0.0
+    ):
+        super().__init__(address, LLMHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @contextmanager
+    def track_request(self) -> t.Iterator[None]:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def output(self, prompt: str) -> str:
+        """
+        Packed prompts number their riddles, and get one item per riddle, minus the ones randomly dropped.
+        """
+        if numbers := PACKED_RIDDLE.findall(prompt):
+            output = ANSWER_OUTPUT if "Riddle answer 1:" in prompt else RIDDLE_OUTPUT
+            items = [{"index": int(n), **output} for n in numbers if random.random() >= self.drop_rate]
+            return json.dumps({"riddles": items})
+        return json.dumps(ANSWER_OUTPUT if "Riddle answer:" in prompt else RIDDLE_OUTPUT)
+
+    def chat_completion(self, model: str | None, prompt: str) -> t.Dict[str, t.Any]:
+        content = self.output(prompt)
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        return {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def inference(self, prompt: str) -> t.Dict[str, t.Any]:
+        return {"status": "finished", "output": {"choices": [{"text": self.output(prompt)}]}}
+
+
+def serve_llm(port: int = 0, latency: float = 0.0, error_rate: float = 0.0, drop_rate: float = 0.0) -> LLMServer:
+    """
+    Starts an LLMServer in a background thread, `port=0` picks a free port. Call `shutdown()` to stop it.
+    """
+    server = LLMServer(("127.0.0.1", port), latency=latency, error_rate=error_rate, drop_rate=drop_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds slept before answering each request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with an error")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of riddles left out of packed outputs")
+    args = parser.parse_args()
+    server = LLMServer(
+        ("127.0.0.1", args.port), latency=args.latency, error_rate=args.error_rate, drop_rate=args.drop_rate
+    )
+    print(f"Serving fake completions at {server.base_url}")
+    server.serve_forever()
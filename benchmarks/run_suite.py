@@ -0,0 +1,226 @@
+"""
+Runs the whole pipeline offline on the fixture corpus and records its throughput as JSON, to compare runs over time:
+pages/s of the crawler against the local corpus server, puzzles/s of the extraction, time and peak memory of the
+workbook export, and riddles/s of the structuration against the local fake LLM server.
+
+    python benchmarks/run_suite.py --puzzles 300 --output results/main.json
+    python benchmarks/run_suite.py --stages extract export --compare results/main.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing as t
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from corpus_server import serve_corpus  # noqa: E402
+from fixtures import make_corpus  # noqa: E402
+from layton_eval.chatbot import Chatbot  # noqa: E402
+from layton_eval.crawler import Crawler  # noqa: E402
+from layton_eval.dataset import COLUMNS, DatasetWriter  # noqa: E402
+from layton_eval.export import export_workbook  # noqa: E402
+from layton_eval.get_eng_html import get_page_image_links, get_riddle_urls, save_puzzle_page  # noqa: E402
+from layton_eval.pipeline import Checkpoint, run_pipeline  # noqa: E402
+from layton_eval.providers import ProviderPool  # noqa: E402
+from layton_eval.scrape_htmls import build_rows  # noqa: E402
+from layton_eval.storage import open_store, open_stores  # noqa: E402
+from llm_server import serve_llm  # noqa: E402
+
+STAGES = ("crawl", "extract", "export", "structuration")
+
+
+def bench_crawl(corpus_dir: str, data_dir: str, workers: int, latency: float, error_rate: float) -> t.Dict:
+    """
+    Crawls the corpus served locally into `data_dir`, saving every page and image as the crawl script does.
+    """
+    server = serve_corpus(corpus_dir, latency=latency, error_rate=error_rate)
+    stores = open_stores("files", data_dir)
+    try:
+        crawler = Crawler(max_workers=workers, requests_per_second=0, backoff_factor=0.01, base_url=server.base_url)
+        start = time.perf_counter()
+        urls = get_riddle_urls(crawler)
+        pages = 0
+        for page in crawler.crawl(urls, get_page_image_links):
+            if page.status == 200:
+                save_puzzle_page(page, stores)
+                pages += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        for store in stores.values():
+            store.close()
+    return {"pages": pages, "failed": len(urls) - pages, "seconds": elapsed, "pages_per_s": pages / elapsed}
+
+
+def write_dataset(data_dir: str, dataset_path: str, workers: int) -> t.Tuple[int, float]:
+    """
+    Extracts every puzzle of `data_dir` to the Parquet dataset, returns the number of puzzles and the extraction
+    time, not counting the Parquet write.
+    """
+    puzzle_names = sorted(open_store("htmls", "files", data_dir).names())
+    start = time.perf_counter()
+    rows = list(build_rows(puzzle_names, "files", data_dir, workers=workers))
+    elapsed = time.perf_counter() - start
+    with DatasetWriter(dataset_path) as writer:
+        for row in rows:
+            writer.write({"puzzle_name": row.puzzle_name, **dict(zip(COLUMNS, row.values))})
+    return len(rows), elapsed
+
+
+def bench_extract(data_dir: str, dataset_path: str, workers: int) -> t.Dict:
+    puzzles, elapsed = write_dataset(data_dir, dataset_path, workers)
+    return {"puzzles": puzzles, "workers": workers, "seconds": elapsed, "puzzles_per_s": puzzles / elapsed}
+
+
+def bench_export(data_dir: str, dataset_path: str, workbook_path: str, workers: int) -> t.Dict:
+    """
+    Exports the workbook three times: with the thumbnails to render, with the thumbnails cached, and with the
+    thumbnails cached under tracemalloc for the peak memory, which slows the export down.
+    """
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        export_workbook(dataset_path, workbook_path, "files", data_dir, thumbnails=True, workers=workers)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    export_workbook(dataset_path, workbook_path, "files", data_dir, thumbnails=True, workers=workers)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds_cold": timings[0],
+        "seconds": timings[1],
+        "peak_mib": peak / 2**20,
+        "workbook_mib": os.path.getsize(workbook_path) / 2**20,
+    }
+
+
+def bench_structuration(
+    dataset_path: str,
+    checkpoint_path: str,
+    provider: str,
+    concurrency: int,
+    pack_size: int,
+    latency: float,
+    error_rate: float,
+) -> t.Dict:
+    """
+    Runs the input_structuration pipeline on the whole dataset against the fake LLM server, without cache.
+    """
+    server = serve_llm(latency=latency, error_rate=error_rate)
+    base_url = f"{server.base_url}/v1" if provider == "openai" else f"{server.base_url}/inference"
+    chatbot = Chatbot(
+        pool=ProviderPool(), provider=provider, owner="mistralai", task="input_structuration", base_url=base_url
+    )
+    chatbot.verbose = False
+    checkpoint = Checkpoint(checkpoint_path)
+    try:
+        stats = run_pipeline(chatbot, checkpoint, dataset_path, max_concurrency=concurrency, pack_size=pack_size)
+    finally:
+        checkpoint.close()
+        server.shutdown()
+    llm = stats.stages["llm"]
+    return {
+        "riddles": llm.items,
+        "errors": stats.errors,
+        "seconds": llm.seconds,
+        "riddles_per_s": llm.throughput,
+        "requests": chatbot.usage.requests,
+        "tokens_per_riddle": chatbot.usage.tokens_per_riddle,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: t.Dict[str, t.Dict[str, float]]) -> t.Dict[str, float]:
+    return {f"{stage}.{metric}": value for stage, metrics in results.items() for metric, value in metrics.items()}
+
+
+def compare(previous: t.Dict, current: t.Dict) -> str:
+    before, after = flatten(previous["results"]), flatten(current["results"])
+    lines = [f"{'metric':<36}{'before':>12}{'after':>12}{'ratio':>8}   (before: {previous.get('commit')})"]
+    for metric, value in after.items():
+        if metric in before:
+            ratio = f"{value / before[metric]:.2f}" if before[metric] else "-"
+            lines.append(f"{metric:<36}{before[metric]:>12.3f}{value:>12.3f}{ratio:>8}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--puzzles", type=int, default=300, help="size of the fixture corpus")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the fixture corpus")
+    parser.add_argument("--corpus", default=None, help="existing layton-data to use instead of the fixture corpus")
+    parser.add_argument("--workers", type=int, default=8, help="crawler threads")
+    parser.add_argument("--build-workers", type=int, default=1, help="extraction and thumbnail processes")
+    parser.add_argument("--latency", type=float, default=0.01, help="latency of the corpus server")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 429s from the corpus server")
+    parser.add_argument("--provider", choices=["openai", "together"], default="together")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent LLM requests")
+    parser.add_argument("--pack-size", type=int, default=1, help="riddles per LLM request")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="latency of the fake LLM server")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of errors from the LLM server")
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("TOGETHER_API_KEY", "fake")
+    results: t.Dict[str, t.Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory(prefix="layton-bench-") as work_dir:
+        corpus_dir = args.corpus or make_corpus(f"{work_dir}/corpus", args.puzzles, args.seed)
+        data_dir, dataset_path = corpus_dir, f"{work_dir}/puzzles.parquet"
+        if "crawl" in args.stages:
+            data_dir = f"{work_dir}/crawled"
+            results["crawl"] = bench_crawl(corpus_dir, data_dir, args.workers, args.latency, args.error_rate)
+        if "extract" in args.stages:
+            results["extract"] = bench_extract(data_dir, dataset_path, args.build_workers)
+        elif {"export", "structuration"} & set(args.stages):
+            write_dataset(data_dir, dataset_path, args.build_workers)
+        if "export" in args.stages:
+            results["export"] = bench_export(
+                data_dir, dataset_path, f"{work_dir}/layton-annotations.xlsx", args.build_workers
+            )
+        if "structuration" in args.stages:
+            results["structuration"] = bench_structuration(
+                dataset_path,
+                f"{work_dir}/structured.jsonl",
+                args.provider,
+                args.concurrency,
+                args.pack_size,
+                args.llm_latency,
+                args.llm_error_rate,
+            )
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+        "results": results,
+    }
+    for stage, metrics in results.items():
+        print(f"{stage:<14}" + "  ".join(f"{metric}={value:.3f}" for metric, value in metrics.items()))
+    if args.output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            print(compare(json.load(f), run))
@@ -0,0 +1,3 @@
+from layton_eval.cli import main
+
+main()
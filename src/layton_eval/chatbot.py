@@ -1,13 +1,29 @@
+import asyncio
+import time
 import typing as t
+from collections import deque
+from dataclasses import dataclass
 from functools import cached_property
+from logging import getLogger
+from uuid import UUID
 
 from langchain.chains import LLMChain
 from langchain.chains.base import Chain
-from langchain.chat_models import ChatOpenAI
-from langchain.llms import Together
 from langchain.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.outputs import LLMResult
+from langchain_core.pydantic_v1 import BaseModel, Field, ValidationError
+
+from layton_eval.providers import DEFAULT_POOL, Backend, ProviderPool
+from layton_eval.response_cache import MISSING, CacheMode, ResponseCache
+from layton_eval.tracing import count, span
+
+if t.TYPE_CHECKING:
+    from langchain.chat_models import ChatOpenAI
+    from langchain.llms import Together
+
+log = getLogger(__name__)
 
 
 class LaytonRiddle(BaseModel):
@@ -30,11 +46,123 @@ class LaytonAnswer(BaseModel):
     )
 
 
+class PackedLaytonRiddle(LaytonRiddle):
+    index: int = Field(description="the number of the riddle")
+
+
+class PackedLaytonAnswer(LaytonAnswer):
+    index: int = Field(description="the number of the riddle")
+
+
+class LaytonRiddles(BaseModel):
+    riddles: t.List[PackedLaytonRiddle] = Field(description="one item for every riddle")
+
+
+class LaytonAnswers(BaseModel):
+    riddles: t.List[PackedLaytonAnswer] = Field(description="one item for every riddle")
+
+
 class ModelArgs(t.TypedDict):
     provider: t.Literal["openai", "together"]
     owner: t.Literal["mistralai", "togethercomputer"] | None
     string: t.Literal["gpt-3.5-turbo", "llama-2-7b-chat", "Mistral-7B-Instruct-v0.1"]
     task: t.Literal["input_structuration", "answer_structuration"]
+    base_url: str | None
+
+
+CHARS_PER_TOKEN = 4  # Rough estimate, used for the tokens-per-minute budget and for providers reporting no usage.
+
+
+@dataclass
+class BatchResult:
+    output: t.Any = None
+    error: Exception | None = None
+
+
+@dataclass
+class TokenUsage:
+    requests: int = 0
+    riddles: int = 0  # Riddles resolved by a request, not by the cache.
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def tokens_per_riddle(self) -> float:
+        return (self.prompt_tokens + self.completion_tokens) / self.riddles if self.riddles else 0.0
+
+
+class UsageCounter(BaseCallbackHandler):
+    """
+    Adds the tokens of every llm call to a TokenUsage: the usage reported by the provider when there is one, as
+    OpenAI does, and otherwise an estimate from the lengths of the prompt and completion.
+    """
+
+    run_inline = True
+
+    def __init__(self, usage: TokenUsage) -> None:
+        self.usage = usage
+        self.prompt_chars: t.Dict[UUID, int] = {}
+
+    def on_llm_start(self, serialized: t.Dict[str, t.Any], prompts: t.List[str], *, run_id: UUID, **kwargs) -> None:
+        self.prompt_chars[run_id] = sum(len(prompt) for prompt in prompts)
+
+    def on_chat_model_start(
+        self, serialized: t.Dict[str, t.Any], messages: t.List[t.List[t.Any]], *, run_id: UUID, **kwargs
+    ) -> None:
+        self.prompt_chars[run_id] = sum(len(message.content) for batch in messages for message in batch)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        prompt_chars = self.prompt_chars.pop(run_id, 0)
+        if token_usage := (response.llm_output or {}).get("token_usage"):
+            self.add(token_usage["prompt_tokens"], token_usage["completion_tokens"])
+            return
+        completion_chars = sum(
+            len(generation.text) for generations in response.generations for generation in generations
+        )
+        self.add(prompt_chars // CHARS_PER_TOKEN, completion_chars // CHARS_PER_TOKEN)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self.add(self.prompt_chars.pop(run_id, 0) // CHARS_PER_TOKEN, 0)
+
+    def add(self, prompt_tokens: int, completion_tokens: int) -> None:
+        self.usage.requests += 1
+        self.usage.prompt_tokens += prompt_tokens
+        self.usage.completion_tokens += completion_tokens
+        count("llm.requests")
+        count("llm.prompt_tokens", prompt_tokens)
+        count("llm.completion_tokens", completion_tokens)
+
+
+class MinuteBudget:
+    """
+    Keeps the requests sent during the last minute, with their estimated number of tokens, and delays new requests
+    until they fit within the requests-per-minute and tokens-per-minute budgets.
+    """
+
+    def __init__(self, requests_per_minute: int | None = None, tokens_per_minute: int | None = None) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.sent: t.Deque[t.Tuple[float, int]] = deque()
+        self.tokens = 0
+        self.lock = asyncio.Lock()
+
+    def fits(self, tokens: int) -> bool:
+        if self.requests_per_minute is not None and len(self.sent) >= self.requests_per_minute:
+            return False
+        # A request larger than the whole budget is sent alone rather than never.
+        return self.tokens_per_minute is None or not self.sent or self.tokens + tokens <= self.tokens_per_minute
+
+    async def acquire(self, tokens: int) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                while self.sent and now - self.sent[0][0] >= 60:
+                    self.tokens -= self.sent.popleft()[1]
+                if self.fits(tokens):
+                    self.sent.append((now, tokens))
+                    self.tokens += tokens
+                    return
+                await asyncio.sleep(self.sent[0][0] + 60 - now)
 
 
 class Chatbot:
@@ -59,25 +187,60 @@ class Chatbot:
     Please format the riddle answer.
     [/INST]"""
 
-    def __init__(self, **model_kwargs: t.Unpack[ModelArgs]) -> None:
+    RIDDLES_TEMPLATE = """[INST]
+    Here are {count} Professor Layton riddles, use them to answer the questions and format the answers but do not solve the riddles.
+
+    {riddles}
+    {format_instructions}
+    Questions, to answer in one item per riddle with the number of the riddle:
+    - Is this riddle llm_solvable ?
+    - Is this riddle vlm_solvable ?
+    - What is the output_type of this riddle ?
+    [/INST]"""
+
+    ANSWERS_TEMPLATE = """[INST]
+    Here are {count} Professor Layton riddles and their solutions, use them to structure the answers but do not solve the riddles.
+
+    {riddles}
+    {format_instructions}
+    Please format every riddle answer, in one item per riddle with the number of the riddle.
+    [/INST]"""
+
+    def __init__(
+        self,
+        cache: ResponseCache | None = None,
+        cache_mode: CacheMode = "use",
+        pool: ProviderPool | None = None,
+        fallbacks: t.Sequence[Backend] = (),
+        **model_kwargs: t.Unpack[ModelArgs],
+    ) -> None:
+        """
+        With a `cache`, outputs are reused when `cache_mode` is "use", recomputed and stored again when it is
+        "refresh", and neither read nor stored when it is "bypass".
+        Requests go through the llm clients of `pool`, shared by default, to the model of `model_kwargs` or to one of
+        the `fallbacks`, whichever is expected to answer first, and fail over to the others when it errors.
+        """
+        self.cache = cache
+        self.cache_mode = cache_mode
+        self.pool = pool if pool is not None else DEFAULT_POOL
         self.model_provider = model_kwargs.get("provider", "openai")
         self.model_owner = model_kwargs.get("owner", None)
         self.model_string = model_kwargs.get("string", "gpt-3.5-turbo")
         self.task = model_kwargs.get("task", None)
+        self.base_url = model_kwargs.get("base_url", None)
+        self.backends = [Backend(self.model_provider, self.model_owner, self.model_string, self.base_url), *fallbacks]
+        self.verbose = True
+        self.usage = TokenUsage()
+        self.usage_counter = UsageCounter(self.usage)
+        self._chains: t.Dict[t.Tuple[Backend, bool], Chain] = {}
 
-    @cached_property
-    def llm(self) -> ChatOpenAI | Together:
-        if self.model_provider == "openai":
-            return ChatOpenAI(
-                model=self.model_string,
-                streaming=False,
-                model_kwargs={},
-            )
-        elif self.model_provider == "together":
-            return Together(
-                model=f"{self.model_owner}/{self.model_string}",
-                max_tokens=1024,
-            )
+    @property
+    def llm(self) -> "ChatOpenAI | Together":
+        return self.pool.client(self.backends[0])
+
+    @property
+    def event_loop(self) -> asyncio.AbstractEventLoop:
+        return self.pool.event_loop
 
     @cached_property
     def parser(self) -> JsonOutputParser:
@@ -100,19 +263,363 @@ class Chatbot:
             )
         return
 
-    @cached_property
+    @property
     def chain(self) -> Chain:
-        return LLMChain(llm=self.llm, memory=None, verbose=True, prompt=self.template, output_parser=self.parser)
+        return self.chain_for(self.backends[0])
+
+    @cached_property
+    def packed_parser(self) -> JsonOutputParser:
+        pydantic_object = LaytonRiddles if self.task == "input_structuration" else LaytonAnswers
+        return JsonOutputParser(pydantic_object=pydantic_object)
+
+    @cached_property
+    def packed_template(self) -> PromptTemplate:
+        if self.task not in ("input_structuration", "answer_structuration"):
+            return
+        return PromptTemplate(
+            template=self.RIDDLES_TEMPLATE if self.task == "input_structuration" else self.ANSWERS_TEMPLATE,
+            input_variables=["count", "riddles"],
+            partial_variables={"format_instructions": self.packed_parser.get_format_instructions()},
+        )
+
+    @property
+    def packed_chain(self) -> Chain:
+        return self.chain_for(self.backends[0], packed=True)
+
+    def chain_for(self, backend: Backend, packed: bool = False) -> Chain:
+        if (backend, packed) not in self._chains:
+            self._chains[backend, packed] = LLMChain(
+                llm=self.pool.client(backend),
+                memory=None,
+                verbose=self.verbose,
+                prompt=self.packed_template if packed else self.template,
+                output_parser=self.packed_parser if packed else self.parser,
+            )
+        return self._chains[backend, packed]
+
+    def inputs(self, riddle: str, answer: str = None) -> t.Dict[str, str] | None:
+        if self.task == "input_structuration":
+            return {"riddle": riddle}
+        elif self.task == "answer_structuration":
+            return {"riddle": riddle, "answer": answer}
+        return
+
+    def packed_inputs(self, riddles: t.Sequence[str], answers: t.Sequence[str | None]) -> t.Dict[str, str]:
+        if self.task == "input_structuration":
+            blocks = [f"Professor Layton Riddle {i}: {riddle}" for i, riddle in enumerate(riddles, 1)]
+        else:
+            blocks = [
+                f"Professor Layton Riddle {i}: {riddle}\n\n    Riddle answer {i}: {answer}"
+                for i, (riddle, answer) in enumerate(zip(riddles, answers), 1)
+            ]
+        return {"count": str(len(riddles)), "riddles": "\n\n    ".join(blocks)}
+
+    def split_packed(self, output: t.Any, count: int) -> t.Dict[int, t.Dict[str, t.Any]]:
+        """
+        Returns the valid items of a packed output by riddle number, from 1 to `count`.
+        """
+        schema = self.parser.pydantic_object
+        items = output.get("riddles") if isinstance(output, dict) else None
+        split = {}
+        for item in items if isinstance(items, list) else []:
+            try:
+                index, value = int(item["index"]), schema.parse_obj(item).dict()
+            except (TypeError, KeyError, ValueError, ValidationError):
+                continue
+            if 1 <= index <= count:
+                split.setdefault(index, value)
+        return split
+
+    def cache_key(self, inputs: t.Dict[str, str], backend: Backend, packed: bool = False) -> str:
+        """
+        Hashes everything the output depends on: editing a template or a schema changes the key of its requests.
+        Outputs split from packed requests are kept apart from the ones of single-riddle requests.
+        """
+        return self.cache.key(
+            provider=backend.provider,
+            owner=backend.owner,
+            model=backend.string,
+            task=self.task,
+            prompt=self.template.format(**inputs),
+            schema=self.parser.pydantic_object.schema(),
+            **(
+                {
+                    "packed_prompt": self.packed_template.template,
+                    "packed_schema": self.packed_parser.pydantic_object.schema(),
+                }
+                if packed
+                else {}
+            ),
+        )
+
+    def cached(self, inputs: t.Dict[str, str], packed: bool = False) -> t.Any:
+        """
+        Returns the cached output of a request from any of the backends, in order, or MISSING. Packed lookups fall
+        back on single-riddle outputs, such as those of the riddles asked again after a packed output dropped them.
+        """
+        if self.cache is None or self.cache_mode != "use":
+            return MISSING
+        keys = [self.cache_key(inputs, backend, packed=True) for backend in self.backends] if packed else []
+        keys += [self.cache_key(inputs, backend) for backend in self.backends]
+        output = self.cache.get_first(keys)
+        count("llm.cache_hits" if output is not MISSING else "llm.cache_misses")
+        return output
+
+    def store(self, inputs: t.Dict[str, str], output: t.Any, backend: Backend, packed: bool = False) -> None:
+        if self.cache is not None and self.cache_mode != "bypass":
+            self.cache.put(self.cache_key(inputs, backend, packed), output)
+
+    def _call(self, inputs: t.Dict[str, str]) -> t.Tuple[Backend, t.Any]:
+        """
+        Sends a request to the best backend, then to the next best ones while it fails, and returns the backend that
+        answered with its output. The error of the last backend is raised when all of them fail.
+        """
+        tried = []
+        while (backend := self.pool.choose(self.backends, exclude=tried)) is not None:
+            started = self.pool.start(backend)
+            try:
+                with span("llm.call", backend=backend.name):
+                    output = self.chain_for(backend).run(callbacks=[self.usage_counter], **inputs)
+            except Exception as e:
+                self.pool.finish(backend, started, e)
+                if len(tried) + 1 == len(self.backends):
+                    raise
+                log.info(f"{backend.name} failed, failing over: {e!r}")
+                tried.append(backend)
+                continue
+            self.pool.finish(backend, started)
+            return backend, output
+
+    async def _acall(self, inputs: t.Dict[str, str], packed: bool = False) -> t.Tuple[Backend, t.Any]:
+        """
+        Async version of `_call`, for single-riddle or packed requests.
+        """
+        tried = []
+        while (backend := self.pool.choose(self.backends, exclude=tried)) is not None:
+            started = self.pool.start(backend)
+            try:
+                with span("llm.call", backend=backend.name, packed=packed):
+                    output = await self.chain_for(backend, packed).arun(callbacks=[self.usage_counter], **inputs)
+            except Exception as e:
+                self.pool.finish(backend, started, e)
+                if len(tried) + 1 == len(self.backends):
+                    raise
+                log.info(f"{backend.name} failed, failing over: {e!r}")
+                tried.append(backend)
+                continue
+            self.pool.finish(backend, started)
+            return backend, output
 
     def ask(
         self,
         riddle: str,
         answer: str = None,
     ) -> str:
-        if self.task == "input_structuration":
-            return self.chain.run(
-                riddle=riddle,
+        if (inputs := self.inputs(riddle, answer)) is None:
+            return
+        output = self.cached(inputs)
+        if output is MISSING:
+            with span("llm.request"):
+                backend, output = self._call(inputs)
+            self.usage.riddles += 1
+            self.store(inputs, output, backend)
+        return output
+
+    async def aask(self, riddle: str, answer: str = None) -> str:
+        if (inputs := self.inputs(riddle, answer)) is None:
+            return
+        output = self.cached(inputs)
+        if output is MISSING:
+            with span("llm.request"):
+                backend, output = await self._acall(inputs)
+            self.usage.riddles += 1
+            self.store(inputs, output, backend)
+        return output
+
+    async def aask_batch(
+        self,
+        riddles: t.Sequence[str],
+        answers: t.Sequence[str] | None = None,
+        max_concurrency: int = 8,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        expected_output_tokens: int = 256,
+        on_result: t.Callable[[int, BatchResult], None] | None = None,
+        labels: t.Sequence[str] | None = None,
+    ) -> t.List[BatchResult]:
+        """
+        Asks every riddle (with its answer for answer_structuration) concurrently, with at most `max_concurrency`
+        requests in flight and within the per-minute budgets. The prompt tokens are estimated from the rendered
+        prompt, plus `expected_output_tokens` for the completion. Cached outputs neither wait nor count against the
+        budgets. Results are in input order, and a failed item holds its error instead of aborting the batch.
+        `on_result` is called with the index and result of every item as soon as it completes. `labels`, such as
+        puzzle names, are attached to the trace spans of the items.
+        """
+        answers = answers if answers is not None else [None] * len(riddles)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        budget = MinuteBudget(requests_per_minute, tokens_per_minute)
+        return await self._aask_items(riddles, answers, semaphore, budget, expected_output_tokens, on_result, labels)
+
+    async def _aask_items(
+        self,
+        riddles: t.Sequence[str],
+        answers: t.Sequence[str | None],
+        semaphore: asyncio.Semaphore,
+        budget: MinuteBudget,
+        expected_output_tokens: int,
+        on_result: t.Callable[[int, BatchResult], None] | None,
+        labels: t.Sequence[str] | None = None,
+    ) -> t.List[BatchResult]:
+        async def ask_item(index: int, riddle: str, answer: str | None) -> BatchResult:
+            try:
+                inputs = self.inputs(riddle, answer)
+                output = self.cached(inputs)
+                if output is MISSING:
+                    async with semaphore:
+                        prompt = self.template.format(**inputs)
+                        with span("llm.wait"):
+                            await budget.acquire(len(prompt) // CHARS_PER_TOKEN + expected_output_tokens)
+                        with span("llm.request", puzzle=labels[index] if labels is not None else None):
+                            backend, output = await self._acall(inputs)
+                    self.usage.riddles += 1
+                    self.store(inputs, output, backend)
+                result = BatchResult(output=output)
+            except Exception as e:
+                result = BatchResult(error=e)
+            if on_result is not None:
+                on_result(index, result)
+            return result
+
+        items = enumerate(zip(riddles, answers))
+        return list(await asyncio.gather(*(ask_item(index, riddle, answer) for index, (riddle, answer) in items)))
+
+    def ask_batch(
+        self,
+        riddles: t.Sequence[str],
+        answers: t.Sequence[str] | None = None,
+        max_concurrency: int = 8,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        expected_output_tokens: int = 256,
+        on_result: t.Callable[[int, BatchResult], None] | None = None,
+        labels: t.Sequence[str] | None = None,
+    ) -> t.List[BatchResult]:
+        """
+        Blocking version of `aask_batch`, run in an event loop kept across batches.
+        """
+        return self.event_loop.run_until_complete(
+            self.aask_batch(
+                riddles,
+                answers,
+                max_concurrency,
+                requests_per_minute,
+                tokens_per_minute,
+                expected_output_tokens,
+                on_result,
+                labels,
             )
-        elif self.task == "answer_structuration":
-            return self.chain.run(riddle=riddle, answer=answer)
-        return
+        )
+
+    async def aask_packed(
+        self,
+        riddles: t.Sequence[str],
+        answers: t.Sequence[str] | None = None,
+        pack_size: int = 8,
+        max_concurrency: int = 8,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        expected_output_tokens: int = 256,
+        on_result: t.Callable[[int, BatchResult], None] | None = None,
+        labels: t.Sequence[str] | None = None,
+    ) -> t.List[BatchResult]:
+        """
+        Same as `aask_batch`, but every request holds up to `pack_size` riddles and asks for a list of outputs, so
+        that the instructions and format instructions are sent once per pack instead of once per riddle. Riddles
+        missing from a packed output, or malformed in it, are asked again individually. `expected_output_tokens`
+        is per riddle.
+        """
+        answers = answers if answers is not None else [None] * len(riddles)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        budget = MinuteBudget(requests_per_minute, tokens_per_minute)
+        results: t.List[BatchResult | None] = [None] * len(riddles)
+
+        def resolve(index: int, result: BatchResult) -> None:
+            results[index] = result
+            if on_result is not None:
+                on_result(index, result)
+
+        todo = []
+        for index, (riddle, answer) in enumerate(zip(riddles, answers)):
+            try:
+                output = self.cached(self.inputs(riddle, answer), packed=True)
+            except Exception as e:
+                resolve(index, BatchResult(error=e))
+                continue
+            if output is MISSING:
+                todo.append(index)
+            else:
+                resolve(index, BatchResult(output=output))
+        retries = []
+
+        async def ask_pack(pack: t.List[int]) -> None:
+            inputs = self.packed_inputs([riddles[i] for i in pack], [answers[i] for i in pack])
+            try:
+                async with semaphore:
+                    prompt = self.packed_template.format(**inputs)
+                    with span("llm.wait"):
+                        await budget.acquire(len(prompt) // CHARS_PER_TOKEN + expected_output_tokens * len(pack))
+                    with span("llm.pack", riddles=[labels[i] for i in pack] if labels is not None else len(pack)):
+                        backend, output = await self._acall(inputs, packed=True)
+            except Exception as e:
+                log.info(f"Packed request of {len(pack)} riddles failed, asking them individually: {e!r}")
+                backend, output = None, None
+            split = self.split_packed(output, len(pack))
+            for number, index in enumerate(pack, 1):
+                if number not in split:
+                    retries.append(index)
+                    continue
+                self.usage.riddles += 1
+                self.store(self.inputs(riddles[index], answers[index]), split[number], backend, packed=True)
+                resolve(index, BatchResult(output=split[number]))
+
+        await asyncio.gather(*(ask_pack(todo[i : i + pack_size]) for i in range(0, len(todo), pack_size)))
+        retries.sort()
+        await self._aask_items(
+            [riddles[i] for i in retries],
+            [answers[i] for i in retries],
+            semaphore,
+            budget,
+            expected_output_tokens,
+            lambda position, result: resolve(retries[position], result),
+            [labels[i] for i in retries] if labels is not None else None,
+        )
+        return results
+
+    def ask_packed(
+        self,
+        riddles: t.Sequence[str],
+        answers: t.Sequence[str] | None = None,
+        pack_size: int = 8,
+        max_concurrency: int = 8,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        expected_output_tokens: int = 256,
+        on_result: t.Callable[[int, BatchResult], None] | None = None,
+        labels: t.Sequence[str] | None = None,
+    ) -> t.List[BatchResult]:
+        """
+        Blocking version of `aask_packed`.
+        """
+        return self.event_loop.run_until_complete(
+            self.aask_packed(
+                riddles,
+                answers,
+                pack_size,
+                max_concurrency,
+                requests_per_minute,
+                tokens_per_minute,
+                expected_output_tokens,
+                on_result,
+                labels,
+            )
+        )
@@ -0,0 +1,189 @@
+"""
+The layton-eval command, one subcommand per step of the pipeline:
+
+    layton-eval crawl --workers 8
+    layton-eval build --workers 4 --no-excel
+    layton-eval export
+    layton-eval structure-input --provider together --concurrency 16
+    layton-eval structure-output --provider together
+    layton-eval dedup --images
+    layton-eval eval responses/*.jsonl --answers layton-data/structured/answer_structuration-<model>.jsonl
+
+The arguments of every subcommand are declared here, and the module running it is only imported once they are
+parsed, so that the help or a mistyped option does not pay for pandas, pyarrow, bs4 or langchain.
+"""
+import argparse
+import importlib
+import typing as t
+from functools import partial
+
+from layton_eval.constants import CACHE_PATH, DATASET_PATH, FANDOM_URL, PARSER_BACKENDS, ROOT_DIR
+
+
+def backend(spec: str):
+    """
+    Parses a --fallback backend, loading the providers only when one is given.
+    """
+    from layton_eval.providers import Backend
+
+    return Backend.parse(spec)
+
+
+def add_crawl_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--workers", type=int, default=8, help="number of concurrent requests")
+    parser.add_argument("--rate", type=float, default=5.0, help="maximum number of requests per second and per host")
+    parser.add_argument("--retries", type=int, default=4, help="retries on connection errors, 429s and 5xx")
+    parser.add_argument("--base-url", default=FANDOM_URL, help="wiki to crawl, e.g. a local stand-in")
+    parser.add_argument("--full", action="store_true", help="ignore the crawl manifest and download every page")
+    parser.add_argument("--storage", choices=["files", "pack"], default="files", help="layton-data storage backend")
+    parser.add_argument("--parser", choices=PARSER_BACKENDS, default="html.parser", help="BeautifulSoup tree builder")
+    parser.add_argument("--trace", default=None, help="write the timings of the run, as a Chrome trace if .json")
+
+
+def add_build_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--storage", choices=["files", "pack"], default="files", help="layton-data storage backend")
+    parser.add_argument("--parser", choices=PARSER_BACKENDS, default="html.parser", help="BeautifulSoup tree builder")
+    parser.add_argument("--subtree-only", action="store_true", help="only parse the article body of each page")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes extracting the puzzles")
+    parser.add_argument("--chunksize", type=int, default=32, help="number of puzzles sent to a worker at once")
+    parser.add_argument("--row-group-size", type=int, default=256, help="number of puzzles per Parquet row group")
+    parser.add_argument("--no-excel", action="store_true", help="only write the Parquet dataset")
+    parser.add_argument(
+        "--no-thumbnails", action="store_true", help="embed the full images instead of 350px thumbnails"
+    )
+    parser.add_argument("--trace", default=None, help="write the timings of the run, as a Chrome trace if .json")
+
+
+def add_export_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--dataset", default=DATASET_PATH, help="Parquet dataset written by the build command")
+    parser.add_argument("--output", default=f"{ROOT_DIR}/layton-annotations.xlsx", help="path of the workbook")
+    parser.add_argument("--storage", choices=["files", "pack"], default="files", help="layton-data storage backend")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes rendering the thumbnails")
+    parser.add_argument(
+        "--no-thumbnails", action="store_true", help="embed the full images instead of 350px thumbnails"
+    )
+    parser.add_argument("--trace", default=None, help="write the timings of the run, as a Chrome trace if .json")
+
+
+def add_structure_arguments(parser: argparse.ArgumentParser, task: str) -> None:
+    parser.set_defaults(task=task)
+    parser.add_argument("--provider", choices=["openai", "together"], default="together")
+    parser.add_argument("--owner", default="mistralai", help="owner of the model, for together")
+    parser.add_argument("--model", default="Mixtral-8x7B-Instruct-v0.1")
+    parser.add_argument("--base-url", default=None, help="OpenAI/Together-compatible endpoint")
+    parser.add_argument(
+        "--fallback",
+        type=backend,
+        action="append",
+        default=[],
+        help="other backend to route requests to, as provider:[owner/]model[@base_url], can be repeated",
+    )
+    parser.add_argument("--dataset", default=DATASET_PATH, help="Parquet dataset written by the build command")
+    parser.add_argument("--checkpoint", default=None, help="defaults to layton-data/structured/<task>-<model>.jsonl")
+    parser.add_argument("--batch-size", type=int, default=64, help="number of rows read and sent at once")
+    parser.add_argument("--limit", type=int, default=None, help="only structure the first rows of the dataset")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent requests")
+    parser.add_argument("--rpm", type=int, default=None, help="requests-per-minute budget")
+    parser.add_argument("--tpm", type=int, default=None, help="tokens-per-minute budget")
+    parser.add_argument("--pack-size", type=int, default=1, help="number of riddles sent in a single request")
+    parser.add_argument("--cache", default=CACHE_PATH, help="SQLite response cache")
+    parser.add_argument("--cache-mode", choices=["use", "refresh", "bypass"], default="use")
+    parser.add_argument(
+        "--dedup", action="store_true", help="structure near-duplicate puzzles once and copy the result to the others"
+    )
+    parser.add_argument("--dedup-threshold", type=float, default=0.8, help="similarity of near-duplicate inputs")
+    parser.add_argument("--dedup-images", action="store_true", help="also require near-duplicate puzzle images")
+    parser.add_argument("--storage", choices=["files", "pack"], default="files", help="layton-data storage backend")
+    parser.add_argument("--trace", default=None, help="write the timings of the run, as a Chrome trace if .json")
+
+
+def add_eval_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("responses", nargs="+", help="JSON lines or Parquet files of puzzle_name, answer[, model]")
+    parser.add_argument("--answers", required=True, help="output or checkpoint of the structure-output command")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="Parquet dataset written by the build command")
+    parser.add_argument("--match", choices=["exact", "contains"], default="exact", help="whole or partial answers")
+    parser.add_argument("--picarat-width", type=int, default=10, help="width of the picarat buckets")
+    parser.add_argument("--output", default=None, help="prefix of the CSV files of the tables")
+
+
+def add_dedup_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--dataset", default=DATASET_PATH, help="Parquet dataset written by the build command")
+    parser.add_argument(
+        "--fields",
+        nargs="+",
+        choices=["description", "solution", "first_hint", "second_hint", "third_hint", "special_hint"],
+        default=["description", "solution"],
+        help="fields that must be near-identical",
+    )
+    parser.add_argument("--threshold", type=float, default=0.8, help="estimated Jaccard similarity of the shingles")
+    parser.add_argument("--images", action="store_true", help="also require near-duplicate puzzle images")
+    parser.add_argument("--max-image-distance", type=int, default=10, help="bits of difference between image hashes")
+    parser.add_argument("--storage", choices=["files", "pack"], default="files", help="layton-data storage backend")
+    parser.add_argument("--output", default=f"{ROOT_DIR}/layton-data/duplicates.csv", help="CSV file of the clusters")
+    parser.add_argument("--trace", default=None, help="write the timings of the run, as a Chrome trace if .json")
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--path", default=CACHE_PATH)
+    parser.add_argument("--max-entries", type=int, default=None, help="keep the most recently used entries")
+    parser.add_argument("--max-age-days", type=float, default=None, help="drop the entries older than that")
+    parser.add_argument("--clear", action="store_true", help="drop every entry")
+
+
+def add_convert_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("source", choices=["files", "pack"])
+    parser.add_argument("destination", choices=["files", "pack"])
+    parser.add_argument("--data-dir", default=f"{ROOT_DIR}/layton-data")
+
+
+# Subcommand: module whose main(args) runs it, description, arguments.
+COMMANDS: t.Dict[str, t.Tuple[str, str, t.Callable[[argparse.ArgumentParser], None]]] = {
+    "crawl": (
+        "layton_eval.get_eng_html",
+        "Download every puzzle page of the Layton wiki to layton-data.",
+        add_crawl_arguments,
+    ),
+    "build": (
+        "layton_eval.scrape_htmls",
+        "Build the Parquet dataset and the annotation workbook from layton-data.",
+        add_build_arguments,
+    ),
+    "export": ("layton_eval.export", "Write the annotation workbook from the Parquet dataset.", add_export_arguments),
+    "structure-input": (
+        "layton_eval.pipeline",
+        "Structure the riddles of the dataset with an LLM.",
+        partial(add_structure_arguments, task="input_structuration"),
+    ),
+    "structure-output": (
+        "layton_eval.pipeline",
+        "Structure the solutions of the dataset into accepted answers with an LLM.",
+        partial(add_structure_arguments, task="answer_structuration"),
+    ),
+    "eval": (
+        "layton_eval.evaluate",
+        "Score model responses against the structured puzzle solutions.",
+        add_eval_arguments,
+    ),
+    "dedup": (
+        "layton_eval.dedup",
+        "Cluster the near-duplicate puzzles of the dataset, e.g. remakes and regional variants.",
+        add_dedup_arguments,
+    ),
+    "cache": ("layton_eval.response_cache", "Inspect, evict or clear the LLM response cache.", add_cache_arguments),
+    "convert": ("layton_eval.storage", "Copy layton-data from a storage backend to another.", add_convert_arguments),
+}
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="layton-eval", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (_, description, add_arguments) in COMMANDS.items():
+        add_arguments(subparsers.add_parser(name, help=description, description=description))
+    return parser
+
+
+def main(argv: t.Sequence[str] | None = None) -> None:
+    args = make_parser().parse_args(argv)
+    importlib.import_module(COMMANDS[args.command][0]).main(args)
@@ -1,4 +1,11 @@
 import os
+import typing as t
 from pathlib import Path
 
 ROOT_DIR = Path(os.path.dirname(os.path.abspath(__file__))).parent.parent
+DATASET_PATH = f"{ROOT_DIR}/layton-data/puzzles.parquet"
+CACHE_PATH = f"{ROOT_DIR}/layton-data/llm-cache.sqlite"
+FANDOM_URL = "https://layton.fandom.com"
+
+ParserBackend = t.Literal["html.parser", "lxml", "html5lib"]
+PARSER_BACKENDS: t.Tuple[ParserBackend, ...] = t.get_args(ParserBackend)
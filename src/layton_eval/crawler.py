@@ -0,0 +1,235 @@
+import hashlib
+import threading
+import time
+import typing as t
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from logging import getLogger
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from layton_eval.constants import FANDOM_URL
+from layton_eval.manifest import CrawlManifest
+from layton_eval.tracing import count, span
+
+log = getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass
+class PuzzlePage:
+    url: str
+    name: str
+    status: int
+    content: bytes | None = None
+    img: bytes | None = None
+    answer_img: bytes | None = None
+    sha256: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+    changed: bool = True
+    failed_images: t.Tuple[str, ...] = ()  # Linked images whose download failed, e.g. "img" or "answer_img".
+
+
+class HostRateLimiter:
+    """
+    Spaces out the requests sent to a given host so that at most `requests_per_second` of them start every second.
+    """
+
+    def __init__(self, requests_per_second: float) -> None:
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot: t.Dict[str, float] = {}
+
+    def wait(self, host: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def back_off(self, host: str, delay: float) -> None:
+        """
+        Pushes back every pending request to the host, used when it answers with a 429.
+        """
+        with self._lock:
+            self._next_slot[host] = max(self._next_slot.get(host, 0.0), time.monotonic() + delay)
+
+
+def get_retry_after(response: requests.Response | None) -> float | None:
+    """
+    Returns the delay requested by the server through the Retry-After header, in seconds.
+    """
+    if response is None or not (value := response.headers.get("Retry-After")):
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Crawler:
+    """
+    Fetches puzzle pages concurrently through a shared connection pool, and downloads their images as soon as the
+    page that references them has been fetched.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        requests_per_second: float = 5.0,
+        max_retries: int = 4,
+        backoff_factor: float = 0.5,
+        timeout: float = 30.0,
+        base_url: str = FANDOM_URL,
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.base_url = base_url
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=2 * max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url: str, headers: t.Dict[str, str] | None = None) -> requests.Response:
+        """
+        GET an url, retrying with exponential backoff on connection errors, 429s and 5xx.
+        The last response is returned when retries are exhausted, the last error is raised if there is none.
+        """
+        host = urlsplit(url).netloc
+        for attempt in range(self.max_retries + 1):
+            with span("http.rate_limit"):
+                self.rate_limiter.wait(host)
+            response, error = None, None
+            with span("http.get", url=url) as get:
+                try:
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                except requests.RequestException as e:
+                    error = e
+                else:
+                    get.set(status=response.status_code, bytes=len(response.content))
+                    count("http.bytes", len(response.content))
+                    if response.status_code not in RETRY_STATUSES:
+                        return response
+            if attempt == self.max_retries:
+                break
+            delay = get_retry_after(response) or self.backoff_factor * 2**attempt
+            if response is not None and response.status_code == 429:
+                self.rate_limiter.back_off(host, delay)
+            log.info(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+            count("http.retries")
+            with span("http.backoff"):
+                time.sleep(delay)
+        if response is not None:
+            return response
+        raise error
+
+    def fetch_image(self, url: str, puzzle_name: str | None = None) -> bytes | None:
+        try:
+            with span("crawl.image", puzzle=puzzle_name):
+                response = self.fetch(url)
+        except requests.RequestException as e:
+            log.info(f"Could not download image at {url}: {e}")
+            return None
+        if response.status_code != 200:
+            log.info(f"Encountered error {response.status_code} while downloading image at {url}")
+            return None
+        return response.content
+
+    def crawl(
+        self,
+        urls: t.Iterable[str],
+        get_image_links: t.Callable[[bytes], t.Tuple[str | None, str | None]],
+        manifest: CrawlManifest | None = None,
+    ) -> t.Iterator[PuzzlePage]:
+        """
+        Yields a PuzzlePage per url, in the order of `urls`. `get_image_links` extracts the puzzle and answer image
+        links from the page content, those images are then fetched in the background while other pages are crawled.
+        At most a few pages per worker are kept in flight so that memory does not grow with the number of urls.
+        When a manifest is given, pages are requested conditionally and those that did not change (304 or same
+        content hash) are yielded with `changed=False` and without downloading their images.
+        """
+        window = 4 * self.max_workers
+        with ThreadPoolExecutor(self.max_workers) as page_pool, ThreadPoolExecutor(self.max_workers) as image_pool:
+            pending: t.Deque[Future] = deque()
+            for url in urls:
+                pending.append(page_pool.submit(self._crawl_page, url, get_image_links, image_pool, manifest))
+                if len(pending) >= window:
+                    yield self._collect(pending.popleft())
+            while pending:
+                yield self._collect(pending.popleft())
+
+    def _crawl_page(
+        self,
+        url: str,
+        get_image_links: t.Callable[[bytes], t.Tuple[str | None, str | None]],
+        image_pool: ThreadPoolExecutor,
+        manifest: CrawlManifest | None = None,
+    ) -> t.Tuple[PuzzlePage, t.List[Future | None]]:
+        page = PuzzlePage(url=url, name=get_puzzle_name(url), status=0)
+        with span("crawl.page", puzzle=page.name):
+            return self._fetch_page(page, get_image_links, image_pool, manifest)
+
+    def _fetch_page(
+        self,
+        page: PuzzlePage,
+        get_image_links: t.Callable[[bytes], t.Tuple[str | None, str | None]],
+        image_pool: ThreadPoolExecutor,
+        manifest: CrawlManifest | None = None,
+    ) -> t.Tuple[PuzzlePage, t.List[Future | None]]:
+        url = page.url
+        try:
+            response = self.fetch(
+                url, headers=manifest.conditional_headers(page.name) if manifest is not None else None
+            )
+        except requests.RequestException as e:
+            log.info(f"Encountered error while navigating to {url}: {e}")
+            return page, []
+        page.status = response.status_code
+        page.etag = response.headers.get("ETag")
+        page.last_modified = response.headers.get("Last-Modified")
+        if response.status_code == 304:
+            page.changed = False
+            return page, []
+        if response.status_code != 200:
+            return page, []
+        page.content = response.content
+        page.sha256 = hashlib.sha256(page.content).hexdigest()
+        if manifest is not None and manifest.is_unchanged(page.name, page.sha256):
+            page.changed = False
+            return page, []
+        image_futures = [
+            image_pool.submit(self.fetch_image, urljoin(url, link), page.name) if link else None
+            for link in get_image_links(page.content)
+        ]
+        return page, image_futures
+
+    @staticmethod
+    def _collect(future: Future) -> PuzzlePage:
+        page, image_futures = future.result()
+        if image_futures:
+            page.img, page.answer_img = (f.result() if f is not None else None for f in image_futures)
+            page.failed_images = tuple(
+                field
+                for field, future in zip(("img", "answer_img"), image_futures)
+                if future is not None and getattr(page, field) is None
+            )
+        return page
+
+
+def get_puzzle_name(url: str) -> str:
+    """
+    Returns the name under which a puzzle is stored in layton-data.
+    """
+    return url.split("Puzzle:")[-1].replace("/", "_")
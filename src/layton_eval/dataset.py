@@ -0,0 +1,121 @@
+import os
+import typing as t
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from layton_eval.constants import DATASET_PATH
+from layton_eval.tracing import span
+
+if t.TYPE_CHECKING:  # pandas is only imported to read the dataset, the build only needs pyarrow.
+    import pandas as pd
+
+SCHEMA = pa.schema(
+    [
+        ("puzzle_name", pa.string()),
+        ("id", pa.string()),
+        ("category", pa.string()),
+        ("description", pa.string()),
+        ("img", pa.string()),
+        ("url", pa.string()),
+        ("picarats", pa.int32()),
+        ("first_hint", pa.string()),
+        ("second_hint", pa.string()),
+        ("third_hint", pa.string()),
+        ("special_hint", pa.string()),
+        ("solution", pa.string()),
+        ("answer_img", pa.string()),
+    ]
+)
+COLUMNS = tuple(name for name in SCHEMA.names if name != "puzzle_name")  # Columns of the annotation workbook.
+
+
+class DatasetWriter:
+    """
+    Writes puzzles to a Parquet file as they are extracted, one row group every `row_group_size` puzzles.
+    The file is written next to its destination and only moved there once complete.
+    """
+
+    def __init__(self, path: str = DATASET_PATH, row_group_size: int = 256) -> None:
+        self.path = path
+        self.row_group_size = row_group_size
+        self.columns: t.Dict[str, t.List] = {name: [] for name in SCHEMA.names}
+        self.writer = pq.ParquetWriter(f"{path}.tmp", SCHEMA, compression="zstd")
+
+    def write(self, row: t.Dict[str, t.Any]) -> None:
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        if len(self.columns["puzzle_name"]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.columns["puzzle_name"]:
+            with span("dataset.row_group", rows=len(self.columns["puzzle_name"])):
+                self.writer.write_table(pa.table(self.columns, schema=SCHEMA))
+            self.columns = {name: [] for name in SCHEMA.names}
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.writer.close()
+            os.remove(f"{self.path}.tmp")
+
+
+def to_pandas(table: pa.Table) -> "pd.DataFrame":
+    """
+    Converts a table read from the dataset, keeping picarats as integers even when some puzzles have none.
+    """
+    import pandas as pd
+
+    return table.to_pandas(types_mapper={pa.int32(): pd.Int32Dtype()}.get)
+
+
+def read_dataset(
+    path: str = DATASET_PATH, columns: t.List[str] | None = None, rows: range | None = None
+) -> "pd.DataFrame":
+    """
+    Reads the given columns of a contiguous range of puzzles, only decoding the row groups that overlap the range.
+    """
+    dataset = pq.ParquetFile(path)
+    if rows is None:
+        return to_pandas(dataset.read(columns=columns))
+    row_groups, first_row, offset = [], None, 0
+    for i in range(dataset.num_row_groups):
+        num_rows = dataset.metadata.row_group(i).num_rows
+        if offset < rows.stop and offset + num_rows > rows.start:
+            row_groups.append(i)
+            first_row = offset if first_row is None else first_row
+        offset += num_rows
+    if not row_groups:
+        return to_pandas(SCHEMA.empty_table().select(columns or SCHEMA.names))
+    table = dataset.read_row_groups(row_groups, columns=columns)
+    return to_pandas(table.slice(rows.start - first_row, len(rows)))
+
+
+def iter_dataset(
+    path: str = DATASET_PATH, columns: t.List[str] | None = None, batch_size: int = 256
+) -> t.Iterator["pd.DataFrame"]:
+    """
+    Yields the puzzles by batches, without loading the whole dataset.
+    """
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+        yield to_pandas(pa.Table.from_batches([batch]))
+
+
+def iter_rows(
+    path: str = DATASET_PATH, columns: t.List[str] | None = None, batch_size: int = 256
+) -> t.Iterator[t.Dict[str, t.Any]]:
+    """
+    Yields the puzzles one by one as dicts of Python values, decoding a single batch at a time.
+    """
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+        yield from batch.to_pylist()
@@ -0,0 +1,177 @@
+import argparse
+import csv
+import os
+import re
+import sys
+import typing as t
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+
+from layton_eval import cli
+from layton_eval.constants import DATASET_PATH
+from layton_eval.dataset import iter_rows
+from layton_eval.images import difference_hash
+from layton_eval.storage import Store, open_store
+from layton_eval.tracing import span, traced_run
+
+MERSENNE_PRIME = (1 << 31) - 1  # Small enough for a * x + b to fit in 64 bits with 32-bit shingle hashes.
+WORD = re.compile(r"\w+")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def shingles(text: str, size: int = 3) -> t.Set[str]:
+    """
+    The word `size`-grams of a text, after folding case and dropping punctuation. Texts shorter than `size` words
+    give a single shingle.
+    """
+    words = WORD.findall(text.casefold())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+@dataclass
+class Representative:
+    signature: np.ndarray
+    numbers: t.Tuple[str, ...]
+    image_hash: int | None
+
+
+class NearDuplicateIndex:
+    """
+    Clusters near-duplicate texts in a single pass. Every text gets a MinHash signature of its word shingles, whose
+    bands are looked up in hash tables holding the cluster representatives: a text joins the most similar
+    representative sharing a band with it, when their estimated Jaccard similarity reaches `threshold`, and becomes
+    a new representative otherwise. Each text is only compared with the few representatives it shares a band with,
+    so the index is built in linear time, and every member is verified against its representative directly, so
+    that the output of the representative can be reused for all its members.
+
+    Puzzle variants that only differ in their numbers are different puzzles, so texts whose numbers differ are
+    never clustered, and neither are texts whose image hashes are more than `max_image_distance` bits apart.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 32,
+        shingle_size: int = 3,
+        max_image_distance: int = 10,
+        seed: int = 0,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.max_image_distance = max_image_distance
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._buckets: t.Dict[t.Tuple[int, bytes], t.List[str]] = {}
+        self._representatives: t.Dict[str, Representative] = {}
+        self.representative: t.Dict[str, str] = {}  # Every key added, to the representative of its cluster.
+        self.similarity: t.Dict[str, float] = {}  # Estimated similarity of every member with its representative.
+
+    def signature(self, text: str) -> np.ndarray | None:
+        hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(text, self.shingle_size)]
+        if not hashes:
+            return None
+        values = np.array(hashes, dtype=np.uint64)[None, :]
+        return ((self._a * values + self._b) % MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+    def add(self, key: str, text: str, image_hash: int | None = None) -> str:
+        """
+        Adds a text to the index and returns the representative of its cluster, `key` itself when it starts one.
+        """
+        self.representative[key] = key
+        if (signature := self.signature(text)) is None:
+            return key
+        numbers = tuple(NUMBER.findall(text))
+        band_keys = [(band, rows.tobytes()) for band, rows in enumerate(signature.reshape(self.bands, -1))]
+        candidates = dict.fromkeys(candidate for band_key in band_keys for candidate in self._buckets.get(band_key, ()))
+        best, best_similarity = None, 0.0
+        for candidate in candidates:
+            representative = self._representatives[candidate]
+            if representative.numbers != numbers or not self._images_match(representative.image_hash, image_hash):
+                continue
+            similarity = float(np.mean(representative.signature == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None:
+            self.representative[key] = best
+            self.similarity[key] = best_similarity
+            return best
+        self._representatives[key] = Representative(signature, numbers, image_hash)
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(key)
+        return key
+
+    def _images_match(self, first: int | None, second: int | None) -> bool:
+        return first is None or second is None or (first ^ second).bit_count() <= self.max_image_distance
+
+    def clusters(self) -> t.Dict[str, t.List[str]]:
+        """
+        The clusters with more than one member, from their representative to their members, representative first.
+        """
+        members: t.Dict[str, t.List[str]] = {}
+        for key, representative in self.representative.items():
+            members.setdefault(representative, []).append(key)
+        return {representative: keys for representative, keys in members.items() if len(keys) > 1}
+
+    def duplicates(self) -> t.Dict[str, str]:
+        """
+        Every key that is not the representative of its cluster, to that representative.
+        """
+        return {key: representative for key, representative in self.representative.items() if key != representative}
+
+    def __len__(self) -> int:
+        return len(self.representative)
+
+
+def build_index(
+    dataset_path: str = DATASET_PATH,
+    fields: t.Sequence[str] = ("description",),
+    image_store: Store | None = None,
+    **index_kwargs,
+) -> NearDuplicateIndex:
+    """
+    Indexes the puzzles of the dataset having all the `fields`, in the order of the dataset so that the first
+    version of a puzzle represents its cluster. With an `image_store`, the puzzle images must match as well.
+    """
+    index = NearDuplicateIndex(**index_kwargs)
+    with span("dedup.index"):
+        for row in iter_rows(dataset_path, columns=["puzzle_name", *fields]):
+            if any(row[field] is None for field in fields):
+                continue
+            name = row["puzzle_name"]
+            image_hash = (
+                difference_hash(image_store.get(name)) if image_store is not None and name in image_store else None
+            )
+            index.add(name, "\n".join(row[field] for field in fields), image_hash)
+    return index
+
+
+def main(args: argparse.Namespace) -> None:
+    with traced_run(args.trace):
+        image_store = open_store("images", args.storage) if args.images else None
+        index = build_index(
+            args.dataset, args.fields, image_store, threshold=args.threshold, max_image_distance=args.max_image_distance
+        )
+        clusters = index.clusters()
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["puzzle_name", "representative", "similarity"])
+            for representative, members in clusters.items():
+                for member in members:
+                    writer.writerow([member, representative, f"{index.similarity.get(member, 1.0):.3f}"])
+        duplicates = sum(len(members) - 1 for members in clusters.values())
+        print(f"{len(index)} puzzles, {len(clusters)} clusters of near-duplicates, {duplicates} puzzles to skip")
+        print(f"clusters written to {args.output}")
+
+
+if __name__ == "__main__":
+    cli.main(["dedup", *sys.argv[1:]])
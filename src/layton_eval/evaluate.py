@@ -0,0 +1,236 @@
+import argparse
+import json
+import re
+import sys
+import typing as t
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+from layton_eval import cli
+from layton_eval.dataset import read_dataset
+
+MatchMode = t.Literal["exact", "contains"]
+UNITS = {
+    word: value
+    for value, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen "
+        "seventeen eighteen nineteen".split()
+    )
+}
+TENS = {
+    word: 10 * value for value, word in enumerate("twenty thirty forty fifty sixty seventy eighty ninety".split(), 2)
+}
+SCALES = {"thousand": 1000, "million": 1000000}
+THOUSANDS_SEPARATOR = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+NON_DECIMAL_POINT = re.compile(r"(?<!\d)\.|\.(?!\d)")
+PUNCTUATION = re.compile(r"[^\w.]|_")
+
+
+def parse_number_words(tokens: t.List[str], start: int) -> t.Tuple[int, int] | None:
+    """
+    Reads a number written in words from `tokens[start:]`, e.g. "two hundred and forty five", and returns its
+    value with the position of the first token after it, or None when there is no number there.
+    """
+    total, current, last = 0, 0, None
+    position = start
+    while position < len(tokens):
+        word = tokens[position]
+        if word in UNITS and (last in (None, "hundred", "scale") or (last == "tens" and UNITS[word] < 10)):
+            current, last = current + UNITS[word], "unit"
+        elif word in TENS and last in (None, "hundred", "scale"):
+            current, last = current + TENS[word], "tens"
+        elif word == "hundred" and last in ("unit", "tens") and current < 100:
+            current, last = current * 100, "hundred"
+        elif word in SCALES and last in ("unit", "tens", "hundred"):
+            total, current, last = total + current * SCALES[word], 0, "scale"
+        elif not (
+            word == "and"
+            and last in ("hundred", "scale")
+            and position + 1 < len(tokens)
+            and (tokens[position + 1] in UNITS or tokens[position + 1] in TENS)
+        ):
+            break
+        position += 1
+    if last is None:
+        return None
+    return total + current, position
+
+
+@lru_cache(maxsize=1 << 16)
+def normalize_answer(text: str) -> str:
+    """
+    Folds the spellings of an answer onto a single one: case and unicode forms are folded, punctuation is dropped
+    except decimal points, whitespace is collapsed, and numbers written in words or with thousands separators are
+    written in digits, so that "Forty-two!", " 42 " and "forty two" all give "42".
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().replace("%", " percent ")
+    text = PUNCTUATION.sub(" ", NON_DECIMAL_POINT.sub(" ", THOUSANDS_SEPARATOR.sub("", text)))
+    tokens = text.split()
+    normalized = []
+    position = 0
+    while position < len(tokens):
+        if (number := parse_number_words(tokens, position)) is not None:
+            normalized.append(str(number[0]))
+            position = number[1]
+        else:
+            normalized.append(tokens[position])
+            position += 1
+    return " ".join(normalized)
+
+
+class AnswerIndex:
+    """
+    The normalized accepted answers of every puzzle, compiled once into a set of (puzzle, answer) pairs so that
+    scoring a response is a set lookup. For "contains" matching, the word counts of the accepted answers of each
+    puzzle are kept as well, so that only the word n-grams of the response that could be an answer are looked up.
+    """
+
+    def __init__(self, answers: t.Mapping[str, t.Iterable[str]]) -> None:
+        self.pairs: t.Set[t.Tuple[str, str]] = set()
+        self.lengths: t.Dict[str, t.FrozenSet[int]] = {}
+        for puzzle_name, spellings in answers.items():
+            normalized = {normalize_answer(spelling) for spelling in spellings if isinstance(spelling, str)}
+            normalized.discard("")
+            if not normalized:
+                continue
+            self.pairs.update((puzzle_name, answer) for answer in normalized)
+            self.lengths[puzzle_name] = frozenset(len(answer.split()) for answer in normalized)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, column: str = "structured_solution") -> "AnswerIndex":
+        """
+        Builds the index from the output of the answer_structuration pipeline, one list of spellings per puzzle.
+        """
+        return cls(
+            {
+                puzzle_name: list(spellings) if spellings is not None else []
+                for puzzle_name, spellings in zip(frame["puzzle_name"], frame[column])
+            }
+        )
+
+    def __contains__(self, puzzle_name: str) -> bool:
+        return puzzle_name in self.lengths
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def contains(self, puzzle_name: str, normalized: str) -> bool:
+        """
+        Whether an accepted answer of the puzzle appears as a whole in a normalized response.
+        """
+        tokens = normalized.split()
+        return any(
+            (puzzle_name, " ".join(tokens[start : start + length])) in self.pairs
+            for length in self.lengths.get(puzzle_name, ())
+            for start in range(len(tokens) - length + 1)
+        )
+
+    def is_correct(self, puzzle_name: str, response: t.Any, match: MatchMode = "exact") -> bool:
+        if not isinstance(response, str):
+            return False
+        normalized = normalize_answer(response)
+        if (puzzle_name, normalized) in self.pairs:
+            return True
+        return match == "contains" and self.contains(puzzle_name, normalized)
+
+
+def score_responses(index: AnswerIndex, responses: pd.DataFrame, match: MatchMode = "exact") -> pd.DataFrame:
+    """
+    Adds to the responses (puzzle_name, model, answer) whether their puzzle has accepted answers, `scored`, and
+    whether the answer is one of them, `correct`. Every distinct answer is normalized once, and exact matches are
+    looked up for the whole batch at once.
+    """
+    scored = responses.copy()
+    normalized = {answer: normalize_answer(answer) for answer in pd.unique(scored["answer"]) if isinstance(answer, str)}
+    scored["normalized"] = scored["answer"].map(
+        lambda answer: normalized.get(answer) if isinstance(answer, str) else None
+    )
+    scored["scored"] = scored["puzzle_name"].isin(index.lengths.keys())
+    scored["correct"] = pd.MultiIndex.from_arrays([scored["puzzle_name"], scored["normalized"]]).isin(index.pairs)
+    if match == "contains":
+        rest = scored["scored"] & ~scored["correct"] & scored["normalized"].notna()
+        scored.loc[rest, "correct"] = [
+            index.contains(puzzle_name, text)
+            for puzzle_name, text in zip(scored.loc[rest, "puzzle_name"], scored.loc[rest, "normalized"])
+        ]
+    return scored
+
+
+def picarat_bucket(picarats: pd.Series, width: int = 10) -> pd.Series:
+    low = (picarats // width * width).astype("Int64")  # Puzzles without picarats make the column float.
+    return (low.astype("string") + "-" + (low + width - 1).astype("string")).fillna("unknown")
+
+
+def accuracy_tables(
+    scored: pd.DataFrame, dataset: pd.DataFrame | None = None, picarat_width: int = 10
+) -> t.Dict[str, pd.DataFrame]:
+    """
+    Accuracy of every model overall, with its numbers of scored and correct responses, and per category and per
+    picarat bucket of `picarat_width`, as tables with one column per model. Responses to puzzles without accepted
+    answers are left out.
+    """
+    scored = scored[scored["scored"]]
+    tables = {
+        "model": scored.groupby("model")["correct"]
+        .agg(responses="size", correct="sum", accuracy="mean")
+        .sort_values("accuracy", ascending=False)
+    }
+    if dataset is not None:
+        scored = scored.merge(dataset[["puzzle_name", "category", "picarats"]], on="puzzle_name", how="left")
+        scored["category"] = scored["category"].fillna("unknown")
+        scored["picarats"] = picarat_bucket(scored["picarats"], picarat_width)
+        for column in ("category", "picarats"):
+            tables[column] = scored.pivot_table(index=column, columns="model", values="correct", aggfunc="mean")
+    return tables
+
+
+def read_answers(path: str) -> pd.DataFrame:
+    """
+    Reads the structured solutions written by the answer_structuration pipeline, its Parquet output or its JSON
+    lines checkpoint.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=["puzzle_name", "structured_solution"])
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:  # Last line of an interrupted run.
+                continue
+            output = record["output"] if isinstance(record["output"], dict) else {}
+            records.append({"puzzle_name": record["puzzle_name"], "structured_solution": output.get("structured")})
+    return pd.DataFrame(records, columns=["puzzle_name", "structured_solution"])
+
+
+def read_responses(paths: t.Iterable[str]) -> pd.DataFrame:
+    """
+    Reads model responses from JSON lines or Parquet files with a `puzzle_name` and an `answer` column. Files
+    without a `model` column hold the responses of a single model, named after the file.
+    """
+    frames = []
+    for path in paths:
+        frame = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_json(path, lines=True, dtype=False)
+        if "model" not in frame:
+            frame["model"] = Path(path).stem
+        frames.append(frame[["puzzle_name", "model", "answer"]])
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(args: argparse.Namespace) -> None:
+    index = AnswerIndex.from_frame(read_answers(args.answers))
+    scored = score_responses(index, read_responses(args.responses), args.match)
+    dataset = read_dataset(args.dataset, columns=["puzzle_name", "category", "picarats"])
+    tables = accuracy_tables(scored, dataset, args.picarat_width)
+    for name, table in tables.items():
+        print(f"accuracy per {name}:\n{table.to_string(float_format='{:.3f}'.format)}\n")
+        if args.output is not None:
+            table.to_csv(f"{args.output}-{name}.csv")
+    print(f"{int(scored['scored'].sum())} of {len(scored)} responses scored, on {len(index)} puzzles with answers")
+
+
+if __name__ == "__main__":
+    cli.main(["eval", *sys.argv[1:]])
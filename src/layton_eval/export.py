@@ -0,0 +1,151 @@
+import argparse
+import sys
+import tempfile
+import typing as t
+
+import xlsxwriter
+
+from layton_eval import cli
+from layton_eval.constants import ROOT_DIR
+from layton_eval.dataset import COLUMNS, DATASET_PATH, iter_rows
+from layton_eval.images import ImageMetaIndex
+from layton_eval.storage import FileStore, Store, open_stores
+from layton_eval.tracing import span, traced_run
+
+IMAGE_COLUMNS = {"img": "images", "answer_img": "answer_images"}
+COLUMN_PIXELS = {
+    "category": 150,
+    "description": 1100,
+    "img": 350,
+    "url": 400,
+    "first_hint": 900,
+    "second_hint": 900,
+    "third_hint": 900,
+    "special_hint": 900,
+    "solution": 1000,
+    "answer_img": 350,
+}
+HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}  # Same as pandas' `to_excel`.
+ROW_HEIGHT = 262.5  # 350 pixels.
+HEADER_HEIGHT = 15.75  # xlsxwriter does not write heights equal to Excel's original default of 15.
+
+
+def insert_store_image(
+    worksheet, row: int, col: int, store: Store, puzzle_name: str, options: t.Dict, spill_dir: str
+) -> None:
+    """
+    Inserts a puzzle image in the workbook. xlsxwriter only reads images when the workbook is closed, so images
+    which are not loose files are spilled to a file of `spill_dir` rather than kept in memory until then.
+    """
+    if isinstance(store, FileStore):
+        worksheet.insert_image(row, col, store.path(puzzle_name), options)
+        return
+    with tempfile.NamedTemporaryFile(dir=spill_dir, suffix=".jpg", delete=False) as f:
+        f.write(store.get(puzzle_name))
+    worksheet.insert_image(row, col, f.name, options)
+
+
+class WorkbookWriter:
+    """
+    Writes the annotation workbook one puzzle at a time, in xlsxwriter's constant_memory mode: each row is flushed
+    to disk with its cells, link and images as soon as the next one is written, so that memory does not grow with
+    the number of puzzles. Rows must therefore be written in order. The row height is set once as the sheet default
+    and links are HYPERLINK formulas, since xlsxwriter keeps per-row heights and `write_url` links until closing.
+    Without thumbnails, the images of packed stores are spilled to a temporary directory, removed on closing.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        stores: t.Dict[str, Store],
+        image_meta: ImageMetaIndex,
+        thumbnails: bool = True,
+    ) -> None:
+        self.stores = stores
+        self.image_meta = image_meta
+        self.thumbnails = thumbnails
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        self.spill_dir = tempfile.TemporaryDirectory(prefix="layton-images-")
+        self.worksheet = self.workbook.add_worksheet()
+        self.row = 0
+        self.link_format = self.workbook.get_default_url_format()
+        self.worksheet.set_default_row(ROW_HEIGHT)
+        self.worksheet.set_row(0, HEADER_HEIGHT)
+        for col, column in enumerate(COLUMNS):
+            if column in COLUMN_PIXELS:
+                self.worksheet.set_column_pixels(col, col, COLUMN_PIXELS[column])
+        header_format = self.workbook.add_format(HEADER_FORMAT)
+        for col, column in enumerate(COLUMNS):
+            self.worksheet.write_string(0, col, column, header_format)
+
+    def write(self, row: t.Dict[str, t.Any]) -> None:
+        with span("excel.row", puzzle=row["puzzle_name"]):
+            self.row += 1
+            for col, column in enumerate(COLUMNS):
+                value = row[column]
+                if value is None:
+                    continue
+                if column == "url":
+                    link = value.replace('"', '""')
+                    self.worksheet.write_formula(self.row, col, f'=HYPERLINK("{link}")', self.link_format, value)
+                    continue
+                self.worksheet.write(self.row, col, value)
+                if column in IMAGE_COLUMNS:
+                    self.insert_image(col, IMAGE_COLUMNS[column], row["puzzle_name"])
+
+    def insert_image(self, col: int, kind: str, puzzle_name: str) -> None:
+        if self.thumbnails:
+            self.worksheet.insert_image(self.row, col, self.image_meta.thumbnail_path(kind, puzzle_name))
+            return
+        width, height = self.image_meta.size(kind, puzzle_name, self.stores[kind])
+        options = {"x_scale": 350 / width, "y_scale": 350 / height}
+        insert_store_image(self.worksheet, self.row, col, self.stores[kind], puzzle_name, options, self.spill_dir.name)
+
+    def close(self) -> None:
+        with span("excel.close"):
+            try:
+                self.workbook.close()
+            finally:
+                self.spill_dir.cleanup()
+
+    def __enter__(self) -> "WorkbookWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def export_workbook(
+    dataset_path: str = DATASET_PATH,
+    workbook_path: str = f"{ROOT_DIR}/layton-annotations.xlsx",
+    storage: t.Literal["files", "pack"] = "files",
+    data_dir: str = f"{ROOT_DIR}/layton-data",
+    thumbnails: bool = True,
+    workers: int = 1,
+) -> None:
+    """
+    Writes the annotation workbook from the Parquet dataset, streaming the puzzles batch by batch.
+    """
+    stores = open_stores(storage, data_dir)
+    image_meta = ImageMetaIndex(data_dir)
+    if thumbnails:
+        puzzle_names = [row["puzzle_name"] for row in iter_rows(dataset_path, columns=["puzzle_name"])]
+        for kind in IMAGE_COLUMNS.values():
+            image_meta.make_thumbnails(kind, puzzle_names, storage, workers=workers)
+    with WorkbookWriter(workbook_path, stores, image_meta, thumbnails) as writer:
+        for row in iter_rows(dataset_path):
+            writer.write(row)
+    image_meta.save()
+    for store in stores.values():
+        store.close()
+
+
+def main(args: argparse.Namespace) -> None:
+    with traced_run(args.trace):
+        export_workbook(
+            args.dataset, args.output, storage=args.storage, thumbnails=not args.no_thumbnails, workers=args.workers
+        )
+
+
+if __name__ == "__main__":
+    cli.main(["export", *sys.argv[1:]])
@@ -0,0 +1,231 @@
+import typing as t
+from dataclasses import dataclass, field
+
+import bs4
+from bs4 import BeautifulSoup
+
+from layton_eval.tracing import span
+
+type2color = {"1": "#E8E8B8", "2": "#C8E8C0", "3": "#C8F0E0", "Special": "#F0C7A7"}
+HINT_STYLE = "height:200px; overflow-y:auto; overflow-x:hidden; word-wrap:break-word; overflow: -moz-scrollbars-vertical; line-height:normal; border: 2px solid black; padding:3px; background:{}; font-size:14px"
+NAVBOX_CLASSES = {"navbox", "mw-collapsible", "mw-collapsed"}
+INFOBOX_VALUE_CLASSES = {"pi-data-value", "pi-font"}
+
+
+@dataclass
+class PuzzleRecord:
+    puzzle_id: str | None
+    category: str | None
+    picarats: int | None
+    description: str | bs4.element.Tag | None
+    solution: str | None
+    hints: t.Dict[str, str] = field(default_factory=dict)
+
+
+def is_bare_tag(element: bs4.element.Tag, name: str) -> bool:
+    """
+    Same as `str(element).startswith(f"<{name}>")` without serializing the whole element.
+    """
+    return element.name == name and not element.attrs and not element.prefix
+
+
+class PuzzleIndex:
+    """
+    Walks the soup once and keeps every anchor the puzzle fields are extracted from: the elements carrying an id,
+    the infobox `data-source` items, the hint boxes and the navbox, as well as the document order of every tag.
+    The extraction methods give the same results as CSS selectors and `find_next` walks from the document root.
+    """
+
+    def __init__(self, soup: BeautifulSoup) -> None:
+        self.tags: t.List[bs4.element.Tag] = []
+        self.positions: t.Dict[int, int] = {}
+        self.ids: t.Dict[str, bs4.element.Tag] = {}
+        self.data_sources: t.Dict[str, t.List[bs4.element.Tag]] = {}
+        self.styles: t.Dict[str, t.List[bs4.element.Tag]] = {}
+        self.navboxes: t.List[bs4.element.Tag] = []
+        self.reached_end = False
+        for element in soup.descendants:
+            if not isinstance(element, bs4.element.Tag):
+                continue
+            self.positions[id(element)] = len(self.tags)
+            self.tags.append(element)
+            attrs = element.attrs
+            if not attrs:
+                continue
+            if "id" in attrs and attrs["id"] not in self.ids:
+                self.ids[attrs["id"]] = element
+            if "data-source" in attrs:
+                self.data_sources.setdefault(attrs["data-source"], []).append(element)
+            if "style" in attrs:
+                self.styles.setdefault(attrs["style"], []).append(element)
+            if "class" in attrs and NAVBOX_CLASSES.issubset(attrs["class"]):
+                self.navboxes.append(element)
+
+    def find_next(self, element: bs4.element.Tag) -> bs4.element.Tag | None:
+        position = self.positions[id(element)] + 1
+        if position < len(self.tags):
+            return self.tags[position]
+        self.reached_end = True
+        return None
+
+    @staticmethod
+    def first_descendant(
+        containers: t.List[bs4.element.Tag], predicate: t.Callable[[bs4.element.Tag], bool]
+    ) -> bs4.element.Tag | None:
+        """
+        Returns the first tag, in document order, matching `predicate` and nested in one of the containers.
+        """
+        for container in containers:
+            for element in container.descendants:
+                if isinstance(element, bs4.element.Tag) and predicate(element):
+                    return element
+        return None
+
+    def infobox_value(self, data_source: str) -> bs4.element.Tag | None:
+        return self.first_descendant(
+            self.data_sources.get(data_source, []),
+            lambda tag: INFOBOX_VALUE_CLASSES.issubset(tag.attrs.get("class", ())),
+        )
+
+    def category(self) -> str | None:
+        if (link := self.first_descendant(self.data_sources.get("type", []), lambda tag: tag.name == "a")) is not None:
+            return link.attrs["title"].split(":").pop()
+
+    def picarats(self) -> int | None:
+        if tag := self.infobox_value("picarats"):
+            return int(tag.contents[0])
+
+    def puzzle_id(self) -> str | None:
+        if (tag := self.infobox_value("number")) is not None:
+            return str(tag.contents[0])  # A NavigableString would keep the whole soup alive through its parents.
+
+    def description(self) -> t.List[str] | str | None:
+        puzzle_element = self.ids.get("Puzzle")
+        hints_element = self.ids.get("Hints")
+        solution_element = self.ids.get("Solution")
+
+        # Collect everything between Puzzle and Hints
+        nodes_between_elements = []
+        if puzzle_element is None:  # Some RW Puzzles do not have a Puzzle section.
+            return
+        current_element = self.find_next(puzzle_element)
+
+        has_images = False
+        dl_encountered = 0
+        while (current_element and self.find_next(current_element) not in [hints_element, solution_element]) and (
+            dl_encountered < 2
+        ):
+            if is_bare_tag(current_element, "p"):
+                clean_content = ""
+                for elem in current_element.contents:
+                    if str(elem).startswith('''<a class="image"'''):
+                        nodes_between_elements.append(current_element)
+                        has_images = True
+                    elif isinstance(elem, bs4.element.NavigableString):
+                        clean_content += elem
+                    else:
+                        for c in elem.contents:
+                            if str(c) != "<br/>" and not str(c).startswith("<img"):
+                                clean_content += c
+                nodes_between_elements.append(clean_content)
+            elif is_bare_tag(current_element, "dl"):
+                dl_encountered += 1
+            current_element = self.find_next(current_element)
+        if has_images:
+            return nodes_between_elements[0]
+        else:
+            return "\n".join(nodes_between_elements)
+
+    def solution(self) -> str | None:
+        correct_element = self.ids.get("Correct")
+        navbox_element = self.first_descendant(self.navboxes, lambda tag: tag.name == "tbody")
+        nodes_between_elements = []
+        if correct_element is None:
+            return
+        current_element = self.find_next(correct_element)
+        dl_encountered = 0
+        while (current_element and self.find_next(current_element) != navbox_element) and dl_encountered < 2:
+            if is_bare_tag(current_element, "p"):
+                clean_content = ""
+                for elem in current_element.contents:
+                    if str(elem).startswith('''<a class="image"'''):
+                        nodes_between_elements.append(current_element)
+                    elif isinstance(elem, bs4.element.NavigableString):
+                        clean_content += elem
+                    else:
+                        for c in elem.contents:
+                            if str(c) != "<br/>" and not str(c).startswith("<img"):
+                                clean_content += c
+                nodes_between_elements.append(clean_content)
+            elif is_bare_tag(current_element, "dl"):
+                dl_encountered += 1
+            elif is_bare_tag(current_element, "i"):  # No solution documented
+                return
+            current_element = self.find_next(current_element)
+        return "\n".join(nodes_between_elements)
+
+    def hint(self, hint_type: t.Literal["1", "2", "3", "Special"]) -> str:
+        boxes = self.styles.get(HINT_STYLE.format(type2color.get(hint_type, None)), [])
+        # Paragraphs directly following a <dl> of a hint box: the k-th chunk of the hint is the first paragraph,
+        # in document order, that is k-th after its <dl>, i.e. what the `dl+p+...+p` selectors used to match.
+        runs = []
+        for dl in self.unique_sorted(dl for box in boxes for dl in box.find_all("dl")):
+            run = []
+            for sibling in dl.next_siblings:
+                if not isinstance(sibling, bs4.element.Tag):
+                    continue
+                if sibling.name != "p":
+                    break
+                run.append(sibling)
+            runs.append(run)
+        hint = ""
+        k = 0
+        while candidates := [run[k] for run in runs if len(run) > k]:
+            h = min(candidates, key=lambda tag: self.positions[id(tag)])
+            for c in h.contents:
+                hint += str(c)
+            k += 1
+        if hint:
+            return hint
+        else:
+            hint = self.unique_sorted(p for box in boxes for p in box.find_all("p"))
+            clean_content = ""
+            for h in hint:
+                if isinstance(h, bs4.element.NavigableString):
+                    clean_content += h
+                else:
+                    for c in h.contents:
+                        if isinstance(c, bs4.element.NavigableString):
+                            clean_content += c
+                        elif str(c) == "<br/>":
+                            clean_content += "\n"
+                        elif str(c).startswith("<img") or str(c).startswith("<a"):
+                            continue
+                        else:
+                            clean_content += c.contents[0]
+            return clean_content
+
+    def record(self) -> PuzzleRecord:
+        fields = {}
+        for name, extract in (
+            ("puzzle_id", self.puzzle_id),
+            ("category", self.category),
+            ("picarats", self.picarats),
+            ("description", self.description),
+            ("solution", self.solution),
+        ):
+            with span(f"extract.{name}"):
+                fields[name] = extract()
+        with span("extract.hints"):
+            fields["hints"] = {hint_type: self.hint(hint_type) for hint_type in type2color}
+        return PuzzleRecord(**fields)
+
+    def unique_sorted(self, tags: t.Iterable[bs4.element.Tag]) -> t.List[bs4.element.Tag]:
+        return sorted({id(tag): tag for tag in tags}.values(), key=lambda tag: self.positions[id(tag)])
+
+
+def extract_puzzle(soup: BeautifulSoup) -> PuzzleRecord:
+    """
+    Extracts every field of a puzzle page with a single walk over the soup.
+    """
+    return PuzzleIndex(soup).record()
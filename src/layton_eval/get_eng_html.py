@@ -1,79 +1,181 @@
+import argparse
 import os
+import sys
+import time
 import typing as t
+from functools import partial
 from io import BytesIO
 from logging import getLogger
+from urllib.parse import urljoin
 
-import numpy as np
 import requests
 from bs4 import BeautifulSoup
-from constants import ROOT_DIR
 from PIL import Image
 from tqdm import tqdm
 
+from layton_eval import cli
+from layton_eval.constants import ROOT_DIR
+from layton_eval.crawler import Crawler, PuzzlePage, get_puzzle_name
+from layton_eval.manifest import CrawlManifest, ManifestEntry
+from layton_eval.parsing import ParserBackend, make_soup
+from layton_eval.storage import Store, open_stores
+from layton_eval.tracing import span, traced_run
+
 log = getLogger(__name__)
 
 
-def get_all_links(url: str) -> t.List[str]:
-    content = requests.get(url).content
-    soup = BeautifulSoup(content, "html.parser")
-    links = []
-    for link in soup.find_all("a"):  # find all links
-        if link.has_attr("href"):
-            href = link["href"]
-            if href and not href.startswith("#") and href.startswith("/wiki/Puzzle:") and href not in links:
-                links.append(href)
-    next_button = soup.select_one(".category-page__pagination-next")
+def get_all_links(url: str, crawler: Crawler | None = None) -> t.List[str]:
+    with span("crawl.category_page", url=url):
+        content = crawler.fetch(url).content if crawler is not None else requests.get(url).content
+        soup = BeautifulSoup(content, "html.parser")
+        links = []
+        for link in soup.find_all("a"):  # find all links
+            if link.has_attr("href"):
+                href = link["href"]
+                if href and not href.startswith("#") and href.startswith("/wiki/Puzzle:") and href not in links:
+                    links.append(href)
+        next_button = soup.select_one(".category-page__pagination-next")
     return links, next_button
 
 
+def get_puzzle_image_links(soup: BeautifulSoup) -> t.Tuple[str | None, str | None]:
+    """
+    Returns the links to the game frame associated to a puzzle and to its answer (when applicable).
+    """
+    if (thumbnail := soup.select_one(".image.image-thumbnail")) is None:
+        return None, None
+    answer_img = soup.select_one(f"""[alt="{thumbnail.attrs["title"] + "S"}"]""")
+    answer_link = answer_img.attrs.get("data-src", answer_img.attrs.get("src")) if answer_img is not None else None
+    return thumbnail.attrs["href"], answer_link
+
+
 def get_puzzle_images(soup: BeautifulSoup) -> Image:
     """
     Returns the game frame associated to a puzzle and its answer (when applicable).
     """
-    if soup.select_one(".image.image-thumbnail") is not None:
-        img = Image.open(BytesIO(requests.get(soup.select_one(".image.image-thumbnail").attrs["href"]).content))
-        answer_img = soup.select_one(f"""[alt="{soup.select_one(".image.image-thumbnail").attrs["title"] + "S"}"]""")
-        if answer_img is not None:
-            link = answer_img.attrs.get("data-src", answer_img.attrs.get("src"))
-            answer_img = Image.open(BytesIO(requests.get(link).content))
-        return img, answer_img
-    else:
+    link, answer_link = get_puzzle_image_links(soup)
+    if link is None:
         return None, None
+    img = Image.open(BytesIO(requests.get(link).content))
+    answer_img = Image.open(BytesIO(requests.get(answer_link).content)) if answer_link is not None else None
+    return img, answer_img
 
 
-if __name__ == "__main__":
+def get_riddle_urls(crawler: Crawler) -> t.List[str]:
+    """
+    Walks through the paginated puzzle category and returns the url of every puzzle.
+    """
     riddle_urls = []
-    url = "https://layton.fandom.com/wiki/Category:All_Puzzles"
+    url = urljoin(crawler.base_url, "/wiki/Category:All_Puzzles")
     keep_going = True
     while keep_going:
-        riddle_links, next_button = get_all_links(url)
+        riddle_links, next_button = get_all_links(url, crawler)
         riddle_urls.extend(riddle_links)
         keep_going = next_button is not None
         if keep_going:
-            url = next_button.attrs["href"]
-    riddle_urls = list(np.unique(riddle_urls))
+            url = urljoin(url, next_button.attrs["href"])
+    riddle_urls = sorted(set(riddle_urls))
     log.info(f"Extracted {len(riddle_urls)} riddles.")
-    riddle_urls = [f"https://layton.fandom.com{url}" for url in riddle_urls]
-    os.makedirs(f"{ROOT_DIR}/layton-data", exist_ok=True)
-    os.makedirs(f"{ROOT_DIR}/layton-data/htmls", exist_ok=True)
-    os.makedirs(f"{ROOT_DIR}/layton-data/images", exist_ok=True)
-    os.makedirs(f"{ROOT_DIR}/layton-data/answer_images", exist_ok=True)
-    for url in tqdm(riddle_urls):
-        response = requests.get(url)
-        if response.status_code == 200:
-            content = response.content
-            soup = BeautifulSoup(content, 'html.parser')
-            img, answer_img = get_puzzle_images(soup)
-            puzzle_name = url.split("Puzzle:")[-1].replace("/", "_")
-            with open(f"{ROOT_DIR}/layton-data/htmls/{puzzle_name}.html", "wb") as f:
-                f.write(content)
-            if img is not None:
-                img.convert("RGB").save(f"{ROOT_DIR}/layton-data/images/{puzzle_name}.jpg")
-            else:
-                log.info(f"No img found for puzzle at: {url}")
-            if answer_img is not None:
-                answer_img.convert("RGB").save(f"{ROOT_DIR}/layton-data/answer_images/{puzzle_name}.jpg")
-            else:
-                log.info(f"No answer_img found for puzzle at: {url}")
-        else:
-            log.info(f"Encountered error while navigating to {url}")
+    return [urljoin(crawler.base_url, url) for url in riddle_urls]
+
+
+def to_jpeg(content: bytes) -> bytes:
+    with span("image.to_jpeg"):
+        buffer = BytesIO()
+        Image.open(BytesIO(content)).convert("RGB").save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+
+def save_puzzle_page(page: PuzzlePage, stores: t.Dict[str, Store]) -> None:
+    """
+    Writes a crawled page and its images to the layton-data stores.
+    """
+    with span("store.page", puzzle=page.name):
+        stores["htmls"].put(page.name, page.content)
+        if page.img is not None:
+            stores["images"].put(page.name, to_jpeg(page.img))
+        elif "img" not in page.failed_images:
+            log.info(f"No img found for puzzle at: {page.url}")
+        if page.answer_img is not None:
+            stores["answer_images"].put(page.name, to_jpeg(page.answer_img))
+        elif "answer_img" not in page.failed_images:
+            log.info(f"No answer_img found for puzzle at: {page.url}")
+
+
+def get_urls_to_crawl(riddle_urls: t.List[str], manifest: CrawlManifest, html_store: Store) -> t.List[str]:
+    """
+    Drops the pages already fetched by an interrupted run, and forgets the pages whose local copy was removed so
+    that they get downloaded again instead of being requested conditionally.
+    """
+    resume_since = manifest.interrupted_run_started_at()
+    urls = []
+    for url in riddle_urls:
+        entry = manifest.entries.get(get_puzzle_name(url))
+        if entry is not None and entry.name not in html_store:
+            manifest.forget(entry.name)
+        elif entry is not None and resume_since is not None and entry.fetched_at >= resume_since:
+            continue
+        urls.append(url)
+    if resume_since is not None:
+        log.info(f"Resuming interrupted crawl, {len(riddle_urls) - len(urls)} pages already fetched.")
+    return urls
+
+
+def get_page_image_links(content: bytes, backend: ParserBackend = "html.parser") -> t.Tuple[str | None, str | None]:
+    """
+    Returns the image links of a raw page, only parsing its article body unless the images are not found there.
+    """
+    if (links := get_puzzle_image_links(make_soup(content, backend, subtree_only=True)))[0] is not None:
+        return links
+    return get_puzzle_image_links(make_soup(content, backend))
+
+
+def main(args: argparse.Namespace) -> None:
+    with traced_run(args.trace):
+        crawler = Crawler(
+            max_workers=args.workers, requests_per_second=args.rate, max_retries=args.retries, base_url=args.base_url
+        )
+        riddle_urls = get_riddle_urls(crawler)
+        stores = open_stores(args.storage)
+        manifest_path = f"{ROOT_DIR}/layton-data/manifest.jsonl"
+        if args.full and os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        manifest = CrawlManifest(manifest_path)
+        urls = get_urls_to_crawl(riddle_urls, manifest, stores["htmls"])
+        manifest.start_run()
+        updated = 0
+        for page in tqdm(
+            crawler.crawl(urls, partial(get_page_image_links, backend=args.parser), manifest), total=len(urls)
+        ):
+            if page.status == 200 and page.changed:
+                save_puzzle_page(page, stores)
+                updated += 1
+            elif page.changed:
+                log.info(f"Encountered error while navigating to {page.url}")
+                continue
+            if page.failed_images:
+                # Not recording the page makes the next run download it and its images again, instead of a 304.
+                log.info(
+                    f"Could not download {', '.join(page.failed_images)} of {page.url}, will retry on the next run"
+                )
+                manifest.forget(page.name)
+                continue
+            previous = manifest.entries.get(page.name)
+            manifest.record(
+                ManifestEntry(
+                    url=page.url,
+                    name=page.name,
+                    sha256=page.sha256 or previous.sha256,
+                    fetched_at=time.time(),
+                    etag=page.etag or (previous.etag if previous is not None else None),
+                    last_modified=page.last_modified or (previous.last_modified if previous is not None else None),
+                )
+            )
+        for store in stores.values():
+            store.close()
+        manifest.finish_run()
+        log.info(f"Updated {updated} pages out of {len(urls)} crawled.")
+
+
+if __name__ == "__main__":
+    cli.main(["crawl", *sys.argv[1:]])
@@ -0,0 +1,174 @@
+import json
+import os
+import struct
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from layton_eval.constants import ROOT_DIR
+from layton_eval.storage import FileStore, Store, open_store
+from layton_eval.tracing import span
+
+THUMBNAIL_SIZE = (350, 350)
+HEADER_BYTES = 64 * 1024
+# Start Of Frame markers, which hold the image dimensions. 0xC4 (DHT), 0xC8 (JPG) and 0xCC (DAC) are not frames.
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_jpeg_size(head: bytes) -> t.Tuple[int, int] | None:
+    """
+    Returns the (width, height) of a JPEG from its first bytes, by walking its segments up to the frame header.
+    """
+    if head[:2] != b"\xff\xd8":
+        return None
+    position = 2
+    while position + 4 <= len(head):
+        if head[position] != 0xFF:
+            return None
+        marker = head[position + 1]
+        if marker == 0xFF:  # Fill byte.
+            position += 1
+            continue
+        if marker in (0x01, *range(0xD0, 0xD8)):  # Markers without payload.
+            position += 2
+            continue
+        (length,) = struct.unpack_from(">H", head, position + 2)
+        if marker in SOF_MARKERS:
+            if position + 9 > len(head):
+                return None
+            height, width = struct.unpack_from(">HH", head, position + 5)
+            return width, height
+        position += 2 + length
+    return None
+
+
+def read_image_size(store: Store, name: str) -> t.Tuple[int, int]:
+    """
+    Reads the dimensions of a stored image from its header, without decoding it. Formats other than JPEG, and
+    JPEGs with unusually large headers, fall back on PIL which only reads the header as well.
+    """
+    if (size := read_jpeg_size(store.read_head(name, HEADER_BYTES))) is not None:
+        return size
+    with Image.open(BytesIO(store.get(name))) as img:
+        return img.size
+
+
+def render_thumbnail(data: bytes) -> bytes:
+    """
+    Renders an image at the size it is displayed in the annotation workbook.
+    """
+    with Image.open(BytesIO(data)) as img:
+        thumbnail = img.convert("RGB").resize(THUMBNAIL_SIZE, Image.LANCZOS)
+    buffer = BytesIO()
+    thumbnail.save(buffer, format="JPEG", quality=85, dpi=(96, 96))
+    return buffer.getvalue()
+
+
+def difference_hash(data: bytes, size: int = 8) -> int:
+    """
+    Perceptual hash of an image, `size`² bits telling whether each pixel of its grayscale (size + 1) x size
+    reduction is brighter than its right neighbour. Re-encoded or rescaled copies of a frame hash within a few bits
+    of each other. JPEGs are decoded at a reduced scale, which is much faster than a full decode.
+    """
+    with span("image.hash"), Image.open(BytesIO(data)) as img:
+        img.draft("L", (4 * size, 4 * size))
+        pixels = img.convert("L").resize((size + 1, size), Image.LANCZOS).tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            position = row * (size + 1) + col
+            bits = bits << 1 | (pixels[position] > pixels[position + 1])
+    return bits
+
+
+class ImageMetaIndex:
+    """
+    Caches, for every stored image, the dimensions read from its header and the thumbnail rendered from it.
+    Entries are keyed by the store signature of the image, so that images which changed are read again.
+    """
+
+    def __init__(self, data_dir: str = f"{ROOT_DIR}/layton-data") -> None:
+        self.data_dir = data_dir
+        self.path = f"{data_dir}/image_meta.json"
+        self.entries: t.Dict[str, t.Dict[str, t.Dict[str, t.Any]]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+
+    def thumbnail_store(self, kind: str) -> FileStore:
+        return FileStore(f"{self.data_dir}/thumbnails/{kind}", ".jpg")
+
+    def entry(self, kind: str, name: str, store: Store) -> t.Dict[str, t.Any]:
+        signature = store.signature(name)
+        entry = self.entries.setdefault(kind, {}).get(name)
+        if entry is None or entry["signature"] != signature:
+            entry = self.entries[kind][name] = {"signature": signature, "size": None, "thumbnail": None}
+        return entry
+
+    def size(self, kind: str, name: str, store: Store) -> t.Tuple[int, int] | None:
+        if name not in store:
+            return None
+        entry = self.entry(kind, name, store)
+        if entry["size"] is None:
+            with span("image.size"):
+                entry["size"] = read_image_size(store, name)
+        return tuple(entry["size"])
+
+    def thumbnail_path(self, kind: str, name: str) -> str:
+        return self.thumbnail_store(kind).path(name)
+
+    def make_thumbnails(
+        self,
+        kind: t.Literal["images", "answer_images"],
+        names: t.List[str],
+        storage: t.Literal["files", "pack"] = "files",
+        workers: int = 1,
+        chunksize: int = 32,
+    ) -> int:
+        """
+        Renders the thumbnails of the images whose content changed since their thumbnail was rendered, or which do
+        not have one yet. Returns the number of rendered thumbnails.
+        """
+        store, thumbnails = open_store(kind, storage, self.data_dir), self.thumbnail_store(kind)
+        stale = [
+            name
+            for name in names
+            if name in store and (self.entry(kind, name, store)["thumbnail"] is None or name not in thumbnails)
+        ]
+        chunks = [stale[i : i + chunksize] for i in range(0, len(stale), chunksize)]
+        args = [(kind, storage, self.data_dir, chunk) for chunk in chunks]
+        with span("image.thumbnails", kind=kind, images=len(stale)):
+            if workers <= 1:
+                results = list(map(_render_chunk, args))
+            else:
+                store.ensure_index()
+                with ProcessPoolExecutor(workers) as pool:
+                    results = list(pool.map(_render_chunk, args))
+        for rendered in results:
+            for name, size in rendered:
+                entry = self.entry(kind, name, store)
+                entry["size"], entry["thumbnail"] = size, entry["signature"]
+        store.close()
+        return len(stale)
+
+    def save(self) -> None:
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(self.entries, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def _render_chunk(args: t.Tuple[str, str, str, t.List[str]]) -> t.List[t.Tuple[str, t.Tuple[int, int]]]:
+    kind, storage, data_dir, names = args
+    store = open_store(kind, storage, data_dir)
+    thumbnails = FileStore(f"{data_dir}/thumbnails/{kind}", ".jpg")
+    rendered = []
+    for name in names:
+        data = store.get(name)
+        with Image.open(BytesIO(data)) as img:
+            size = img.size
+        thumbnails.put(name, render_thumbnail(data))
+        rendered.append((name, size))
+    store.close()
+    return rendered
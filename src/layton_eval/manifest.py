@@ -0,0 +1,109 @@
+import json
+import os
+import time
+import typing as t
+from dataclasses import asdict, dataclass
+
+
+def read_json_lines(path: str) -> t.List[t.Dict[str, t.Any]]:
+    """
+    Reads the records of an append-only JSON lines file, and truncates the partial last line left by a crash so
+    that the next record is not appended to it.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "r+b") as f:
+        content = f.read()
+        if len(complete := content[: content.rfind(b"\n") + 1]) < len(content):
+            f.truncate(len(complete))
+    records = []
+    for line in complete.splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return records
+
+
+@dataclass
+class ManifestEntry:
+    url: str
+    name: str
+    sha256: str
+    fetched_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+class CrawlManifest:
+    """
+    Records, for every crawled puzzle (keyed by puzzle name), its url, validators (ETag/Last-Modified), the hash of
+    its content and when it was last fetched. The manifest is an append-only JSON lines file so that a crash never loses the pages already
+    recorded, later lines take precedence over earlier ones and `compact` drops the superseded ones.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: t.Dict[str, ManifestEntry] = {}
+        self.runs: t.List[t.Dict[str, t.Any]] = []
+        for record in read_json_lines(path):
+            if record.pop("kind") == "run":
+                self.runs.append(record)
+            else:
+                self.entries[record["name"]] = ManifestEntry(**record)
+
+    def _append(self, kind: str, record: t.Dict[str, t.Any]) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"kind": kind, **record}) + "\n")
+
+    def start_run(self) -> float:
+        run = {"started_at": time.time(), "finished": False}
+        self.runs.append(run)
+        self._append("run", run)
+        return run["started_at"]
+
+    def finish_run(self) -> None:
+        self.runs[-1]["finished"] = True
+        self._append("run", self.runs[-1])
+        self.compact()
+
+    def interrupted_run_started_at(self) -> float | None:
+        """
+        Returns when the last run started if it did not finish, pages fetched since then do not need a new request.
+        """
+        if self.runs and not self.runs[-1]["finished"]:
+            return self.runs[-1]["started_at"]
+        return None
+
+    def record(self, entry: ManifestEntry) -> None:
+        self.entries[entry.name] = entry
+        self._append("page", asdict(entry))
+
+    def forget(self, name: str) -> None:
+        self.entries.pop(name, None)
+
+    def conditional_headers(self, name: str) -> t.Dict[str, str]:
+        """
+        Returns the headers turning a GET of a known page into a conditional request.
+        """
+        headers = {}
+        if (entry := self.entries.get(name)) is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def is_unchanged(self, name: str, sha256: str) -> bool:
+        return (entry := self.entries.get(name)) is not None and entry.sha256 == sha256
+
+    def compact(self) -> None:
+        """
+        Rewrites the manifest with only the latest record of each page and run.
+        """
+        with open(f"{self.path}.tmp", "w") as f:
+            for run in self.runs[-1:]:
+                f.write(json.dumps({"kind": "run", **run}) + "\n")
+            for entry in self.entries.values():
+                f.write(json.dumps({"kind": "page", **asdict(entry)}) + "\n")
+        os.replace(f"{self.path}.tmp", self.path)
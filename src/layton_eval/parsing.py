@@ -0,0 +1,37 @@
+from bs4 import BeautifulSoup, SoupStrainer
+
+from layton_eval.constants import PARSER_BACKENDS, ParserBackend
+from layton_eval.extractor import PuzzleIndex, PuzzleRecord
+from layton_eval.tracing import span
+
+# The infobox, the Puzzle/Hints/Solution sections, the hint boxes and the navbox all live in the article body.
+PUZZLE_SUBTREES = SoupStrainer("div", class_="mw-parser-output")
+
+
+def make_soup(content: bytes, backend: ParserBackend = "html.parser", subtree_only: bool = False) -> BeautifulSoup:
+    """
+    Parses a page with the given BeautifulSoup tree builder, only keeping the article body when `subtree_only`.
+    html5lib does not support partial parsing and always builds the whole tree.
+    """
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend {backend}, expected one of {PARSER_BACKENDS}")
+    parse_only = PUZZLE_SUBTREES if subtree_only and backend != "html5lib" else None
+    with span("parse.soup", backend=backend, subtree_only=parse_only is not None):
+        return BeautifulSoup(content, backend, parse_only=parse_only)
+
+
+def parse_puzzle(content: bytes, backend: ParserBackend = "html.parser", subtree_only: bool = False) -> PuzzleRecord:
+    """
+    Extracts a puzzle from the raw page. With `subtree_only`, the page is parsed again in full whenever the
+    extraction walked past the end of the article body (or found none), as it could have gone on outside of it.
+    """
+    soup = make_soup(content, backend, subtree_only)
+    with span("extract.index"):
+        index = PuzzleIndex(soup)
+    record = index.record()
+    if subtree_only and (index.reached_end or not index.tags):
+        soup = make_soup(content, backend)
+        with span("extract.index"):
+            index = PuzzleIndex(soup)
+        return index.record()
+    return record
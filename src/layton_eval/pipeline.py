@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import sys
+import time
+import typing as t
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from logging import getLogger
+
+import pandas as pd
+from tqdm import tqdm
+
+from layton_eval import cli
+from layton_eval.chatbot import BatchResult, Chatbot
+from layton_eval.constants import ROOT_DIR
+from layton_eval.dataset import DATASET_PATH, iter_rows
+from layton_eval.manifest import read_json_lines
+from layton_eval.response_cache import ResponseCache
+from layton_eval.storage import open_store
+from layton_eval.tracing import traced_run
+
+log = getLogger(__name__)
+
+Task = t.Literal["input_structuration", "answer_structuration"]
+# Output columns of every task, with the field of the chatbot output they come from and its default.
+TASK_COLUMNS: t.Dict[str, t.Dict[str, t.Tuple[str, t.Any]]] = {
+    "input_structuration": {
+        "llm_solvable": ("llm", False),
+        "vlm_solvable": ("vlm", False),
+        "output_type": ("output", "action"),
+    },
+    "answer_structuration": {"structured_solution": ("structured", [])},
+}
+TASK_INPUTS: t.Dict[str, t.Tuple[str, ...]] = {
+    "input_structuration": ("description",),
+    "answer_structuration": ("description", "solution"),
+}
+
+
+@dataclass
+class StageStats:
+    items: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class PipelineStats:
+    stages: t.Dict[str, StageStats] = field(default_factory=dict)
+    done: int = 0  # Rows already in the checkpoint when the run started.
+    skipped: int = 0  # Rows missing an input of the task.
+    propagated: int = 0  # Near-duplicate rows given the output of their representative.
+    errors: int = 0
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0) -> t.Iterator[StageStats]:
+        stats = self.stages.setdefault(name, StageStats())
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.items += items
+
+    def report(self) -> str:
+        lines = [f"{'stage':<10}{'items':>8}{'seconds':>10}{'items/s':>10}"]
+        for name, stats in self.stages.items():
+            lines.append(f"{name:<10}{stats.items:>8}{stats.seconds:>10.2f}{stats.throughput:>10.1f}")
+        lines.append(
+            f"already done: {self.done}, skipped: {self.skipped}, propagated: {self.propagated}, errors: {self.errors}"
+        )
+        return "\n".join(lines)
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines file of the structured rows, keyed by puzzle name. Every result is flushed as soon as it
+    completes, so that a restarted run only sends the rows that are not in the file yet. Rows copied from a
+    near-duplicate record the puzzle they were copied from.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.outputs: t.Dict[str, t.Any] = {}
+        self.duplicate_of: t.Dict[str, str] = {}
+        for record in read_json_lines(path):
+            self.outputs[record["puzzle_name"]] = record["output"]
+            if "duplicate_of" in record:
+                self.duplicate_of[record["puzzle_name"]] = record["duplicate_of"]
+        self._file = open(path, "a")
+
+    def __contains__(self, puzzle_name: str) -> bool:
+        return puzzle_name in self.outputs
+
+    def append(self, puzzle_name: str, output: t.Any, duplicate_of: str | None = None) -> None:
+        self.outputs[puzzle_name] = output
+        record = {"puzzle_name": puzzle_name, "output": output}
+        if duplicate_of is not None:
+            self.duplicate_of[puzzle_name] = record["duplicate_of"] = duplicate_of
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def checkpoint_path(task: Task, chatbot: Chatbot, directory: str = f"{ROOT_DIR}/layton-data/structured") -> str:
+    model = "-".join(part for part in (chatbot.model_provider, chatbot.model_owner, chatbot.model_string) if part)
+    return f"{directory}/{task}-{model.replace('/', '_')}.jsonl"
+
+
+def run_pipeline(
+    chatbot: Chatbot,
+    checkpoint: Checkpoint,
+    dataset_path: str = DATASET_PATH,
+    batch_size: int = 64,
+    limit: int | None = None,
+    max_concurrency: int = 8,
+    requests_per_minute: int | None = None,
+    tokens_per_minute: int | None = None,
+    pack_size: int = 1,
+    duplicates: t.Mapping[str, str] | None = None,
+) -> PipelineStats:
+    """
+    Streams the dataset rows through the chatbot by batches, appending every structured row to the checkpoint as
+    soon as its request completes. Rows already in the checkpoint are skipped, and failed rows are left out to be
+    retried by the next run. With a `pack_size` above 1, riddles are sent in packed requests.
+
+    `duplicates` maps near-duplicate rows to the representative of their cluster, which comes first in the
+    dataset: they are not sent, but given the output of their representative once it is structured.
+    """
+    inputs = TASK_INPUTS[chatbot.task]
+    stats = PipelineStats()
+    rows = iter_rows(dataset_path, columns=["puzzle_name", *inputs], batch_size=batch_size)
+    progress = tqdm(total=limit, unit="row")
+
+    def on_result(pending: t.List[t.Dict[str, t.Any]], index: int, result: BatchResult) -> None:
+        puzzle_name = pending[index]["puzzle_name"]
+        if result.error is not None:
+            log.info(f"Could not structure {puzzle_name}: {result.error!r}")
+            stats.errors += 1
+            return
+        with stats.stage("write", 1):
+            checkpoint.append(puzzle_name, result.output)
+
+    seen = 0
+    while limit is None or seen < limit:
+        with stats.stage("read") as read:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == batch_size or (limit is not None and seen + len(batch) == limit):
+                    break
+            read.items += len(batch)
+        if not batch:
+            break
+        seen += len(batch)
+        pending, members = [], []
+        for row in batch:
+            if row["puzzle_name"] in checkpoint:
+                stats.done += 1
+            elif any(row[column] is None for column in inputs):
+                stats.skipped += 1
+            elif duplicates is not None and row["puzzle_name"] in duplicates:
+                members.append(row["puzzle_name"])
+            else:
+                pending.append(row)
+        with stats.stage("llm", len(pending)):
+            ask = chatbot.ask_batch if pack_size <= 1 else partial(chatbot.ask_packed, pack_size=pack_size)
+            ask(
+                [row["description"] for row in pending],
+                [row["solution"] for row in pending] if "solution" in inputs else None,
+                max_concurrency=max_concurrency,
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                on_result=partial(on_result, pending),
+                labels=[row["puzzle_name"] for row in pending],
+            )
+        for puzzle_name in members:
+            if (representative := duplicates[puzzle_name]) in checkpoint:
+                with stats.stage("propagate", 1):
+                    checkpoint.append(puzzle_name, checkpoint.outputs[representative], duplicate_of=representative)
+                stats.propagated += 1
+            else:  # The representative failed, the member waits for it to succeed in the next run.
+                log.info(f"Could not structure {puzzle_name}: {representative} was not structured")
+        progress.update(len(batch))
+        progress.set_postfix(
+            {name: f"{stage.throughput:.1f}/s" for name, stage in stats.stages.items()}, errors=stats.errors
+        )
+    progress.close()
+    return stats
+
+
+def to_dataframe(task: Task, checkpoint: Checkpoint) -> pd.DataFrame:
+    """
+    One row per structured puzzle, with the output fields of the task as columns, and the puzzle the output was
+    copied from for near-duplicates.
+    """
+    columns = TASK_COLUMNS[task]
+    records = []
+    for puzzle_name, output in checkpoint.outputs.items():
+        output = output if isinstance(output, dict) else {}
+        records.append(
+            {
+                "puzzle_name": puzzle_name,
+                **{column: output.get(key, default) for column, (key, default) in columns.items()},
+                "duplicate_of": checkpoint.duplicate_of.get(puzzle_name),
+            }
+        )
+    return pd.DataFrame(records, columns=["puzzle_name", *columns, "duplicate_of"])
+
+
+def main(args: argparse.Namespace) -> None:
+    with traced_run(args.trace):
+        cache = ResponseCache(args.cache) if args.cache_mode != "bypass" else None
+        chatbot = Chatbot(
+            cache=cache,
+            cache_mode=args.cache_mode,
+            fallbacks=args.fallback,
+            provider=args.provider,
+            owner=args.owner if args.provider == "together" else None,
+            string=args.model,
+            task=args.task,
+            base_url=args.base_url,
+        )
+        chatbot.verbose = False
+        path = args.checkpoint or checkpoint_path(args.task, chatbot)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        checkpoint = Checkpoint(path)
+        duplicates = None
+        if args.dedup:
+            from layton_eval.dedup import build_index  # Loads numpy and PIL, only needed with --dedup.
+
+            image_store = open_store("images", args.storage) if args.dedup_images else None
+            index = build_index(args.dataset, TASK_INPUTS[args.task], image_store, threshold=args.dedup_threshold)
+            duplicates = index.duplicates()
+            print(f"{len(duplicates)} near-duplicates of {len(index.clusters())} puzzles will not be sent")
+        try:
+            stats = run_pipeline(
+                chatbot,
+                checkpoint,
+                dataset_path=args.dataset,
+                batch_size=args.batch_size,
+                limit=args.limit,
+                max_concurrency=args.concurrency,
+                requests_per_minute=args.rpm,
+                tokens_per_minute=args.tpm,
+                pack_size=args.pack_size,
+                duplicates=duplicates,
+            )
+        finally:
+            checkpoint.close()
+        to_dataframe(args.task, checkpoint).to_parquet(f"{path.removesuffix('.jsonl')}.parquet", index=False)
+        print(stats.report())
+        usage = chatbot.usage
+        print(
+            f"tokens: {usage.prompt_tokens} prompt, {usage.completion_tokens} completion in {usage.requests} requests"
+        )
+        print(f"tokens per riddle: {usage.tokens_per_riddle:.0f}")
+        print(chatbot.pool.report())
+    if cache is not None:
+        print(f"cache: {cache.stats.hits} hits, {cache.stats.misses} misses ({100 * cache.stats.hit_rate:.0f}%)")
+
+
+if __name__ == "__main__":  # python -m layton_eval.pipeline <task> [options], as before the layton-eval command.
+    task, *argv = sys.argv[1:] or ["--help"]
+    command = {"input_structuration": "structure-input", "answer_structuration": "structure-output"}.get(task, task)
+    cli.main([command, *argv])
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import typing as t
+from dataclasses import dataclass
+from functools import cached_property
+from logging import getLogger
+
+log = getLogger(__name__)
+
+if t.TYPE_CHECKING:  # The clients pull in langchain-community and the provider SDKs, only load them when used.
+    from langchain.chat_models import ChatOpenAI
+    from langchain.llms import Together
+
+Provider = t.Literal["openai", "together"]
+
+
+@dataclass(frozen=True)
+class Backend:
+    provider: Provider
+    owner: str | None
+    string: str
+    base_url: str | None = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "Backend":
+        """
+        Reads `provider:[owner/]model[@base_url]`, e.g. `together:mistralai/Mixtral-8x7B-Instruct-v0.1` or
+        `openai:gpt-3.5-turbo@http://127.0.0.1:8001/v1`.
+        """
+        provider, _, rest = spec.partition(":")
+        if provider not in t.get_args(Provider) or not rest:
+            raise ValueError(f"Invalid backend {spec!r}, expected provider:[owner/]model[@base_url]")
+        model, _, base_url = rest.partition("@")
+        owner, _, string = model.rpartition("/")
+        return cls(provider, owner or None, string, base_url or None)
+
+    @property
+    def name(self) -> str:
+        model = f"{self.owner}/{self.string}" if self.owner else self.string
+        return f"{self.provider}:{model}" + (f"@{self.base_url}" if self.base_url else "")
+
+
+@dataclass
+class BackendStats:
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    seconds: float = 0.0  # Total latency of the successful requests.
+    latency: float | None = None  # Moving average of the recent latencies, None until a request succeeds.
+    error_pressure: float = 0.0  # Count of the recent errors, halved every `half_life` seconds since `last_error`.
+    last_error: float | None = None
+    first_request: float | None = None
+    last_response: float | None = None
+
+    def pressure(self, now: float, half_life: float) -> float:
+        if self.last_error is None:
+            return 0.0
+        return self.error_pressure * 0.5 ** ((now - self.last_error) / half_life)
+
+    @property
+    def mean_latency(self) -> float:
+        successes = self.requests - self.errors
+        return self.seconds / successes if successes else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """
+        Successful requests per second, between the first request and the last response.
+        """
+        if self.first_request is None or self.last_response is None or self.last_response <= self.first_request:
+            return 0.0
+        return (self.requests - self.errors) / (self.last_response - self.first_request)
+
+
+class ProviderPool:
+    """
+    Long-lived llm clients, one per backend, shared by every Chatbot using the pool whatever its task, so that they
+    reuse their HTTP connections. Requests are routed to the backend with the lowest expected latency among the ones
+    of the chatbot: its recent latency scaled by its requests in flight, plus a penalty for its recent errors that
+    fades away with time, so that a failing backend is tried again later. Backends that were never used score 0, so
+    each of them is tried once.
+    """
+
+    def __init__(self, decay: float = 0.8, error_penalty: float = 10.0, error_half_life: float = 30.0) -> None:
+        self.decay = decay  # Weight of the previous latencies in the moving average.
+        self.error_penalty = error_penalty  # Seconds added to the score per recent error.
+        self.error_half_life = error_half_life
+        self.clients: t.Dict[Backend, "ChatOpenAI | Together"] = {}
+        self.stats: t.Dict[Backend, BackendStats] = {}
+        self._lock = threading.Lock()
+
+    @cached_property
+    def event_loop(self) -> asyncio.AbstractEventLoop:
+        # The async clients keep connections bound to the loop they were first used in.
+        return asyncio.new_event_loop()
+
+    def client(self, backend: Backend) -> "ChatOpenAI | Together":
+        from langchain.chat_models import ChatOpenAI
+        from langchain.llms import Together
+
+        with self._lock:
+            if backend not in self.clients:
+                if backend.provider == "openai":
+                    self.clients[backend] = ChatOpenAI(
+                        model=backend.string,
+                        streaming=False,
+                        model_kwargs={},
+                        openai_api_base=backend.base_url,
+                    )
+                elif backend.provider == "together":
+                    self.clients[backend] = Together(
+                        model=f"{backend.owner}/{backend.string}",
+                        max_tokens=1024,
+                        **({"base_url": backend.base_url} if backend.base_url is not None else {}),
+                    )
+            return self.clients[backend]
+
+    def score(self, backend: Backend) -> float:
+        stats = self.stats.get(backend) or BackendStats()
+        pressure = stats.pressure(time.monotonic(), self.error_half_life)
+        return (stats.latency or 0.0) * (1 + stats.in_flight) + pressure * self.error_penalty
+
+    def choose(self, backends: t.Sequence[Backend], exclude: t.Collection[Backend] = ()) -> Backend | None:
+        """
+        Returns the best backend not in `exclude`, or None when none is left.
+        """
+        with self._lock:
+            candidates = [backend for backend in backends if backend not in exclude]
+            # Ties, as between unused backends, go to the one with the fewest requests in flight.
+            return min(
+                candidates,
+                key=lambda backend: (self.score(backend), (self.stats.get(backend) or BackendStats()).in_flight),
+                default=None,
+            )
+
+    def start(self, backend: Backend) -> float:
+        with self._lock:
+            stats = self.stats.setdefault(backend, BackendStats())
+            stats.requests += 1
+            stats.in_flight += 1
+            now = time.monotonic()
+            if stats.first_request is None:
+                stats.first_request = now
+            return now
+
+    def finish(self, backend: Backend, started: float, error: BaseException | None = None) -> None:
+        with self._lock:
+            stats = self.stats[backend]
+            now = time.monotonic()
+            stats.in_flight -= 1
+            if error is not None:
+                stats.errors += 1
+                stats.error_pressure = stats.pressure(now, self.error_half_life) + 1
+                stats.last_error = now
+                return
+            latency = now - started
+            stats.seconds += latency
+            stats.latency = (
+                latency if stats.latency is None else self.decay * stats.latency + (1 - self.decay) * latency
+            )
+            stats.last_response = now
+
+    def report(self) -> str:
+        width = max((len(backend.name) for backend in self.stats), default=7) + 2
+        lines = [f"{'backend':<{width}}{'requests':>9}{'errors':>8}{'latency':>9}{'recent':>8}{'req/s':>8}"]
+        for backend, stats in self.stats.items():
+            lines.append(
+                f"{backend.name:<{width}}{stats.requests:>9}{stats.errors:>8}{stats.mean_latency:>8.2f}s"
+                f"{stats.latency or 0.0:>7.2f}s{stats.throughput:>8.1f}"
+            )
+        return "\n".join(lines)
+
+
+DEFAULT_POOL = ProviderPool()  # Shared by the chatbots created without a pool.
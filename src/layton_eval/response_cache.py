@@ -0,0 +1,148 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+import typing as t
+from dataclasses import dataclass
+
+from layton_eval import cli
+from layton_eval.constants import CACHE_PATH
+
+MISSING = object()  # Cached outputs may be None.
+CacheMode = t.Literal["use", "refresh", "bypass"]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+
+class ResponseCache:
+    """
+    Parsed LLM outputs stored in SQLite, keyed by a hash of everything that determines the response. Entries older
+    than `max_age` seconds are dropped, and the least recently used entries above `max_entries`, on every write.
+    Both go through an index, and the entries are only counted again when the writes of this cache may have gone
+    above `max_entries`, so that writes do not scan the table.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int | None = None, max_age: float | None = None) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, output TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+        self._size = self._count()
+
+    @staticmethod
+    def key(**parts: t.Any) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> t.Any:
+        """
+        Returns the cached output, or MISSING.
+        """
+        return self.get_first([key])
+
+    def get_first(self, keys: t.Sequence[str]) -> t.Any:
+        """
+        Returns the cached output of the first key that has one, or MISSING, counted as a single hit or miss.
+        """
+        with self._lock:
+            now = time.time()
+            for key in keys:
+                row = self._connection.execute(
+                    "SELECT output, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and (self.max_age is None or now - row[1] <= self.max_age):
+                    self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    self.stats.hits += 1
+                    return json.loads(row[0])
+            self.stats.misses += 1
+            return MISSING
+
+    def put(self, key: str, output: t.Any) -> None:
+        with self._lock:
+            now = time.time()
+            inserted = self._connection.execute(
+                "INSERT OR IGNORE INTO responses (key, output, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(output), now, now),
+            ).rowcount
+            if inserted:
+                self._size += 1
+            else:
+                self._connection.execute(
+                    "UPDATE responses SET output = ?, created_at = ?, accessed_at = ? WHERE key = ?",
+                    (json.dumps(output), now, now, key),
+                )
+            self.stats.writes += 1
+            self._evict(now)
+
+    def evict(self) -> int:
+        with self._lock:
+            return self._evict(time.time())
+
+    def _evict(self, now: float) -> int:
+        evicted = 0
+        if self.max_age is not None:
+            evicted += self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.max_age,)
+            ).rowcount
+        self._size -= evicted
+        if self.max_entries is not None and self._size > self.max_entries:
+            self._size = self._count()  # Other processes may have written to the cache as well.
+            if self._size > self.max_entries:
+                excess = self._connection.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (self._size - self.max_entries,),
+                ).rowcount
+                self._size -= excess
+                evicted += excess
+        self.stats.evictions += evicted
+        return evicted
+
+    def _count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._size = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def main(args: argparse.Namespace) -> None:
+    max_age = args.max_age_days * 86400 if args.max_age_days is not None else None
+    cache = ResponseCache(args.path, max_entries=args.max_entries, max_age=max_age)
+    if args.clear:
+        cache.clear()
+    evicted = cache.evict()
+    print(f"{len(cache)} entries in {args.path}, {evicted} evicted")
+    cache.close()
+
+
+if __name__ == "__main__":
+    cli.main(["cache", *sys.argv[1:]])
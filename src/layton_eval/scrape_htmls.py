@@ -1,30 +1,53 @@
-import os
+import argparse
+import sys
 import typing as t
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from io import BytesIO
 
-import bs4
-import pandas as pd
 from bs4 import BeautifulSoup
-from constants import ROOT_DIR
 from PIL import Image
 from tqdm import tqdm
 
-type2color = {"1": "#E8E8B8", "2": "#C8E8C0", "3": "#C8F0E0", "Special": "#F0C7A7"}
+from layton_eval import cli
+from layton_eval.constants import ROOT_DIR
+from layton_eval.dataset import COLUMNS, DATASET_PATH, DatasetWriter
+from layton_eval.export import WorkbookWriter
+from layton_eval.extractor import PuzzleIndex, type2color  # noqa: F401
+from layton_eval.images import ImageMetaIndex
+from layton_eval.parsing import ParserBackend, make_soup, parse_puzzle
+from layton_eval.storage import Store, open_stores
+from layton_eval.tracing import TRACER, span, traced_run
 
 
-def get_file_soup(path: str) -> BeautifulSoup:
+def get_file_soup(path: str, backend: ParserBackend = "html.parser", subtree_only: bool = False) -> BeautifulSoup:
     """
     get the soup from an html path
     """
     with open(path, "rb") as f:
         content = f.read()
-    return BeautifulSoup(content, "html.parser")
+    return make_soup(content, backend, subtree_only)
 
 
-def load_answer_image(puzzle_name: str):
+def load_puzzle_soup(
+    puzzle_name: str, store: Store, backend: ParserBackend = "html.parser", subtree_only: bool = False
+) -> BeautifulSoup:
+    """
+    get the soup of a puzzle from an html store
+    """
+    return make_soup(store.get(puzzle_name), backend, subtree_only)
+
+
+def load_answer_image(puzzle_name: str, store: Store | None = None):
+    if store is not None:
+        return Image.open(BytesIO(store.get(puzzle_name)))
     return Image.open(f"{ROOT_DIR}/layton-data/answer_images/{puzzle_name}.jpg")
 
 
-def load_puzzle_image(puzzle_name: str):
+def load_puzzle_image(puzzle_name: str, store: Store | None = None):
+    if store is not None:
+        return Image.open(BytesIO(store.get(puzzle_name)))
     return Image.open(f"{ROOT_DIR}/layton-data/images/{puzzle_name}.jpg")
 
 
@@ -32,221 +55,167 @@ def get_puzzle_description(soup: BeautifulSoup) -> t.List[str] | str:
     """
     Get puzzle description from soup object.
     """
-    puzzle_element = soup.find(id='Puzzle')
-    hints_element = soup.find(id='Hints')
-    solution_element = soup.find(id="Solution")
-
-    # Collect everything between Puzzle and Hints
-    nodes_between_elements = []
-    if puzzle_element is None:  # Some RW Puzzles do not have a Puzzle section.
-        return
-    current_element = puzzle_element.find_next()
-
-    has_images = False
-    dl_encountered = 0
-    while (current_element and current_element.find_next() not in [hints_element, solution_element]) and (
-        dl_encountered < 2
-    ):
-        if str(current_element).startswith("<p>"):
-            clean_content = ""
-            for elem in current_element.contents:
-                if str(elem).startswith('''<a class="image"'''):
-                    nodes_between_elements.append(current_element)
-                    has_images = True
-                elif isinstance(elem, bs4.element.NavigableString):
-                    clean_content += elem
-                else:
-                    for c in elem.contents:
-                        if str(c) != "<br/>" and not str(c).startswith("<img"):
-                            clean_content += c
-            nodes_between_elements.append(clean_content)
-        elif str(current_element).startswith("<dl>"):
-            dl_encountered += 1
-        current_element = current_element.find_next()
-    if has_images:
-        return nodes_between_elements[0]
-    else:
-        return "\n".join(nodes_between_elements)
+    return PuzzleIndex(soup).description()
 
 
 def get_puzzle_category(soup: BeautifulSoup) -> str:
     """
     Returns the category of a puzzle.
     """
-    if soup.select_one("[data-source='type'] a") is not None:
-        return soup.select_one("[data-source='type'] a").attrs["title"].split(":").pop()
+    return PuzzleIndex(soup).category()
 
 
 def get_puzzle_picarats(soup: BeautifulSoup) -> int:
     """
     Returns the number of picarats owned by a puzzle.
     """
-    if tag := soup.select_one("[data-source='picarats'] .pi-data-value.pi-font"):
-        return int(tag.contents[0])
+    return PuzzleIndex(soup).picarats()
 
 
 def get_puzzle_id(soup: BeautifulSoup) -> str:
     """
     Return the puzzle id.
     """
-    if soup.select_one("[data-source='number'] .pi-data-value.pi-font") is not None:
-        return soup.select_one("[data-source='number'] .pi-data-value.pi-font").contents[0]
+    return PuzzleIndex(soup).puzzle_id()
 
 
 def get_puzzle_hint(soup: BeautifulSoup, hint_type: t.Literal["1", "2", "3", "Special"]) -> str:
     """
     Given the hint type, returns the associated hint found in the puzzle.
     """
-    background_color = type2color.get(hint_type, None)
-    base = f"[style='height:200px; overflow-y:auto; overflow-x:hidden; word-wrap:break-word; overflow: -moz-scrollbars-vertical; line-height:normal; border: 2px solid black; padding:3px; background:{background_color}; font-size:14px'] dl"
-    hint = ""
-    while (h := soup.select_one(f"{base}+p")) is not None:
-        base += "+p"
-        for c in h.contents:
-            hint += str(c)
-    if hint:
-        return hint
-    else:
-        hint = soup.select(
-            f"[style='height:200px; overflow-y:auto; overflow-x:hidden; word-wrap:break-word; overflow: -moz-scrollbars-vertical; line-height:normal; border: 2px solid black; padding:3px; background:{background_color}; font-size:14px'] p"
-        )
-        clean_content = ""
-        for h in hint:
-            if isinstance(h, bs4.element.NavigableString):
-                clean_content += h
-            else:
-                for c in h.contents:
-                    if isinstance(c, bs4.element.NavigableString):
-                        clean_content += c
-                    elif str(c) == "<br/>":
-                        clean_content += "\n"
-                    elif str(c).startswith("<img") or str(c).startswith("<a"):
-                        continue
-                    else:
-                        clean_content += c.contents[0]
-        return clean_content
+    return PuzzleIndex(soup).hint(hint_type)
 
 
 def get_puzzle_solution(soup: BeautifulSoup) -> str:
     """
     Get the unstructured solution of a puzzle.
     """
-    correct_element = soup.find(id="Correct")
-    navbox_element = soup.select_one(".navbox.mw-collapsible.mw-collapsed tbody")
-    nodes_between_elements = []
-    if correct_element is None:
-        return
-    current_element = correct_element.find_next()
-    dl_encountered = 0
-    while (current_element and current_element.find_next() != navbox_element) and dl_encountered < 2:
-        if str(current_element).startswith("<p>"):
-            clean_content = ""
-            for elem in current_element.contents:
-                if str(elem).startswith('''<a class="image"'''):
-                    nodes_between_elements.append(current_element)
-                elif isinstance(elem, bs4.element.NavigableString):
-                    clean_content += elem
-                else:
-                    for c in elem.contents:
-                        if str(c) != "<br/>" and not str(c).startswith("<img"):
-                            clean_content += c
-            nodes_between_elements.append(clean_content)
-        elif str(current_element).startswith("<dl>"):
-            dl_encountered += 1
-        elif str(current_element).startswith("<i>"):  # No solution documented
-            return
-        current_element = current_element.find_next()
-    return "\n".join(nodes_between_elements)
+    return PuzzleIndex(soup).solution()
 
 
-if __name__ == "__main__":
-    df = {
-        "id": [],
-        "category": [],
-        "description": [],
-        "img": [],
-        "url": [],
-        "picarats": [],
-        "first_hint": [],
-        "second_hint": [],
-        "third_hint": [],
-        "special_hint": [],
-        "solution": [],
-        "answer_img": [],
+@dataclass
+class PuzzleRow:
+    puzzle_name: str
+    values: t.Tuple  # One value per column of COLUMNS.
+
+
+def clean_text(text: t.Any) -> str | None:
+    if text is not None:
+        return str(text).replace(".", ".\n")
+
+
+def build_row(
+    puzzle_name: str, stores: t.Dict[str, Store], backend: ParserBackend = "html.parser", subtree_only: bool = False
+) -> PuzzleRow:
+    """
+    Extracts a puzzle and returns its row of the annotation sheet.
+    """
+    with span("build.row", puzzle=puzzle_name):
+        return _build_row(puzzle_name, stores, backend, subtree_only)
+
+
+def _build_row(puzzle_name: str, stores: t.Dict[str, Store], backend: ParserBackend, subtree_only: bool) -> PuzzleRow:
+    record = parse_puzzle(stores["htmls"].get(puzzle_name), backend, subtree_only)
+    row = {
+        "id": record.puzzle_id,
+        "category": record.category,
+        "description": clean_text(record.description),
+        "img": stores["images"].locate(puzzle_name),
+        "url": f"layton.fandom.com/wiki/Puzzle:{puzzle_name}",
+        "picarats": record.picarats,
+        "first_hint": clean_text(record.hints["1"]),
+        "second_hint": clean_text(record.hints["2"]),
+        "third_hint": clean_text(record.hints["3"]),
+        "special_hint": clean_text(record.hints["Special"]),
+        "solution": clean_text(record.solution),
+        "answer_img": stores["answer_images"].locate(puzzle_name),
     }
-    answer_sizes = []
-    sizes = []
-    for puzzle_html_name in tqdm(os.listdir(f"{ROOT_DIR}/layton-data/htmls")):
-        puzzle_name = puzzle_html_name.replace(".html", "")
-        img_path = f"{ROOT_DIR}/layton-data/images/{puzzle_name}.jpg"
-        answer_img_path = f"{ROOT_DIR}/layton-data/answer_images/{puzzle_name}.jpg"
-        img = Image.open(img_path) if os.path.exists(img_path) else None
-        answer_img = Image.open(answer_img_path) if os.path.exists(answer_img_path) else None
-        img_path = img_path if os.path.exists(img_path) else None
-        answer_img_path = answer_img_path if os.path.exists(answer_img_path) else None
-        soup = get_file_soup(f"{ROOT_DIR}/layton-data/htmls/{puzzle_name}.html")
-        category = get_puzzle_category(soup)
-        description = get_puzzle_description(soup)
-        if description is not None:
-            description = str(description).replace(".", ".\n")
-        solution = get_puzzle_solution(soup)
-        if solution is not None:
-            solution = str(solution).replace(".", ".\n")
-        puzzle_id = get_puzzle_id(soup)
-        url = f"layton.fandom.com/wiki/Puzzle:{puzzle_name}"
-        picarats = get_puzzle_picarats(soup)
-        first_hint = get_puzzle_hint(soup, "1")
-        if first_hint is not None:
-            first_hint = str(first_hint).replace(".", ".\n")
-        second_hint = get_puzzle_hint(soup, "2")
-        if second_hint is not None:
-            second_hint = str(second_hint).replace(".", ".\n")
-        third_hint = get_puzzle_hint(soup, "3")
-        if third_hint is not None:
-            third_hint = str(third_hint).replace(".", ".\n")
-        special_hint = get_puzzle_hint(soup, "Special")
-        if special_hint is not None:
-            special_hint = str(special_hint).replace(".", ".\n")
-        sizes.append(img.size if img is not None else None)
-        answer_sizes.append(answer_img.size if answer_img is not None else None)
-        df["id"].append(puzzle_id)
-        df["category"].append(category)
-        df["description"].append(description)
-        df["img"].append(img_path)
-        df["answer_img"].append(answer_img_path)
-        df["url"].append(url)
-        df["picarats"].append(picarats)
-        df["first_hint"].append(first_hint)
-        df["second_hint"].append(second_hint)
-        df["third_hint"].append(third_hint)
-        df["special_hint"].append(special_hint)
-        df["solution"].append(solution)
-    df = pd.DataFrame(df)
-    with pd.ExcelWriter(f"{ROOT_DIR}/layton-annotations.xlsx", engine="xlsxwriter") as writer:
-        workbook = writer.book
-        worksheet = workbook.add_worksheet()
-        img_col_index = df.columns.get_loc("img")
-        answer_img_col_index = df.columns.get_loc("answer_img")
-        for i, (answer_img_path, img_path, url) in enumerate(zip(df["answer_img"], df["img"], df["url"])):
-            if sizes[i] is not None:
-                width, height = sizes[i]
-                scale_x, scale_y = 350 / width, 350 / height
-            if answer_sizes[i] is not None:
-                answer_width, answer_height = answer_sizes[i]
-                answer_scale_x, answer_scale_y = 350 / answer_width, 350 / answer_height
-            if img_path is not None:
-                worksheet.insert_image(i + 1, img_col_index, img_path, {"x_scale": scale_x, "y_scale": scale_y})
-            if answer_img_path is not None:
-                worksheet.insert_image(
-                    i + 1, answer_img_col_index, answer_img_path, {"x_scale": answer_scale_x, "y_scale": answer_scale_y}
+    return PuzzleRow(puzzle_name=puzzle_name, values=tuple(row[column] for column in COLUMNS))
+
+
+_worker_args: t.Dict[str, t.Any] = {}
+
+
+def _init_worker(storage: str, data_dir: str, backend: ParserBackend, subtree_only: bool, trace: bool = False) -> None:
+    _worker_args.update(stores=open_stores(storage, data_dir), backend=backend, subtree_only=subtree_only)
+    if trace:
+        TRACER.enable()
+        TRACER.drain()  # Forked workers start with the spans of the parent.
+
+
+def _build_chunk(puzzle_names: t.List[str]) -> t.Tuple[t.List[PuzzleRow], t.Tuple]:
+    """
+    Returns the rows of a chunk, with the spans and counters recorded while building them.
+    """
+    rows = [build_row(puzzle_name, **_worker_args) for puzzle_name in puzzle_names]
+    return rows, TRACER.drain() if TRACER.enabled else ([], {})
+
+
+def build_rows(
+    puzzle_names: t.List[str],
+    storage: t.Literal["files", "pack"] = "files",
+    data_dir: str = f"{ROOT_DIR}/layton-data",
+    backend: ParserBackend = "html.parser",
+    subtree_only: bool = False,
+    workers: int = 1,
+    chunksize: int = 32,
+) -> t.Iterator[PuzzleRow]:
+    """
+    Yields the row of every puzzle, in the order of `puzzle_names`. With several workers, chunks of puzzles are
+    extracted by a process pool, each worker opening its own stores, and the rows are merged back in order so that
+    the output does not depend on the number of workers.
+    """
+    if workers <= 1:
+        stores = open_stores(storage, data_dir)
+        try:
+            for puzzle_name in puzzle_names:
+                yield build_row(puzzle_name, stores, backend, subtree_only)
+        finally:
+            for store in stores.values():
+                store.close()
+        return
+    for store in open_stores(storage, data_dir).values():
+        store.ensure_index()
+        store.close()
+    chunks = [puzzle_names[i : i + chunksize] for i in range(0, len(puzzle_names), chunksize)]
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(storage, data_dir, backend, subtree_only, TRACER.enabled)
+    ) as pool:
+        for rows, trace in pool.map(_build_chunk, chunks):
+            TRACER.merge(*trace)
+            yield from rows
+
+
+def main(args: argparse.Namespace) -> None:
+    with traced_run(args.trace):
+        stores = open_stores(args.storage)
+        puzzle_names = sorted(stores["htmls"].names())
+        rows = build_rows(
+            puzzle_names,
+            storage=args.storage,
+            backend=args.parser,
+            subtree_only=args.subtree_only,
+            workers=args.workers,
+            chunksize=args.chunksize,
+        )
+        image_meta = ImageMetaIndex()
+        if not args.no_excel and not args.no_thumbnails:
+            for kind in ("images", "answer_images"):
+                image_meta.make_thumbnails(kind, puzzle_names, args.storage, workers=args.workers)
+        with ExitStack() as stack:
+            dataset = stack.enter_context(DatasetWriter(DATASET_PATH, row_group_size=args.row_group_size))
+            workbook = None
+            if not args.no_excel:
+                workbook = stack.enter_context(
+                    WorkbookWriter(f"{ROOT_DIR}/layton-annotations.xlsx", stores, image_meta, not args.no_thumbnails)
                 )
-            worksheet.set_row_pixels(i + 1, 350)
-            worksheet.write_url(i + 1, 4, url)
-        worksheet.set_column_pixels(img_col_index, img_col_index, 350)
-        worksheet.set_column_pixels(answer_img_col_index, answer_img_col_index, 350)
-        worksheet.set_column_pixels(2, 2, 1100)
-        worksheet.set_column_pixels(6, 9, 900)
-        worksheet.set_column_pixels(4, 4, 400)
-        worksheet.set_column_pixels(1, 1, 150)
-        worksheet.set_column_pixels(10, 10, 1000)
-        df.to_excel(writer, index=False, header=True, engine="xlsxwriter")
+            for row in tqdm(rows, total=len(puzzle_names)):
+                record = {"puzzle_name": row.puzzle_name, **dict(zip(COLUMNS, row.values))}
+                dataset.write(record)
+                if workbook is not None:
+                    workbook.write(record)
+        image_meta.save()
+
+
+if __name__ == "__main__":
+    cli.main(["build", *sys.argv[1:]])
@@ -0,0 +1,317 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import typing as t
+import zlib
+
+from tqdm import tqdm
+
+from layton_eval import cli
+from layton_eval.constants import ROOT_DIR
+
+KIND2SUFFIX = {"htmls": ".html", "images": ".jpg", "answer_images": ".jpg"}
+# JPEGs are already compressed, deflating them again only costs time.
+KIND2COMPRESS = {"htmls": True, "images": False, "answer_images": False}
+
+RECORD_HEADER = struct.Struct("<4sBHI")  # magic, compressed, name length, payload length
+RECORD_MAGIC = b"LPK1"
+INDEX_HEADER = struct.Struct("<4sQQ")  # magic, number of slots, pack size covered by the index
+INDEX_MAGIC = b"LIX1"
+INDEX_SLOT = struct.Struct("<QQ")  # name hash (0 for an empty slot), record offset
+
+
+class FileStore:
+    """
+    Stores one file per puzzle in a directory, the historical layton-data layout.
+    """
+
+    def __init__(self, directory: str, suffix: str) -> None:
+        self.directory = directory
+        self.suffix = suffix
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return f"{self.directory}/{name}{self.suffix}"
+
+    def locate(self, name: str) -> str | None:
+        return self.path(name) if name in self else None
+
+    def names(self) -> t.List[str]:
+        return [file_name.removesuffix(self.suffix) for file_name in os.listdir(self.directory)]
+
+    def get(self, name: str) -> bytes | None:
+        if name not in self:
+            return None
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def read_head(self, name: str, size: int) -> bytes:
+        with open(self.path(name), "rb") as f:
+            return f.read(size)
+
+    def signature(self, name: str) -> str:
+        """
+        Changes whenever the content of the file changes.
+        """
+        stat = os.stat(self.path(name))
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def put(self, name: str, data: bytes) -> None:
+        with open(self.path(name), "wb") as f:
+            f.write(data)
+
+    def __contains__(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def ensure_index(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def hash_name(name: str) -> int:
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "little") or 1
+
+
+class PackStore:
+    """
+    Stores every puzzle of a kind in a single append-only pack file. Each record holds the puzzle name and its
+    (optionally deflated) content, records written later supersede earlier records with the same name.
+    A sidecar `.idx` file holds an open-addressing hash table from name hashes to record offsets, both files are
+    memory-mapped so that a lookup by puzzle name costs a couple of probes and a single record read.
+    """
+
+    def __init__(self, path: str, compress: bool = True) -> None:
+        self.path = path
+        self.compress = compress
+        self._offsets: t.Dict[str, int] | None = None
+        self._pack: mmap.mmap | None = None
+        self._index: mmap.mmap | None = None
+        self._writer: t.BinaryIO | None = None
+        self._dirty = False
+        self._valid_size = 0
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self._open_maps()
+
+    @property
+    def index_path(self) -> str:
+        return f"{self.path}.idx"
+
+    def _open_maps(self) -> None:
+        self._close_maps()
+        if os.path.getsize(self.path):
+            with open(self.path, "rb") as f:
+                self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if os.path.exists(self.index_path) and os.path.getsize(self.index_path) >= INDEX_HEADER.size:
+            with open(self.index_path, "rb") as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, _, covered = INDEX_HEADER.unpack_from(index)
+            if magic == INDEX_MAGIC and covered == len(self._pack or b""):
+                self._index = index
+            else:  # Stale index, e.g. the writer crashed before closing the pack.
+                index.close()
+
+    def _close_maps(self) -> None:
+        for m in (self._pack, self._index):
+            if m is not None:
+                m.close()
+        self._pack, self._index = None, None
+
+    def _read_name(self, offset: int) -> t.Tuple[str, int]:
+        """
+        Returns the name of the record at `offset` and the offset of the next record, without reading its content.
+        """
+        if offset + RECORD_HEADER.size > len(self._pack):
+            raise ValueError(f"Truncated pack {self.path} at offset {offset}")
+        magic, _, name_length, payload_length = RECORD_HEADER.unpack_from(self._pack, offset)
+        start = offset + RECORD_HEADER.size
+        if magic != RECORD_MAGIC or start + name_length + payload_length > len(self._pack):
+            raise ValueError(f"Truncated pack {self.path} at offset {offset}")
+        return self._pack[start : start + name_length].decode(), start + name_length + payload_length
+
+    def _payload(self, offset: int) -> t.Tuple[bool, memoryview]:
+        _, compressed, name_length, payload_length = RECORD_HEADER.unpack_from(self._pack, offset)
+        start = offset + RECORD_HEADER.size + name_length
+        return bool(compressed), memoryview(self._pack)[start : start + payload_length]
+
+    def _scan(self) -> t.Dict[str, int]:
+        """
+        Reads every record of the pack, a record left incomplete by a crash ends the scan.
+        """
+        offsets, offset = {}, 0
+        while self._pack is not None and offset < len(self._pack):
+            try:
+                name, next_offset = self._read_name(offset)
+            except ValueError:
+                break
+            offsets[name] = offset
+            offset = next_offset
+        self._valid_size = offset
+        return offsets
+
+    @property
+    def offsets(self) -> t.Dict[str, int]:
+        """
+        Offsets of the latest record of every name, only built when names are listed or the pack is written to.
+        """
+        if self._offsets is None:
+            self._offsets = self._scan()
+        return self._offsets
+
+    def _lookup(self, name: str) -> int | None:
+        if self._index is None:  # Readers do not write the index, processes sharing the pack would race.
+            return self.offsets.get(name)
+        _, n_slots, _ = INDEX_HEADER.unpack_from(self._index)
+        key = hash_name(name)
+        slot = key & (n_slots - 1)
+        while True:
+            slot_key, offset = INDEX_SLOT.unpack_from(self._index, INDEX_HEADER.size + slot * INDEX_SLOT.size)
+            if slot_key == 0:
+                return None
+            if slot_key == key and self._read_name(offset)[0] == name:
+                return offset
+            slot = (slot + 1) & (n_slots - 1)
+
+    def _write_index(self) -> None:
+        offsets = self.offsets
+        n_slots = 1 << max(4, (2 * len(offsets)).bit_length())
+        table = bytearray(INDEX_HEADER.size + n_slots * INDEX_SLOT.size)
+        INDEX_HEADER.pack_into(table, 0, INDEX_MAGIC, n_slots, os.path.getsize(self.path))
+        for name, offset in offsets.items():
+            key = hash_name(name)
+            slot = key & (n_slots - 1)
+            while INDEX_SLOT.unpack_from(table, INDEX_HEADER.size + slot * INDEX_SLOT.size)[0] != 0:
+                slot = (slot + 1) & (n_slots - 1)
+            INDEX_SLOT.pack_into(table, INDEX_HEADER.size + slot * INDEX_SLOT.size, key, offset)
+        temporary_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(table)
+        os.replace(temporary_path, self.index_path)
+
+    def ensure_index(self) -> None:
+        """
+        Rewrites a missing or stale index, e.g. left by a writer which crashed, before processes share the pack.
+        """
+        if self._dirty:
+            self.flush()
+        elif self._index is None and self._pack is not None:
+            self._write_index()
+            self._open_maps()
+
+    def locate(self, name: str) -> str | None:
+        return f"{self.path}#{name}" if name in self else None
+
+    def names(self) -> t.List[str]:
+        return list(self.offsets)
+
+    def get(self, name: str) -> bytes | None:
+        if self._dirty:
+            self.flush()
+        if (offset := self._lookup(name)) is None:
+            return None
+        compressed, payload = self._payload(offset)
+        data = zlib.decompress(payload) if compressed else bytes(payload)
+        payload.release()
+        return data
+
+    def read_head(self, name: str, size: int) -> bytes:
+        """
+        Returns the first `size` bytes of a record, only inflating what is needed.
+        """
+        if self._dirty:
+            self.flush()
+        compressed, payload = self._payload(self._lookup(name))
+        head = zlib.decompressobj().decompress(payload, size) if compressed else bytes(payload[:size])
+        payload.release()
+        return head
+
+    def signature(self, name: str) -> str:
+        """
+        Checksum of the stored record, changes whenever the record is rewritten with a different content.
+        """
+        if self._dirty:
+            self.flush()
+        _, payload = self._payload(self._lookup(name))
+        signature = f"{zlib.crc32(payload):08x}:{len(payload)}"
+        payload.release()
+        return signature
+
+    def put(self, name: str, data: bytes) -> None:
+        if self._writer is None:
+            self._offsets = self._scan()
+            self._close_maps()
+            self._writer = open(self.path, "r+b")
+            self._writer.truncate(self._valid_size)
+            self._writer.seek(self._valid_size)
+        encoded_name = name.encode()
+        payload = zlib.compress(data) if self.compress else data
+        self.offsets[name] = self._writer.tell()
+        self._writer.write(RECORD_HEADER.pack(RECORD_MAGIC, self.compress, len(encoded_name), len(payload)))
+        self._writer.write(encoded_name)
+        self._writer.write(payload)
+        self._writer.flush()
+        self._dirty = True
+
+    def __contains__(self, name: str) -> bool:
+        if self._dirty:
+            return name in self.offsets
+        return self._lookup(name) is not None
+
+    def flush(self) -> None:
+        """
+        Makes the appended records visible to readers and rewrites the index.
+        """
+        if self._writer is not None:
+            self._writer.flush()
+        if self._dirty:
+            self._write_index()
+            self._dirty = False
+            self._open_maps()
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._close_maps()
+
+
+Store = FileStore | PackStore
+
+
+def open_store(
+    kind: t.Literal["htmls", "images", "answer_images"],
+    backend: t.Literal["files", "pack"] = "files",
+    data_dir: str = f"{ROOT_DIR}/layton-data",
+) -> Store:
+    """
+    Returns the store holding the given kind of puzzle data.
+    """
+    if backend == "pack":
+        os.makedirs(data_dir, exist_ok=True)
+        return PackStore(f"{data_dir}/{kind}.pack", compress=KIND2COMPRESS[kind])
+    return FileStore(f"{data_dir}/{kind}", KIND2SUFFIX[kind])
+
+
+def open_stores(backend: t.Literal["files", "pack"] = "files", data_dir: str = f"{ROOT_DIR}/layton-data"):
+    return {kind: open_store(kind, backend, data_dir) for kind in KIND2SUFFIX}
+
+
+def main(args: argparse.Namespace) -> None:
+    for kind in KIND2SUFFIX:
+        source, destination = open_store(kind, args.source, args.data_dir), open_store(
+            kind, args.destination, args.data_dir
+        )
+        for name in tqdm(source.names(), desc=kind):
+            destination.put(name, source.get(name))
+        source.close()
+        destination.close()
+
+
+if __name__ == "__main__":
+    cli.main(["convert", *sys.argv[1:]])
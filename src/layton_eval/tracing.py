@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import typing as t
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Span:
+    """
+    Times the block it wraps. `set` adds attributes known only once the block ran, such as a status or a size.
+    """
+
+    __slots__ = ("tracer", "name", "attrs", "start", "duration", "pid", "tid")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: t.Dict[str, t.Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.duration = 0.0
+        self.pid = 0
+        self.tid = 0
+
+    def __enter__(self) -> "Span":
+        self.pid = os.getpid()
+        self.tid = self.tracer.lane()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self)
+
+    def set(self, **attrs: t.Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: float = 0.0) -> t.Dict[str, t.Any]:
+        return {
+            "name": self.name,
+            "start": self.start - origin,
+            "duration": self.duration,
+            "pid": self.pid,
+            "tid": self.tid,
+            "attrs": self.attrs,
+        }
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        pass
+
+    def set(self, **attrs: t.Any) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """
+    Collects timing spans and counters of a run. Disabled by default, in which case `span` returns a shared no-op
+    span and `count` returns right away, so that instrumented code only pays for a function call.
+    By convention, the outermost span of a puzzle in every stage carries a `puzzle` attribute, which the summary
+    adds up per puzzle. Coroutines running concurrently in a thread get their own lane in the Chrome trace.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.origin = time.perf_counter()  # perf_counter is system-wide, spans of worker processes line up.
+        self.spans: t.List[Span] = []
+        self.counters: t.Dict[str, float] = defaultdict(float)
+        self.samples: t.List[t.Tuple[float, str, float]] = []  # Counter values over time, for the Chrome trace.
+        self._lanes: t.Dict[t.Tuple[int, int], int] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self.origin = time.perf_counter()
+
+    def span(self, name: str, **attrs: t.Any) -> Span | NullSpan:
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    def count(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += value
+            self.samples.append((time.perf_counter(), name, self.counters[name]))
+
+    def lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:  # No running event loop.
+            task = None
+        key = (threading.get_ident(), id(task) if task is not None else 0)
+        with self._lock:
+            return self._lanes.setdefault(key, len(self._lanes))
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def drain(self) -> t.Tuple[t.List[t.Dict[str, t.Any]], t.Dict[str, float]]:
+        """
+        Returns and forgets the spans and counters collected so far, for a worker process to send them back.
+        """
+        with self._lock:
+            spans, counters = [span.to_dict() for span in self.spans], dict(self.counters)
+            self.spans, self.samples = [], []
+            self.counters.clear()
+        return spans, counters
+
+    def merge(self, spans: t.List[t.Dict[str, t.Any]], counters: t.Dict[str, float]) -> None:
+        """
+        Adds the spans and counters drained from a worker process.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for record in spans:
+                span = Span(self, record["name"], record["attrs"])
+                span.start, span.duration, span.pid = record["start"], record["duration"], record["pid"]
+                span.tid = self._lanes.setdefault((record["pid"], record["tid"]), len(self._lanes))
+                self.spans.append(span)
+            for name, value in counters.items():
+                self.counters[name] += value
+
+    def write_jsonl(self, path: str) -> None:
+        """
+        One line per span, in completion order, then one line per counter with its total.
+        """
+        with open(path, "w") as f:
+            for span in self.spans:
+                f.write(json.dumps(span.to_dict(self.origin), default=str) + "\n")
+            for name, value in self.counters.items():
+                f.write(json.dumps({"counter": name, "value": value}) + "\n")
+
+    def write_chrome_trace(self, path: str) -> None:
+        """
+        Writes the Trace Event Format read by chrome://tracing and https://ui.perfetto.dev.
+        """
+        events = [
+            {
+                "name": span.name,
+                "cat": span.name.split(".")[0],
+                "ph": "X",
+                "ts": (span.start - self.origin) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": span.pid,
+                "tid": span.tid,
+                "args": span.attrs,
+            }
+            for span in self.spans
+        ]
+        events.extend(
+            {"name": name, "ph": "C", "ts": (at - self.origin) * 1e6, "pid": os.getpid(), "args": {name: value}}
+            for at, name, value in self.samples
+        )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def write(self, path: str) -> None:
+        """
+        Writes a Chrome trace to a .json path, and JSON lines otherwise.
+        """
+        if path.endswith(".json"):
+            self.write_chrome_trace(path)
+        else:
+            self.write_jsonl(path)
+
+    def summary(self, top: int = 10) -> str:
+        """
+        The stages taking the most time in total, nested spans being counted in their parents as well, the puzzles
+        taking the most time across stages, and the counters.
+        """
+        stages: t.Dict[str, t.List[float]] = defaultdict(list)
+        puzzles: t.Dict[str, float] = defaultdict(float)
+        for span in self.spans:
+            stages[span.name].append(span.duration)
+            if (puzzle := span.attrs.get("puzzle")) is not None:
+                puzzles[puzzle] += span.duration
+        lines = [f"{'slowest stages':<32}{'count':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}"]
+        for name, durations in sorted(stages.items(), key=lambda item: -sum(item[1]))[:top]:
+            total = sum(durations)
+            lines.append(
+                f"{name:<32}{len(durations):>8}{total:>10.2f}{1e3 * total / len(durations):>10.1f}"
+                f"{1e3 * max(durations):>10.1f}"
+            )
+        if puzzles:
+            lines.append(f"{'slowest puzzles':<48}{'seconds':>10}")
+            for puzzle, seconds in sorted(puzzles.items(), key=lambda item: -item[1])[:top]:
+                lines.append(f"{puzzle[:47]:<48}{seconds:>10.3f}")
+        for name, value in self.counters.items():
+            lines.append(f"{name}: {value:g}")
+        return "\n".join(lines)
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **attrs: t.Any) -> Span | NullSpan:
+    return TRACER.span(name, **attrs) if TRACER.enabled else NULL_SPAN
+
+
+def count(name: str, value: float = 1) -> None:
+    if TRACER.enabled:
+        TRACER.count(name, value)
+
+
+@contextmanager
+def traced_run(path: str | None) -> t.Iterator[None]:
+    """
+    Records the spans of the wrapped block when `path` is given, then writes them there and prints their summary.
+    """
+    if not path:
+        yield
+        return
+    TRACER.enable()
+    yield
+    TRACER.write(path)
+    print(TRACER.summary())
@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The fixture corpus and the fake servers of the benchmarks are shared with the tests.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from fixtures import make_corpus  # noqa: E402
+from layton_eval.storage import KIND2SUFFIX, open_store  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def data_dir(tmp_path_factory):
+    """
+    A small fixture corpus, in both the files and the pack storage layouts.
+    """
+    data_dir = make_corpus(str(tmp_path_factory.mktemp("layton-data")), puzzles=40)
+    for kind in KIND2SUFFIX:
+        source, destination = open_store(kind, "files", data_dir), open_store(kind, "pack", data_dir)
+        for name in source.names():
+            destination.put(name, source.get(name))
+        destination.close()
+    return data_dir
+
+
+@pytest.fixture
+def llm_server(monkeypatch):
+    """
+    A fake OpenAI and Together endpoint, see `benchmarks/llm_server.py`.
+    """
+    from llm_server import serve_llm
+
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("TOGETHER_API_KEY", "fake")
+    server = serve_llm()
+    yield server
+    server.shutdown()
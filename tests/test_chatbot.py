@@ -0,0 +1,181 @@
+import asyncio
+import json
+import random
+import re
+import time
+import typing as t
+
+import pytest
+from layton_eval import chatbot as chatbot_module
+from layton_eval.chatbot import Chatbot, MinuteBudget
+from layton_eval.providers import ProviderPool
+from layton_eval.response_cache import ResponseCache
+
+RIDDLE = re.compile(r"Professor Layton Riddle: Riddle (\d+)")
+
+
+def make_chatbot(llm_server, **kwargs) -> Chatbot:
+    chatbot = Chatbot(pool=ProviderPool(), task="input_structuration", base_url=f"{llm_server.base_url}/v1", **kwargs)
+    chatbot.verbose = False
+    return chatbot
+
+
+@pytest.fixture
+def echo_server(llm_server):
+    """
+    Answers with the number of the riddle, later riddles first, and without JSON to riddle 13.
+    """
+
+    def output(prompt: str) -> str:
+        number = int(RIDDLE.search(prompt).group(1))
+        time.sleep(0.002 * (20 - number))
+        return "I cannot answer." if number == 13 else json.dumps({"riddle": number})
+
+    llm_server.output = output
+    return llm_server
+
+
+def test_results_are_in_input_order(echo_server):
+    chatbot = make_chatbot(echo_server)
+    completed = []
+    results = chatbot.ask_batch(
+        [f"Riddle {i}" for i in range(20)], max_concurrency=20, on_result=lambda index, _: completed.append(index)
+    )
+    assert [result.output for result in results if result.error is None] == [
+        {"riddle": i} for i in range(20) if i != 13
+    ]
+    assert results[13].error is not None
+    assert sorted(completed) == list(range(20))
+
+
+def test_failed_items_do_not_abort_the_batch(echo_server):
+    results = make_chatbot(echo_server).ask_batch([f"Riddle {i}" for i in (12, 13, 14)])
+    assert results[0].output == {"riddle": 12} and results[0].error is None
+    assert results[1].output is None and results[1].error is not None
+    assert results[2].output == {"riddle": 14} and results[2].error is None
+
+
+def test_requests_in_flight_are_bounded(llm_server):
+    llm_server.latency = 0.02
+    results = make_chatbot(llm_server).ask_batch([f"Riddle {i}" for i in range(24)], max_concurrency=3)
+    assert all(result.error is None for result in results)
+    assert llm_server.requests == 24
+    assert llm_server.max_in_flight == 3
+
+
+def test_batches_can_be_asked_again(echo_server):
+    chatbot = make_chatbot(echo_server)
+    for batch in range(3):
+        riddles = [f"Riddle {i}" for i in range(batch * 4, batch * 4 + 4)]
+        assert [result.output for result in chatbot.ask_batch(riddles)] == [
+            {"riddle": i} for i in range(batch * 4, batch * 4 + 4)
+        ]
+    assert chatbot.ask("Riddle 19") == {"riddle": 19}
+    assert chatbot.usage.requests == 13
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(chatbot_module, "time", clock)
+    monkeypatch.setattr(
+        chatbot_module, "asyncio", type("FakeAsyncio", (), {"Lock": asyncio.Lock, "sleep": clock.sleep})
+    )
+    return clock
+
+
+def test_budget_delays_requests_past_the_requests_per_minute(clock):
+    async def send(budget: MinuteBudget) -> t.List[float]:
+        sent = []
+        for _ in range(5):
+            await budget.acquire(10)
+            sent.append(clock.now)
+            clock.now += 1
+        return sent
+
+    assert asyncio.run(send(MinuteBudget(requests_per_minute=2))) == [1000, 1001, 1060, 1061, 1120]
+
+
+def test_budget_delays_requests_past_the_tokens_per_minute(clock):
+    async def send(budget: MinuteBudget) -> t.List[float]:
+        sent = []
+        for tokens in (60, 30, 20, 500, 1):
+            await budget.acquire(tokens)
+            sent.append(clock.now)
+            clock.now += 10
+        return sent
+
+    # 20 tokens once the first 60 are out, 500 alone once the minute is empty, and nothing else with them.
+    assert asyncio.run(send(MinuteBudget(tokens_per_minute=100))) == [1000, 1010, 1060, 1120, 1180]
+
+
+RIDDLE_OUTPUT = {"llm": True, "vlm": False, "output": "text"}
+
+
+def test_split_packed_maps_items_back_by_number(llm_server):
+    chatbot = make_chatbot(llm_server)
+    items = [
+        {"index": 3, **RIDDLE_OUTPUT, "output": "action"},
+        {"index": "1", **RIDDLE_OUTPUT},
+        {"index": 1, **RIDDLE_OUTPUT, "output": "action"},  # Only the first item of a riddle is kept.
+        {"index": 2, "llm": True},  # Malformed.
+        {"index": 4, **RIDDLE_OUTPUT},  # Out of the pack.
+        {"index": "two", **RIDDLE_OUTPUT},
+        {**RIDDLE_OUTPUT},
+        "text",
+    ]
+    assert chatbot.split_packed({"riddles": items}, 3) == {1: RIDDLE_OUTPUT, 3: {**RIDDLE_OUTPUT, "output": "action"}}
+    assert chatbot.split_packed({"riddles": "none"}, 3) == {}
+    assert chatbot.split_packed(None, 3) == {}
+
+
+def test_dropped_riddles_are_asked_individually(llm_server):
+    random.seed(0)
+    llm_server.drop_rate = 0.3
+    chatbot = make_chatbot(llm_server)
+    results = chatbot.ask_packed([f"Riddle {i}" for i in range(32)], pack_size=8)
+    assert [result.output for result in results] == [RIDDLE_OUTPUT] * 32
+    assert chatbot.usage.riddles == 32
+    assert 4 < llm_server.requests < 4 + 32
+
+
+@pytest.mark.parametrize("packed_output", [None, "I cannot answer.", '{"riddles": [{"index": 1, "llm": "maybe"}]}'])
+def test_malformed_packs_are_asked_individually(llm_server, packed_output):
+    output = llm_server.output
+
+    def malformed(prompt: str) -> str:
+        if packed_output is None:  # Every riddle but the second one.
+            return output(prompt).replace('"index": 2, "llm": true', '"index": 2, "llm": "maybe"')
+        return packed_output if "Professor Layton Riddle 1:" in prompt else output(prompt)
+
+    llm_server.output = malformed
+    chatbot = make_chatbot(llm_server)
+    results = chatbot.ask_packed([f"Riddle {i}" for i in range(3)], pack_size=3)
+    assert [result.output for result in results] == [RIDDLE_OUTPUT] * 3
+    assert llm_server.requests == (2 if packed_output is None else 4)
+
+
+def test_packed_outputs_are_cached_apart(llm_server, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    chatbot = make_chatbot(llm_server, cache=cache)
+    inputs = chatbot.inputs("Riddle 1")
+    assert chatbot.cache_key(inputs, chatbot.backends[0], packed=True) != chatbot.cache_key(inputs, chatbot.backends[0])
+    chatbot.ask_packed([f"Riddle {i}" for i in range(4)], pack_size=4)
+    assert llm_server.requests == 1
+    chatbot = make_chatbot(llm_server, cache=cache)
+    assert [result.output for result in chatbot.ask_packed([f"Riddle {i}" for i in range(4)])] == [RIDDLE_OUTPUT] * 4
+    assert llm_server.requests == 1
+    chatbot.ask("Riddle 1")  # Single-riddle requests do not reuse packed outputs.
+    assert llm_server.requests == 2
+    cache.close()
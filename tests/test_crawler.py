@@ -0,0 +1,132 @@
+import typing as t
+from email.utils import formatdate
+
+import pytest
+import requests
+from layton_eval import crawler
+from layton_eval.crawler import Crawler, HostRateLimiter, get_retry_after
+
+URL = "https://example.org/wiki/Puzzle:One"
+
+
+class FakeTime:
+    """
+    A clock that only moves when slept on, recording the sleeps.
+    """
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class StubSession:
+    """
+    Answers the requests with the given responses, or raises the given errors, in order.
+    """
+
+    def __init__(self, *outcomes: int | t.Tuple[int, t.Dict[str, str]] | Exception) -> None:
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def get(self, url: str, headers=None, timeout=None) -> requests.Response:
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        status, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+        response = requests.Response()
+        response.status_code, response.url, response._content = status, url, b"<p></p>"
+        response.headers.update(headers)
+        return response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(crawler, "time", clock)
+    return clock
+
+
+def make_crawler(*outcomes, max_retries: int = 4) -> Crawler:
+    stubbed = Crawler(max_workers=1, requests_per_second=0, max_retries=max_retries, backoff_factor=0.5)
+    stubbed.session = StubSession(*outcomes)
+    return stubbed
+
+
+@pytest.mark.parametrize("status", sorted(crawler.RETRY_STATUSES))
+def test_retries_with_exponential_backoff(clock, status):
+    stubbed = make_crawler(status, status, status, 200)
+    assert stubbed.fetch(URL).status_code == 200
+    assert stubbed.session.calls == 4
+    assert clock.sleeps == [0.5, 1.0, 2.0]
+
+
+def test_other_statuses_are_not_retried(clock):
+    stubbed = make_crawler(404)
+    assert stubbed.fetch(URL).status_code == 404
+    assert clock.sleeps == []
+
+
+def test_connection_errors_are_retried(clock):
+    stubbed = make_crawler(requests.ConnectionError("reset"), 200)
+    assert stubbed.fetch(URL).status_code == 200
+    assert clock.sleeps == [0.5]
+
+
+def test_retry_after_is_honoured(clock):
+    stubbed = make_crawler((429, {"Retry-After": "7"}), (503, {"Retry-After": formatdate(clock.now + 37)}), 200)
+    assert stubbed.fetch(URL).status_code == 200
+    assert clock.sleeps == [7.0, pytest.approx(30.0, abs=1)]
+
+
+def test_429_pushes_back_the_other_requests_to_the_host(clock, monkeypatch):
+    stubbed = make_crawler((429, {"Retry-After": "7"}), 503, 200)
+    back_offs = []
+    monkeypatch.setattr(stubbed.rate_limiter, "back_off", lambda host, delay: back_offs.append((host, delay)))
+    assert stubbed.fetch(URL).status_code == 200
+    assert back_offs == [("example.org", 7.0)]
+
+
+def test_gives_up_after_the_last_attempt(clock):
+    stubbed = make_crawler(503, 503, 503, max_retries=2)
+    assert stubbed.fetch(URL).status_code == 503
+    assert stubbed.session.calls == 3
+    assert clock.sleeps == [0.5, 1.0]
+    error = requests.ConnectionError("refused")
+    stubbed = make_crawler(503, error, error, max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        stubbed.fetch(URL)
+
+
+def test_unreadable_retry_after_is_ignored():
+    response = requests.Response()
+    assert get_retry_after(response) is None
+    response.headers["Retry-After"] = "soon"
+    assert get_retry_after(response) is None
+    assert get_retry_after(None) is None
+
+
+def test_rate_limiter_spaces_out_requests_per_host(clock):
+    limiter = HostRateLimiter(requests_per_second=2)
+    for _ in range(3):
+        limiter.wait("example.org")
+    limiter.wait("example.com")
+    assert clock.sleeps == [0.5, 0.5]
+    clock.now += 10  # Idle time does not build up a burst.
+    limiter.wait("example.org")
+    limiter.wait("example.org")
+    assert clock.sleeps == [0.5, 0.5, 0.5]
+    limiter.back_off("example.org", 3)
+    limiter.wait("example.org")
+    assert clock.sleeps[-1] == 3
+    assert HostRateLimiter(requests_per_second=0).interval == 0
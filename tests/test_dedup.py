@@ -0,0 +1,81 @@
+import random
+from io import BytesIO
+
+from layton_eval.dedup import NearDuplicateIndex, shingles
+from layton_eval.images import difference_hash
+from PIL import Image
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+
+def riddle(seed: int, length: int = 60) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + rng.choice(WORDS) for _ in range(length))
+
+
+def test_shingles():
+    assert shingles("The red, red BOX!") == {"the red red", "red red box"}
+    assert shingles("Two words") == {"two words"}
+    assert shingles("...") == set()
+
+
+def test_variants_join_the_first_version():
+    original = riddle(0)
+    words = original.split()
+    words[10] = "respelled"
+    index = NearDuplicateIndex()
+    assert index.add("Original", original) == "Original"
+    assert index.add("Other", riddle(1)) == "Other"
+    assert index.add("Regional", " ".join(words).upper() + "!") == "Original"
+    assert index.add("Remake", original + ".") == "Original"
+    assert index.clusters() == {"Original": ["Original", "Regional", "Remake"]}
+    assert index.duplicates() == {"Regional": "Original", "Remake": "Original"}
+    assert 0.8 <= index.similarity["Regional"] < 1.0
+    assert len(index) == 4
+
+
+def test_different_numbers_are_never_clustered():
+    text = "How many squares are there in a grid of {} by {} squares, counting the squares of every size?"
+    index = NearDuplicateIndex()
+    index.add("Three", text.format(3, 3))
+    assert index.add("Four", text.format(4, 4)) == "Four"
+    assert index.add("Three again", text.format(3, 3)) == "Three"
+
+
+def test_dissimilar_texts_are_not_clustered():
+    index = NearDuplicateIndex()
+    for seed in range(50):
+        index.add(f"Puzzle{seed}", riddle(seed))
+    assert index.duplicates() == {}
+    assert index.add("Empty", "") == "Empty"
+
+
+def test_images_must_match():
+    text = riddle(2)
+    index = NearDuplicateIndex(max_image_distance=4)
+    index.add("Original", text, image_hash=0b1111)
+    assert index.add("Close", text, image_hash=0b0111) == "Original"
+    assert index.add("Different", text, image_hash=0b1111 << 20) == "Different"
+    assert index.add("Unknown", text) == "Original"
+
+
+def test_difference_hash_of_rescaled_copies():
+    image = Image.linear_gradient("L").rotate(30).convert("RGB")
+    original, rescaled, flipped = BytesIO(), BytesIO(), BytesIO()
+    image.save(original, format="JPEG")
+    image.resize((128, 128)).save(rescaled, format="JPEG", quality=60)
+    image.transpose(Image.FLIP_LEFT_RIGHT).save(flipped, format="JPEG")
+    first = difference_hash(original.getvalue())
+    assert (first ^ difference_hash(rescaled.getvalue())).bit_count() <= 10
+    assert (first ^ difference_hash(flipped.getvalue())).bit_count() > 10
+
+
+def test_every_representative_of_a_bucket_is_a_candidate():
+    text = riddle(3)
+    words = text.split()
+    words[20] = "respelled"
+    index = NearDuplicateIndex(max_image_distance=4)
+    assert index.add("Original", text, image_hash=0) == "Original"
+    assert index.add("Recoloured", text.upper(), image_hash=0xFF << 20) == "Recoloured"  # Shares every band.
+    assert index.add("Regional", " ".join(words), image_hash=0x7F << 20) == "Recoloured"
+    assert index.add("Remake", text + ".", image_hash=0b0001) == "Original"
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+from layton_eval.evaluate import AnswerIndex, accuracy_tables, normalize_answer, score_responses
+
+
+@pytest.mark.parametrize(
+    "text, normalized",
+    [
+        ("Forty-two!", "42"),
+        (" 42 ", "42"),
+        ("forty two", "42"),
+        ("Two hundred and forty five", "245"),
+        ("1,000 coins", "1000 coins"),
+        ("three thousand", "3000"),
+        ("3.5 meters.", "3.5 meters"),
+        ("50%", "50 percent"),
+        ("ＡＢＣ", "abc"),
+        ("The   Red_Box", "the red box"),
+        ("one and a half", "1 and a half"),
+    ],
+)
+def test_normalize_answer(text, normalized):
+    assert normalize_answer(text) == normalized
+
+
+@pytest.fixture
+def index():
+    return AnswerIndex({"Sum": ["42", "forty-two"], "Box": ["The red box"], "Unanswered": [None, ""]})
+
+
+def test_answer_index(index):
+    assert "Sum" in index
+    assert "Unanswered" not in index
+    assert index.is_correct("Sum", "Forty two.")
+    assert not index.is_correct("Sum", "It is 42")
+    assert index.is_correct("Sum", "It is 42", match="contains")
+    assert not index.is_correct("Sum", "It is 420", match="contains")
+    assert not index.is_correct("Sum", None)
+
+
+@pytest.mark.parametrize("match", ["exact", "contains"])
+def test_score_responses_agrees_with_is_correct(index, match):
+    responses = pd.DataFrame(
+        {
+            "puzzle_name": ["Sum", "Sum", "Sum", "Box", "Box", "Unanswered", "Unknown"],
+            "model": ["a", "b", "c", "a", "b", "a", "a"],
+            "answer": ["42", "It is forty two", None, "the RED box!", "a box", "anything", "42"],
+        }
+    )
+    scored = score_responses(index, responses, match=match)
+    assert scored["scored"].tolist() == [True, True, True, True, True, False, False]
+    assert scored["correct"].tolist() == [
+        index.is_correct(puzzle_name, answer, match)
+        for puzzle_name, answer in zip(responses["puzzle_name"], responses["answer"])
+    ]
+    assert scored["correct"].tolist()[:2] == [True, match == "contains"]
+
+
+def test_accuracy_tables(index):
+    responses = pd.DataFrame(
+        {"puzzle_name": ["Sum", "Box", "Sum", "Box"], "model": ["a", "a", "b", "b"], "answer": ["42", "?", "?", "?"]}
+    )
+    dataset = pd.DataFrame({"puzzle_name": ["Sum", "Box"], "category": ["Math", None], "picarats": [25, None]})
+    tables = accuracy_tables(score_responses(index, responses), dataset)
+    assert tables["model"].loc["a", "accuracy"] == 0.5
+    assert tables["model"].loc["b", "correct"] == 0
+    assert tables["category"].loc["Math", "a"] == 1.0
+    assert set(tables["picarats"].index) == {"20-29", "unknown"}
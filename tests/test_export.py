@@ -0,0 +1,28 @@
+import os
+import zipfile
+
+import pytest
+from layton_eval.dataset import COLUMNS
+from layton_eval.export import WorkbookWriter
+from layton_eval.images import ImageMetaIndex
+from layton_eval.scrape_htmls import build_rows
+from layton_eval.storage import open_store, open_stores
+
+
+@pytest.mark.parametrize("storage", ["files", "pack"])
+def test_store_images_are_inserted_from_files(data_dir, storage, tmp_path):
+    names = sorted(open_store("htmls", storage, data_dir).names())
+    stores = open_stores(storage, data_dir)
+    path = str(tmp_path / "annotations.xlsx")
+    writer = WorkbookWriter(path, stores, ImageMetaIndex(data_dir), thumbnails=False)
+    for row in build_rows(names, storage, data_dir):
+        writer.write({"puzzle_name": row.puzzle_name, **dict(zip(COLUMNS, row.values))})
+    spilled = os.listdir(writer.spill_dir.name)
+    writer.close()
+    images = len(stores["images"].names()) + len(stores["answer_images"].names())
+    for store in stores.values():
+        store.close()
+    assert len(spilled) == (images if storage == "pack" else 0)
+    assert not os.path.exists(writer.spill_dir.name)
+    with zipfile.ZipFile(path) as workbook:
+        assert sum(name.startswith("xl/media/") for name in workbook.namelist()) == images
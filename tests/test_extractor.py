@@ -0,0 +1,54 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+from layton_eval.constants import PARSER_BACKENDS
+from layton_eval.extractor import PuzzleIndex, extract_puzzle
+from layton_eval.parsing import parse_puzzle
+
+PAGE = (Path(__file__).parent / "data" / "puzzle.html").read_bytes()
+# What the per-field extractors, walking the soup from its root with CSS selectors and find_next, returned.
+EXPECTED = {
+    "puzzle_id": "042",
+    "category": "Matchstick",
+    "picarats": 30,
+    "description": "Move one match to fix the equation.Which one should you move?\nTouch the match to move it.",
+    "solution": "Move the vertical match of the plus sign. The answer is 7.",
+    "hints": {
+        "1": "Look at the plus sign.It is made of two matches.",
+        "2": "A minus sign needs one match.",
+        "3": "Hint Three\nTurn the plus into a minus.",
+        "Special": "",
+    },
+}
+
+
+def test_single_walk_extracts_every_field():
+    record = extract_puzzle(BeautifulSoup(PAGE, "html.parser"))
+    assert {field: getattr(record, field) for field in EXPECTED} == EXPECTED
+
+
+def test_index_matches_css_selectors():
+    soup = BeautifulSoup(PAGE, "html.parser")
+    index = PuzzleIndex(soup)
+    assert index.category() == soup.select_one("[data-source='type'] a").attrs["title"].split(":").pop()
+    assert index.puzzle_id() == soup.select_one("[data-source='number'] .pi-data-value.pi-font").contents[0]
+    assert index.picarats() == int(soup.select_one("[data-source='picarats'] .pi-data-value.pi-font").contents[0])
+
+
+def test_page_without_puzzle_section():
+    soup = BeautifulSoup(b"<html><body><p>Not a puzzle.</p></body></html>", "html.parser")
+    record = extract_puzzle(soup)
+    assert record.description is None
+    assert record.solution is None
+    assert record.puzzle_id is None
+
+
+@pytest.mark.parametrize("backend", PARSER_BACKENDS)
+@pytest.mark.parametrize("subtree_only", [False, True])
+def test_backends_agree(backend, subtree_only):
+    if backend != "html.parser" and importlib.util.find_spec(backend) is None:
+        pytest.skip(f"{backend} is not installed")
+    record = parse_puzzle(PAGE, backend, subtree_only=subtree_only)
+    assert {field: getattr(record, field) for field in EXPECTED} == EXPECTED
@@ -0,0 +1,42 @@
+from io import BytesIO
+
+import pytest
+from layton_eval.images import read_image_size, read_jpeg_size
+from layton_eval.storage import PackStore
+from PIL import Image
+
+
+def encode(size, **save_kwargs) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(buffer, format="JPEG", **save_kwargs)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("size", [(350, 350), (256, 192), (1, 4000)])
+@pytest.mark.parametrize("save_kwargs", [{}, {"progressive": True}, {"dpi": (96, 96)}])
+def test_read_jpeg_size(size, save_kwargs):
+    assert read_jpeg_size(encode(size, **save_kwargs)) == size
+
+
+def test_read_jpeg_size_with_large_metadata():
+    data = encode((64, 48), exif=b"Exif\x00\x00" + b"\x00" * 20000)
+    assert read_jpeg_size(data) == (64, 48)
+    assert read_jpeg_size(data[:1024]) is None  # The frame header is past the bytes read.
+
+
+def test_read_jpeg_size_of_other_formats():
+    buffer = BytesIO()
+    Image.new("RGB", (10, 20)).save(buffer, format="PNG")
+    assert read_jpeg_size(buffer.getvalue()) is None
+    assert read_jpeg_size(b"") is None
+
+
+def test_read_image_size_falls_back_on_pil(tmp_path):
+    store = PackStore(str(tmp_path / "images.pack"), compress=False)
+    buffer = BytesIO()
+    Image.new("RGB", (10, 20)).save(buffer, format="PNG")
+    store.put("png", buffer.getvalue())
+    store.put("jpeg", encode((30, 40)))
+    assert read_image_size(store, "png") == (10, 20)
+    assert read_image_size(store, "jpeg") == (30, 40)
+    store.close()
@@ -0,0 +1,138 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from layton_eval.crawler import Crawler
+from layton_eval.get_eng_html import get_urls_to_crawl
+from layton_eval.manifest import CrawlManifest, ManifestEntry, read_json_lines
+from layton_eval.storage import FileStore
+
+PAGES = {"/wiki/Puzzle:One": b"<p>one</p>", "/wiki/Puzzle:Two": b"<p>two</p>"}
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self) -> None:
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        if (content := PAGES.get(self.path)) is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            content = b""
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    PageHandler.requests = []
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def entry(name: str, fetched_at: float = 1.0, **kwargs) -> ManifestEntry:
+    return ManifestEntry(
+        url=f"https://example.org/wiki/Puzzle:{name}", name=name, sha256="0", fetched_at=fetched_at, **kwargs
+    )
+
+
+def test_entries_are_reloaded(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = CrawlManifest(path)
+    manifest.start_run()
+    manifest.record(entry("One", etag='"a"'))
+    manifest.record(entry("One", etag='"b"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT"))
+    manifest.finish_run()
+    manifest = CrawlManifest(path)
+    assert manifest.entries["One"].etag == '"b"'
+    assert manifest.conditional_headers("One") == {
+        "If-None-Match": '"b"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert manifest.conditional_headers("Two") == {}
+    assert manifest.interrupted_run_started_at() is None
+    assert len(read_json_lines(path)) == 2  # Compacted to the last run and the latest entry.
+
+
+def test_partial_last_line_is_truncated(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = CrawlManifest(path)
+    manifest.record(entry("One"))
+    with open(path, "a") as f:
+        f.write('{"kind": "page", "url": "htt')
+    manifest = CrawlManifest(path)
+    manifest.record(entry("Two"))
+    assert set(CrawlManifest(path).entries) == {"One", "Two"}
+
+
+def test_interrupted_run_resumes_after_the_fetched_pages(tmp_path):
+    html_store = FileStore(str(tmp_path / "htmls"), ".html")
+    for name in ("One", "Two", "Three"):
+        html_store.put(name, b"<p></p>")
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = CrawlManifest(path)
+    manifest.record(entry("One", fetched_at=0.0))
+    started_at = manifest.start_run()
+    manifest.record(entry("Two", fetched_at=started_at + 1))
+    manifest = CrawlManifest(path)  # The run crashed before finish_run.
+    assert manifest.interrupted_run_started_at() == started_at
+    urls = [f"https://example.org/wiki/Puzzle:{name}" for name in ("One", "Two", "Three")]
+    assert get_urls_to_crawl(urls, manifest, html_store) == [urls[0], urls[2]]
+
+
+def test_pages_removed_locally_are_downloaded_again(tmp_path):
+    html_store = FileStore(str(tmp_path / "htmls"), ".html")
+    manifest = CrawlManifest(str(tmp_path / "manifest.jsonl"))
+    manifest.record(entry("One", etag='"a"'))
+    urls = ["https://example.org/wiki/Puzzle:One"]
+    assert get_urls_to_crawl(urls, manifest, html_store) == urls
+    assert manifest.conditional_headers("One") == {}
+
+
+def test_unchanged_pages_are_requested_conditionally(tmp_path, base_url):
+    manifest = CrawlManifest(str(tmp_path / "manifest.jsonl"))
+    crawler = Crawler(max_workers=2, requests_per_second=0, base_url=base_url)
+    urls = [f"{base_url}{path}" for path in PAGES]
+    pages = list(crawler.crawl(urls, lambda content: (None, None), manifest))
+    assert [page.status for page in pages] == [200, 200]
+    assert all(page.changed for page in pages)
+    for page in pages:
+        manifest.record(ManifestEntry(url=page.url, name=page.name, sha256=page.sha256, fetched_at=1.0, etag=page.etag))
+
+    pages = list(crawler.crawl(urls, lambda content: (None, None), manifest))
+    assert [page.status for page in pages] == [304, 304]
+    assert not any(page.changed for page in pages)
+    assert all(if_none_match is not None for _, if_none_match in PageHandler.requests[2:])
+
+
+def test_pages_with_the_same_content_are_unchanged(tmp_path, base_url):
+    manifest = CrawlManifest(str(tmp_path / "manifest.jsonl"))
+    sha256 = hashlib.sha256(PAGES["/wiki/Puzzle:One"]).hexdigest()
+    manifest.record(ManifestEntry(url=f"{base_url}/wiki/Puzzle:One", name="One", sha256=sha256, fetched_at=1.0))
+    crawler = Crawler(max_workers=1, requests_per_second=0, base_url=base_url)
+    (page,) = crawler.crawl([f"{base_url}/wiki/Puzzle:One"], lambda content: (None, None), manifest)
+    assert page.status == 200
+    assert not page.changed
+
+
+def test_failed_image_downloads_are_told_apart_from_missing_images(base_url):
+    crawler = Crawler(max_workers=1, requests_per_second=0, max_retries=0, base_url=base_url)
+    (page,) = crawler.crawl([f"{base_url}/wiki/Puzzle:One"], lambda content: ("/images/One.jpg", None))
+    assert page.img is None
+    assert page.failed_images == ("img",)
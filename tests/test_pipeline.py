@@ -0,0 +1,82 @@
+import json
+
+import pyarrow.parquet as pq
+import pytest
+from layton_eval.chatbot import Chatbot
+from layton_eval.dataset import DatasetWriter
+from layton_eval.pipeline import TASK_COLUMNS, Checkpoint, run_pipeline, to_dataframe
+from layton_eval.providers import ProviderPool
+
+DESCRIPTIONS = {"A": "Riddle A", "B": "Riddle B", "C": None, "D": "Riddle D", "E": "Riddle E"}
+
+
+@pytest.fixture
+def dataset_path(tmp_path):
+    path = str(tmp_path / "dataset.parquet")
+    with DatasetWriter(path, row_group_size=2) as writer:
+        for puzzle_name, description in DESCRIPTIONS.items():
+            writer.write({"puzzle_name": puzzle_name, "description": description, "solution": "42"})
+    return path
+
+
+def make_chatbot(llm_server, task: str = "input_structuration") -> Chatbot:
+    chatbot = Chatbot(pool=ProviderPool(), task=task, base_url=f"{llm_server.base_url}/v1")
+    chatbot.verbose = False
+    return chatbot
+
+
+@pytest.mark.parametrize("pack_size", [1, 2])
+def test_second_run_only_sends_the_missing_rows(llm_server, dataset_path, tmp_path, pack_size):
+    output, failing = llm_server.output, {"Riddle B"}
+    llm_server.output = lambda prompt: "I cannot answer." if any(r in prompt for r in failing) else output(prompt)
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = Checkpoint(path)
+    stats = run_pipeline(make_chatbot(llm_server), checkpoint, dataset_path, batch_size=2, pack_size=pack_size)
+    checkpoint.close()
+    assert sorted(checkpoint.outputs) == ["A", "D", "E"]
+    assert (stats.done, stats.skipped, stats.errors) == (0, 1, 1)
+
+    failing.clear()
+    requests = llm_server.requests
+    checkpoint = Checkpoint(path)
+    assert sorted(checkpoint.outputs) == ["A", "D", "E"]
+    stats = run_pipeline(make_chatbot(llm_server), checkpoint, dataset_path, batch_size=2, pack_size=pack_size)
+    checkpoint.close()
+    assert sorted(checkpoint.outputs) == ["A", "B", "D", "E"]
+    assert (stats.done, stats.skipped, stats.errors) == (3, 1, 0)
+    assert llm_server.requests == requests + 1
+    assert len(Checkpoint(path).outputs) == 4
+
+
+def test_partial_last_line_is_discarded(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = Checkpoint(path)
+    checkpoint.append("A", {"llm": True})
+    checkpoint.append("B", {"llm": False}, duplicate_of="A")
+    checkpoint.close()
+    with open(path, "a") as f:
+        f.write('{"puzzle_name": "C", "out')  # Interrupted while writing.
+    checkpoint = Checkpoint(path)
+    assert checkpoint.outputs == {"A": {"llm": True}, "B": {"llm": False}}
+    assert checkpoint.duplicate_of == {"B": "A"}
+    checkpoint.append("C", {"llm": True})
+    checkpoint.close()
+    with open(path) as f:
+        assert [json.loads(line)["puzzle_name"] for line in f] == ["A", "B", "C"]
+
+
+@pytest.mark.parametrize("task", list(TASK_COLUMNS))
+def test_parquet_output_has_the_task_columns(llm_server, dataset_path, tmp_path, task):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    run_pipeline(make_chatbot(llm_server, task), checkpoint, dataset_path, duplicates={"E": "D"})
+    checkpoint.append("Z", "not a dict")
+    checkpoint.close()
+    to_dataframe(task, checkpoint).to_parquet(str(tmp_path / "structured.parquet"), index=False)
+    table = pq.read_table(str(tmp_path / "structured.parquet"))
+    assert table.column_names == ["puzzle_name", *TASK_COLUMNS[task], "duplicate_of"]
+    rows = {row["puzzle_name"]: row for row in table.to_pylist()}
+    assert sorted(rows) == ["A", "B", "D", "E", "Z"]
+    assert rows["E"]["duplicate_of"] == "D"
+    assert {column: rows["Z"][column] for column in TASK_COLUMNS[task]} == {
+        column: default for column, (_, default) in TASK_COLUMNS[task].items()
+    }
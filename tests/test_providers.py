@@ -0,0 +1,135 @@
+import typing as t
+
+import pytest
+from layton_eval import providers
+from layton_eval.chatbot import Chatbot
+from layton_eval.providers import DEFAULT_POOL, Backend, ProviderPool
+from layton_eval.response_cache import MISSING, ResponseCache
+
+FAST, SLOW = Backend("openai", None, "fast"), Backend("together", "mistralai", "slow")
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(providers, "time", clock)
+    return clock
+
+
+def request(pool: ProviderPool, clock: FakeClock, backend: Backend, seconds: float, error: bool = False) -> None:
+    started = pool.start(backend)
+    clock.now += seconds
+    pool.finish(backend, started, RuntimeError("overloaded") if error else None)
+
+
+def make_chatbot(pool: ProviderPool, *fallbacks: Backend, **kwargs) -> Chatbot:
+    chatbot = Chatbot(pool=pool, fallbacks=fallbacks, task="input_structuration", **kwargs)
+    chatbot.verbose = False
+    return chatbot
+
+
+def backends(llm_server) -> t.Tuple[Backend, Backend]:
+    """
+    A backend of the fake endpoint, and one answering its requests with a 404.
+    """
+    working = Backend("openai", None, "gpt-3.5-turbo", f"{llm_server.base_url}/v1")
+    return working, Backend("together", "mistralai", "broken", f"{llm_server.base_url}/missing")
+
+
+def model_kwargs(backend: Backend) -> t.Dict[str, str | None]:
+    return {
+        "provider": backend.provider,
+        "owner": backend.owner,
+        "string": backend.string,
+        "base_url": backend.base_url,
+    }
+
+
+def test_parse_backend():
+    assert Backend.parse("together:mistralai/Mixtral-8x7B-Instruct-v0.1") == Backend(
+        "together", "mistralai", "Mixtral-8x7B-Instruct-v0.1"
+    )
+    backend = Backend.parse("openai:gpt-3.5-turbo@http://127.0.0.1:8001/v1")
+    assert backend == Backend("openai", None, "gpt-3.5-turbo", "http://127.0.0.1:8001/v1")
+    assert Backend.parse(backend.name) == backend
+    for spec in ("gpt-3.5-turbo", "anthropic:claude", "openai:"):
+        with pytest.raises(ValueError):
+            Backend.parse(spec)
+
+
+def test_unused_backends_are_tried_first(clock):
+    pool = ProviderPool()
+    request(pool, clock, FAST, 0.1)
+    assert pool.choose([FAST, SLOW]) == SLOW
+    assert pool.choose([FAST, SLOW], exclude=[SLOW]) == FAST
+    assert pool.choose([FAST, SLOW], exclude=[FAST, SLOW]) is None
+
+
+def test_routing_prefers_the_faster_backend(clock):
+    pool = ProviderPool()
+    request(pool, clock, FAST, 0.5)
+    request(pool, clock, SLOW, 2.0)
+    assert pool.choose([SLOW, FAST]) == FAST
+    for _ in range(3):
+        pool.start(FAST)  # Requests in flight scale the expected latency.
+    assert pool.choose([SLOW, FAST]) == SLOW
+
+
+def test_error_penalty_decays(clock):
+    pool = ProviderPool(error_penalty=10.0, error_half_life=30.0)
+    request(pool, clock, FAST, 0.5)
+    request(pool, clock, SLOW, 2.0)
+    request(pool, clock, FAST, 0.5, error=True)
+    assert pool.score(FAST) == pytest.approx(0.5 + 10.0)
+    assert pool.choose([FAST, SLOW]) == SLOW
+    clock.now += 30
+    assert pool.score(FAST) == pytest.approx(0.5 + 5.0)
+    clock.now += 90
+    assert pool.choose([FAST, SLOW]) == FAST
+    assert pool.stats[FAST].errors == 1
+    assert pool.stats[FAST].mean_latency == pytest.approx(0.5)
+
+
+def test_clients_are_shared_by_backend(llm_server):
+    pool = ProviderPool()
+    base_url = f"{llm_server.base_url}/v1"
+    chatbot = make_chatbot(pool, base_url=base_url)
+    other = Chatbot(pool=pool, task="answer_structuration", base_url=base_url)
+    assert other.llm is chatbot.llm
+    assert make_chatbot(pool, string="gpt-4", base_url=base_url).llm is not chatbot.llm
+    assert make_chatbot(ProviderPool(), base_url=base_url).llm is not chatbot.llm
+    assert Chatbot(task="input_structuration").pool is DEFAULT_POOL
+
+
+def test_failover_to_the_next_backend(llm_server):
+    pool = ProviderPool()
+    working, broken = backends(llm_server)
+    chatbot = make_chatbot(pool, working, **model_kwargs(broken))
+    assert chatbot.ask("How many squares?") == {"llm": True, "vlm": False, "output": "text"}
+    assert (pool.stats[broken].errors, pool.stats[working].errors) == (1, 0)
+    assert chatbot.ask("How many triangles?") is not None
+    assert pool.stats[broken].requests == 1  # Its errors keep it out of the way.
+    with pytest.raises(ValueError):
+        make_chatbot(pool, **model_kwargs(broken)).ask("How many circles?")
+
+
+def test_cache_lookups_cover_every_backend(llm_server, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    working, broken = backends(llm_server)
+    make_chatbot(ProviderPool(), working, cache=cache, **model_kwargs(broken)).ask("How many squares?")
+    requests = llm_server.requests
+    other = Backend("openai", None, "gpt-4", broken.base_url)
+    chatbot = make_chatbot(ProviderPool(), working, cache=cache, **model_kwargs(other))
+    assert chatbot.ask("How many squares?") == {"llm": True, "vlm": False, "output": "text"}
+    assert llm_server.requests == requests
+    chatbot = make_chatbot(ProviderPool(), cache=cache, **model_kwargs(other))
+    assert chatbot.cached(chatbot.inputs("How many squares?")) is MISSING
+    cache.close()
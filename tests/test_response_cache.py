@@ -0,0 +1,128 @@
+import pytest
+from layton_eval import response_cache
+from layton_eval.chatbot import Chatbot, LaytonAnswer
+from layton_eval.providers import ProviderPool
+from layton_eval.response_cache import MISSING, ResponseCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def make_chatbot(llm_server, cache, cache_mode="use", **kwargs) -> Chatbot:
+    chatbot = Chatbot(
+        cache=cache,
+        cache_mode=cache_mode,
+        pool=ProviderPool(),
+        task="input_structuration",
+        base_url=f"{llm_server.base_url}/v1",
+        **kwargs,
+    )
+    chatbot.verbose = False
+    return chatbot
+
+
+def test_round_trip(cache):
+    cache.put("a", {"llm": True})
+    cache.put("none", None)
+    assert cache.get("a") == {"llm": True}
+    assert cache.get("none") is None
+    assert cache.get("b") is MISSING
+    assert cache.get_first(["b", "a"]) == {"llm": True}
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.writes) == (3, 1, 2)
+    assert cache.stats.hit_rate == 0.75
+
+
+def test_old_entries_are_dropped(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_age=10)
+    cache.put("old", 1)
+    clock.now += 5
+    cache.put("recent", 2)
+    clock.now += 5
+    assert cache.get("old") is MISSING  # Expired, even before being evicted.
+    assert cache.get("recent") == 2
+    cache.put("new", 3)
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+    cache.close()
+
+
+def test_least_recently_used_entries_are_dropped(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("b", 3)  # Replacing an entry does not add one.
+    assert cache.stats.evictions == 0
+    cache.get("a")
+    cache.put("c", 4)
+    assert [cache.get(key) for key in "abc"] == [1, MISSING, 4]
+    cache.close()
+    other = ResponseCache(path)
+    other.put("d", 5)  # Written by another process.
+    other.close()
+    cache = ResponseCache(path, max_entries=2)
+    assert cache.evict() == 1
+    assert len(cache) == 2
+    cache.close()
+
+
+def test_cached_outputs_are_reused(llm_server, cache):
+    chatbot = make_chatbot(llm_server, cache)
+    output = chatbot.ask("How many squares?")
+    assert chatbot.ask("How many squares?") == output
+    assert llm_server.requests == 1
+    assert chatbot.usage.riddles == 1
+
+
+def test_refresh_overwrites_the_cache(llm_server, cache, clock):
+    make_chatbot(llm_server, cache).ask("How many squares?")
+    created_at = cache._connection.execute("SELECT created_at FROM responses").fetchone()[0]
+    make_chatbot(llm_server, cache, cache_mode="refresh").ask("How many squares?")
+    assert llm_server.requests == 2
+    assert cache.stats.writes == 2
+    assert len(cache) == 1
+    assert cache._connection.execute("SELECT created_at FROM responses").fetchone()[0] > created_at
+
+
+def test_bypass_never_touches_the_cache(llm_server, cache):
+    make_chatbot(llm_server, cache).ask("How many squares?")
+    chatbot = make_chatbot(llm_server, cache, cache_mode="bypass")
+    chatbot.ask("How many squares?")
+    chatbot.ask("How many triangles?")
+    assert llm_server.requests == 3
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.writes) == (0, 1, 1)
+    assert len(cache) == 1
+
+
+def test_prompt_and_schema_changes_miss(llm_server, cache):
+    make_chatbot(llm_server, cache).ask("How many squares?")
+    chatbot = make_chatbot(llm_server, cache)
+    chatbot.template.template += "\n"
+    chatbot.ask("How many squares?")
+    chatbot = make_chatbot(llm_server, cache)
+    chatbot.parser.pydantic_object = LaytonAnswer
+    assert chatbot.cached(chatbot.inputs("How many squares?")) is MISSING
+    chatbot = make_chatbot(llm_server, cache, string="gpt-4")
+    assert chatbot.cached(chatbot.inputs("How many squares?")) is MISSING
+    assert llm_server.requests == 2
+    assert make_chatbot(llm_server, cache).cached({"riddle": "How many squares?"}) is not MISSING
@@ -0,0 +1,13 @@
+import pytest
+from layton_eval.scrape_htmls import build_rows
+from layton_eval.storage import open_store
+
+
+@pytest.mark.parametrize("storage", ["files", "pack"])
+def test_parallel_rows_match_serial_rows(data_dir, storage):
+    names = sorted(open_store("htmls", storage, data_dir).names())
+    serial = list(build_rows(names, storage, data_dir))
+    parallel = list(build_rows(names, storage, data_dir, workers=2, chunksize=8))
+    assert [row.puzzle_name for row in parallel] == names
+    assert parallel == serial
+    assert all(value is None or type(value) in (str, int) for row in parallel for value in row.values)
@@ -0,0 +1,108 @@
+import os
+import zlib
+
+import pytest
+from layton_eval import storage
+from layton_eval.storage import INDEX_HEADER, PackStore
+
+
+@pytest.fixture
+def pack_path(tmp_path):
+    path = str(tmp_path / "htmls.pack")
+    store = PackStore(path)
+    for i in range(10):
+        store.put(f"Puzzle_{i}", f"<html>{i}</html>".encode() * 50)
+    store.close()
+    return path
+
+
+def test_round_trip(pack_path):
+    store = PackStore(pack_path)
+    assert sorted(store.names()) == sorted(f"Puzzle_{i}" for i in range(10))
+    assert store.get("Puzzle_3") == b"<html>3</html>" * 50
+    assert store.read_head("Puzzle_3", 6) == b"<html>"
+    assert "Puzzle_9" in store
+    assert "Puzzle_10" not in store
+    assert store.get("Puzzle_10") is None
+    store.close()
+
+
+def test_uncompressed_round_trip(tmp_path):
+    store = PackStore(str(tmp_path / "images.pack"), compress=False)
+    store.put("Puzzle", b"\xff\xd8jpeg")
+    store.close()
+    store = PackStore(str(tmp_path / "images.pack"), compress=False)
+    assert store.get("Puzzle") == b"\xff\xd8jpeg"
+    assert store.read_head("Puzzle", 2) == b"\xff\xd8"
+    store.close()
+
+
+def test_later_records_supersede_earlier_ones(pack_path):
+    store = PackStore(pack_path)
+    signature = store.signature("Puzzle_1")
+    store.put("Puzzle_1", b"new")
+    assert store.get("Puzzle_1") == b"new"
+    assert store.signature("Puzzle_1") != signature
+    store.close()
+    store = PackStore(pack_path)
+    assert store.get("Puzzle_1") == b"new"
+    assert len(store.names()) == 10
+    store.close()
+
+
+def test_truncated_record_is_dropped(pack_path):
+    size = os.path.getsize(pack_path)
+    store = PackStore(pack_path)
+    store.put("Puzzle_10", b"lost in a crash" * 10)
+    store.close()
+    with open(pack_path, "r+b") as f:
+        f.truncate(os.path.getsize(pack_path) - 5)
+    store = PackStore(pack_path)
+    assert "Puzzle_10" not in store.names()
+    assert store.get("Puzzle_2") == b"<html>2</html>" * 50
+    store.put("Puzzle_11", b"after the crash")
+    store.close()
+    store = PackStore(pack_path)
+    assert store.get("Puzzle_11") == b"after the crash"
+    assert os.path.getsize(pack_path) > size
+    store.close()
+
+
+def test_stale_index_is_ignored_and_rebuilt(pack_path):
+    with open(pack_path, "ab") as f:  # Records appended by a writer which crashed before rewriting the index.
+        f.write(b"garbage")
+    store = PackStore(pack_path)
+    assert store.get("Puzzle_4") == b"<html>4</html>" * 50
+    store.ensure_index()
+    store.close()
+    with open(f"{pack_path}.idx", "rb") as f:
+        _, _, covered = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+    assert covered == os.path.getsize(pack_path)
+
+
+def test_empty_index_is_ignored(pack_path):
+    open(f"{pack_path}.idx", "wb").close()
+    store = PackStore(pack_path)
+    assert store.get("Puzzle_5") == b"<html>5</html>" * 50
+    store.close()
+
+
+def test_readers_do_not_write_the_index(pack_path):
+    os.remove(f"{pack_path}.idx")
+    store = PackStore(pack_path)
+    assert "Puzzle_6" in store
+    store.close()
+    assert not os.path.exists(f"{pack_path}.idx")
+
+
+def test_names_and_lookups_do_not_inflate(pack_path, monkeypatch):
+    calls, decompress = [], zlib.decompress
+    monkeypatch.setattr(storage.zlib, "decompress", lambda data: calls.append(1) or decompress(data))
+    os.remove(f"{pack_path}.idx")
+    store = PackStore(pack_path)
+    store.names()
+    assert "Puzzle_7" in store
+    assert calls == []
+    store.get("Puzzle_7")
+    assert calls == [1]
+    store.close()